@@ -1,17 +1,28 @@
 import warnings
+import numpy as np
 
 from pybullet_planning import INF
-from pychoreo.cartesian_planner.ladder_graph import LadderGraph
+from pychoreo.cartesian_planner.ladder_graph import LadderGraph, connect_rungs, EDGE_COST_CHUNK_SIZE
 
 class SolutionRung(object):
-    def __init__(self):
-        self.distance = []
-        self.predecessor = []
+    def __init__(self, n_verts=0):
+        # forward pass: cost-to-come and predecessor vert id in the previous rung
+        self.distance = np.zeros(n_verts)
+        self.predecessor = np.zeros(n_verts, dtype=int)
+        # backward pass: cost-to-go and successor vert id in the next rung
+        self.cost_to_go = np.zeros(n_verts)
+        self.successor = np.zeros(n_verts, dtype=int)
+        # verts removed from the search, e.g. found in collision
+        self.removed = np.zeros(n_verts, dtype=bool)
+
+    def mask_removed(self, costs):
+        """set the costs of the removed verts to INF (in place)"""
+        costs[self.removed] = INF
+        return costs
 
     def extract_min(self):
-        min_dist = min(self.distance)
-        min_id = self.distance.index(min_dist)
-        return min_dist, min_id
+        min_id = int(np.argmin(self.distance))
+        return self.distance[min_id], min_id
 
     def __len__(self):
         assert(len(self.distance) == len(self.predecessor))
@@ -20,76 +31,480 @@ class SolutionRung(object):
     # def __repr__(self):
     #     return 'min dist: {0}, min pred id: {1}'.format(self.extract_min())
 
+def min_plus_relax(dist, edges, st_jts=None, end_jts=None, rows=None):
+    """Forward relaxation of all the edges between two rungs, in the (min, +) algebra:
+    next_dist[j] = min_i (dist[i] + cost[i, j]), with the argmin i as the predecessor of j.
+    Ties are broken by the smallest start vertex id.
+
+    Parameters
+    ----------
+    dist : (n_start,) array
+        cost-to-come of the start rung
+    edges : edge cost store between the two rungs
+    st_jts : (n_start, dof) array, optional
+        joint data of the start rung, needed if the edge costs are computed on the fly
+    end_jts : (n_end, dof) array, optional
+        joint data of the end rung
+    rows : (n_rows,) int array, optional
+        ascending ids of the start verts to expand, by default all of them
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        cost-to-come and predecessor ids of the end rung
+    """
+    next_dist = np.full(edges.n_end, INF)
+    pred = np.zeros(edges.n_end, dtype=int)
+    for row_ids, col_st, block in edges.iter_blocks(st_jts, end_jts, rows=rows):
+        cand = dist[row_ids, None] + block
+        arg = np.argmin(cand, axis=0)
+        best = cand[arg, np.arange(block.shape[1])]
+        col_end = col_st + block.shape[1]
+        improved = best < next_dist[col_st:col_end]
+        next_dist[col_st:col_end][improved] = best[improved]
+        pred[col_st:col_end][improved] = row_ids[arg[improved]]
+    return next_dist, pred
+
+def min_plus_relax_backward(next_cost_to_go, edges, st_jts=None, end_jts=None):
+    """Backward relaxation of all the edges between two rungs, in the (min, +) algebra:
+    cost_to_go[i] = min_j (cost[i, j] + next_cost_to_go[j]), with the argmin j as the successor of i.
+
+    Parameters
+    ----------
+    next_cost_to_go : (n_end,) array
+        cost-to-go of the end rung
+    edges : edge cost store between the two rungs
+    st_jts : (n_start, dof) array, optional
+        joint data of the start rung, needed if the edge costs are computed on the fly
+    end_jts : (n_end, dof) array, optional
+        joint data of the end rung
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        cost-to-go and successor ids of the start rung
+    """
+    cost_to_go = np.full(edges.n_start, INF)
+    succ = np.zeros(edges.n_start, dtype=int)
+    for row_ids, col_st, block in edges.iter_blocks(st_jts, end_jts):
+        cand = block + next_cost_to_go[None, col_st:col_st+block.shape[1]]
+        arg = np.argmin(cand, axis=1)
+        best = cand[np.arange(len(row_ids)), arg]
+        improved = best < cost_to_go[row_ids]
+        cost_to_go[row_ids[improved]] = best[improved]
+        succ[row_ids[improved]] = col_st + arg[improved]
+    return cost_to_go, succ
+
+def beam_select(dist, beam_width=None, beam_margin=None):
+    """Select the verts of a rung kept in the beam: the `beam_width` smallest cost-to-come
+    and/or the ones within `beam_margin` of the rung minimum. Verts with an INF cost-to-come are dropped.
+
+    Returns
+    -------
+    ndarray
+        ascending ids of the kept verts
+    """
+    keep = np.isfinite(dist)
+    if beam_margin is not None and np.any(keep):
+        keep &= dist <= np.min(dist[keep]) + beam_margin
+    ids = np.nonzero(keep)[0]
+    if beam_width is not None and len(ids) > beam_width:
+        ids = np.sort(ids[np.argsort(dist[ids], kind='stable')[:beam_width]])
+    return ids
+
+def k_min_plus_relax(k_dist, edges, st_jts=None, end_jts=None, k_hash=None):
+    """Forward relaxation keeping the k best partial paths of each vertex.
+
+    Parameters
+    ----------
+    k_dist : (n_start, k) array
+        the k smallest cost-to-come of each start vertex, sorted in ascending order (INF if missing)
+    edges : edge cost store between the two rungs
+    st_jts : (n_start, dof) array, optional
+        joint data of the start rung, needed if the edge costs are computed on the fly
+    end_jts : (n_end, dof) array, optional
+        joint data of the end rung
+    k_hash : (n_start, k) uint64 array, optional
+        hash of the joint values along each partial path, only the cheapest of the partial paths
+        with the same hash is kept for each end vertex, by default None (no deduplication)
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        (n_end, k) sorted cost-to-come, and (n_end, k) predecessors encoded as `v_id * k + rank`
+    """
+    k = k_dist.shape[1]
+    next_k_dist = np.full((k, edges.n_end), INF)
+    next_k_pred = np.zeros((k, edges.n_end), dtype=int)
+    for block_row_ids, col_st, block in edges.iter_blocks(st_jts, end_jts):
+        n_cols = block.shape[1]
+        cols = slice(col_st, col_st + n_cols)
+        # chunk the start verts to bound the memory used by the candidates
+        chunk_size = max(1, EDGE_COST_CHUNK_SIZE // max(1, k * n_cols))
+        for c_id in range(0, len(block_row_ids), chunk_size):
+            row_ids = block_row_ids[c_id:c_id + chunk_size]
+            # candidates: (existing k best) + (n_rows * k new paths) for each end vertex
+            cand = (k_dist[row_ids, :, None] + block[c_id:c_id + chunk_size, None, :]).reshape(-1, n_cols)
+            cand_pred = (row_ids[:, None] * k + np.arange(k)[None, :]).reshape(-1)
+            all_dist = np.vstack((next_k_dist[:, cols], cand))
+            all_pred = np.vstack((next_k_pred[:, cols], np.repeat(cand_pred[:, None], n_cols, axis=1)))
+            if k_hash is not None:
+                # the partial paths with the same joint values as a cheaper one are dropped
+                all_hash = k_hash.reshape(-1)[all_pred]
+                order = np.lexsort((all_dist, all_hash), axis=0)
+                sorted_hash = np.take_along_axis(all_hash, order, axis=0)
+                is_dup = np.zeros(sorted_hash.shape, dtype=bool)
+                is_dup[1:] = sorted_hash[1:] == sorted_hash[:-1]
+                np.put_along_axis(all_dist, order, np.where(is_dup, INF, np.take_along_axis(all_dist, order, axis=0)), axis=0)
+            order = np.argsort(all_dist, axis=0, kind='stable')[:k]
+            next_k_dist[:, cols] = np.take_along_axis(all_dist, order, axis=0)
+            next_k_pred[:, cols] = np.take_along_axis(all_pred, order, axis=0)
+    return next_k_dist.T, next_k_pred.T
+
+def _joint_value_classes(jts):
+    # the same id for the verts with the same joint values
+    if len(jts) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    _, classes = np.unique(np.asarray(jts), axis=0, return_inverse=True)
+    return classes.reshape(-1).astype(np.uint64)
+
+def _extend_path_hash(path_hash, classes):
+    # FNV-style mixing of the joint value class of the next vert into the partial path hash
+    with np.errstate(over='ignore'):
+        return (path_hash * np.uint64(0x100000001b3)) ^ (classes + np.uint64(1))
+
+def path_joint_distance(path_a, path_b):
+    """mean L1 joint distance between two joint paths with the same number of configurations"""
+    return float(np.mean(np.sum(np.abs(np.asarray(path_a) - np.asarray(path_b)), axis=1)))
+
 class DAGSearch(object):
+    """Shortest path search on a ladder graph, the rungs are relaxed one after another.
+
+    The edges of the graph are only read through their cost blocks, so a graph built with
+    lazy edges (`LazyEdgeCostMatrix`) is searched without ever storing its edges:
+    the costs are computed from the rungs' joint data, block by block, during the forward pass.
+
+    Both the forward cost-to-come and the backward cost-to-go of each rung are kept, so that after
+    a range of rungs is replaced (`replace_rungs`), only the changed span is re-solved and the new
+    optimum is spliced at the first rung after it.
+    """
     def __init__(self, graph):
         assert(isinstance(graph, LadderGraph))
         if graph.size == 0:
             raise ValueError('input ladder graph is empty!')
         self.graph = graph
-        self.solution = [SolutionRung() for i in range(graph.get_rungs_size())]
 
         # allocate everything we need
-        for i in range(graph.get_rungs_size()):
-            n_verts = graph.get_rung_vert_size(i)
-            assert(n_verts > 0)
-            self.solution[i].distance = [0] * n_verts
-            self.solution[i].predecessor = [0] * n_verts
+        self.solution = [self._new_solution_rung(i) for i in range(graph.get_rungs_size())]
+        # * rungs [0, fwd_valid) have valid cost-to-come, rungs [bwd_valid, n) have valid cost-to-go
+        self._fwd_valid = 0
+        self._bwd_valid = len(self.solution)
+        # the rung where the forward and backward solutions are joined
+        self._splice_rung = None
+        # statistics of the last beam-pruned run, see `run`
+        self.beam_info = None
 
     @classmethod
     def from_ladder_graph(cls, graph):
         return cls(graph)
 
+    def _new_solution_rung(self, r_id):
+        n_verts = self.graph.get_rung_vert_size(r_id)
+        assert(n_verts > 0)
+        return SolutionRung(n_verts)
+
     def distance(self, r_id, v_id):
         return self.solution[r_id].distance[v_id]
 
     def predecessor(self, r_id, v_id):
         return self.solution[r_id].predecessor[v_id]
 
-    def run(self):
-        """forward cost propagation"""
+    def cost_to_go(self, r_id, v_id):
+        return self.solution[r_id].cost_to_go[v_id]
+
+    def successor(self, r_id, v_id):
+        return self.solution[r_id].successor[v_id]
+
+    def _relax_forward(self, r_id, rows=None):
+        next_sol = self.solution[r_id + 1]
+        next_sol.distance, next_sol.predecessor = min_plus_relax(self.solution[r_id].distance, self.graph.get_edges(r_id),
+                                                                 self.graph.get_data(r_id), self.graph.get_data(r_id + 1), rows=rows)
+        next_sol.mask_removed(next_sol.distance)
+
+    def _relax_backward(self, r_id):
+        sol = self.solution[r_id]
+        sol.cost_to_go, sol.successor = min_plus_relax_backward(self.solution[r_id + 1].cost_to_go, self.graph.get_edges(r_id),
+                                                                self.graph.get_data(r_id), self.graph.get_data(r_id + 1))
+        sol.mask_removed(sol.cost_to_go)
+
+    def _ensure_forward(self, r_id):
+        """make sure the cost-to-come of rungs [0, r_id] are up-to-date"""
+        if self._fwd_valid == 0:
+            # TODO: add st_conf cost to SolutionRung 0
+            # * first rung init to 0
+            self.solution[0].distance = self.solution[0].mask_removed(np.zeros(len(self.solution[0])))
+            self._fwd_valid = 1
+        for i in range(self._fwd_valid - 1, r_id):
+            self._relax_forward(i)
+        self._fwd_valid = max(self._fwd_valid, r_id + 1)
+
+    def _ensure_backward(self, r_id):
+        """make sure the cost-to-go of rungs [r_id, n) are up-to-date"""
+        if self._bwd_valid == len(self.solution):
+            # * last rung init to 0
+            self.solution[-1].cost_to_go = self.solution[-1].mask_removed(np.zeros(len(self.solution[-1])))
+            self._bwd_valid = len(self.solution) - 1
+        for i in range(self._bwd_valid - 1, r_id - 1, -1):
+            self._relax_backward(i)
+        self._bwd_valid = min(self._bwd_valid, r_id)
+
+    def _splice_cost(self):
+        sol = self.solution[self._splice_rung]
+        return float(np.min(sol.distance + sol.cost_to_go))
+
+    def run(self, beam_width=None, beam_margin=None, check_exact=False):
+        """forward cost propagation
+
+        With `beam_width` and/or `beam_margin`, the search is beam-pruned: from the second rung on, only the
+        `beam_width` best partial paths and/or the ones within `beam_margin` of the rung minimum are expanded
+        further. The returned cost is then an upper bound of the exact minimum, and `beam_info` reports
+        the number of expanded verts (and the gap to the exact solve if `check_exact` is True).
+
+        Parameters
+        ----------
+        beam_width : int, optional
+            maximal number of verts expanded per rung, by default None (no limit)
+        beam_margin : float, optional
+            only expand the verts whose cost-to-come is within this margin of the rung minimum, by default None
+        check_exact : bool, optional
+            also run the exact search to report the bound gap of a beam-pruned run, by default False
+
+        Returns
+        -------
+        float
+            the (beam) minimal path cost
+        """
         if len(self.solution) == 0:
             raise ValueError('The initial solution is empty!')
+        self._fwd_valid = 0
+        self._bwd_valid = len(self.solution)
+        self.beam_info = None
+        if beam_width is None and beam_margin is None:
+            self._ensure_forward(len(self.solution) - 1)
+        else:
+            self._run_beam(beam_width, beam_margin)
+        self._ensure_backward(len(self.solution) - 1)
+        self._splice_rung = len(self.solution) - 1
+        cost = self._splice_cost()
 
-        # TODO: add st_conf cost to SolutionRung 0
-        # * first rung init to 0
-        self.solution[0].distance = [0] * len(self.solution[0])
-        # * other rungs init to inf
-        for j in range(1, len(self.solution)):
-            self.solution[j].distance = [INF] * len(self.solution[j])
-
-        for r_id in range(0, len(self.solution)-1):
-            n_verts = self.graph.get_rung_vert_size(r_id)
-            next_r_id = r_id + 1
-            # for each vert in the out edge list
-            for v_id in range(n_verts):
-                u_cost = self.distance(r_id, v_id)
-                edges = self.graph.get_edges(r_id)[v_id]
-                for edge in edges:
-                    dv = u_cost + edge.cost
-                    if dv < self.distance(next_r_id, edge.idx):
-                        self.solution[next_r_id].distance[edge.idx] = dv
-                        self.solution[next_r_id].predecessor[edge.idx] = v_id
-
-        return min(self.solution[-1].distance)
+        if self.beam_info is not None:
+            self.beam_info['cost'] = cost
+            if check_exact:
+                exact_cost = self._exact_cost()
+                self.beam_info['exact_cost'] = exact_cost
+                self.beam_info['gap'] = cost - exact_cost if cost < INF else INF
+        return cost
 
-    def shortest_path(self):
-        if len(self.solution) == 0:
+    def _run_beam(self, beam_width, beam_margin):
+        self.solution[0].distance = self.solution[0].mask_removed(np.zeros(len(self.solution[0])))
+        expanded_verts = len(self.solution[0])
+        for r_id in range(len(self.solution) - 1):
+            sol = self.solution[r_id]
+            rows = None
+            if r_id > 0:
+                rows = beam_select(sol.distance, beam_width, beam_margin)
+                pruned = np.ones(len(sol), dtype=bool)
+                pruned[rows] = False
+                sol.distance[pruned] = INF
+                expanded_verts += len(rows)
+            self._relax_forward(r_id, rows=rows)
+        # * the pruned cost-to-come are not exact, so only the first rung is kept valid for incremental re-solves
+        self._fwd_valid = 1
+        self.beam_info = {'beam_width' : beam_width, 'beam_margin' : beam_margin,
+                          'expanded_verts' : int(expanded_verts), 'total_verts' : int(self.graph.get_vert_size())}
+
+    def _exact_cost(self):
+        """exact minimal path cost, computed without touching the stored solution"""
+        dist = self.solution[0].mask_removed(np.zeros(len(self.solution[0])))
+        for r_id in range(len(self.solution) - 1):
+            dist, _ = min_plus_relax(dist, self.graph.get_edges(r_id), self.graph.get_data(r_id), self.graph.get_data(r_id + 1))
+            self.solution[r_id + 1].mask_removed(dist)
+        return float(np.min(dist))
+
+    def run_backward(self):
+        """backward cost propagation, fills in the cost-to-go of all the rungs
+
+        Returns
+        -------
+        float
+            the minimal path cost
+        """
+        self._ensure_backward(0)
+        self._splice_rung = 0
+        return self._splice_cost()
+
+    def replace_rungs(self, rung_st, rung_end, graph, joint_weights=None, lazy_edges=False):
+        """Replace rungs [rung_st, rung_end) of the searched graph by the rungs of the given graph,
+        e.g. when one Cartesian process is resampled, and re-solve incrementally.
+
+        The boundary edges are rebuilt, the forward pass is only re-run across the replaced span,
+        and the result is joined with the (still valid) cost-to-go of the first rung after the span.
+        Stale cost-to-come / cost-to-go outside the span are only recomputed when a later call needs them.
+
+        Parameters
+        ----------
+        rung_st : int
+            first replaced rung id
+        rung_end : int
+            replaced rungs end (exclusive)
+        graph : LadderGraph
+            the new rungs, with their edges
+        joint_weights : list of float, optional
+            per-joint weights used in the cost of the boundary edges, by default None
+        lazy_edges : bool, optional
+            do not store the boundary edges, by default False
+
+        Returns
+        -------
+        float
+            the minimal path cost of the updated graph
+        """
+        if graph.size == 0:
+            raise ValueError('input ladder graph is empty!')
+        n_old = len(self.solution)
+        self.graph.replace_rungs(rung_st, rung_end, graph)
+        new_end = rung_st + graph.size
+        if rung_st > 0:
+            connect_rungs(self.graph, rung_st - 1, joint_weights=joint_weights, lazy_edges=lazy_edges)
+        if new_end < self.graph.size:
+            connect_rungs(self.graph, new_end - 1, joint_weights=joint_weights, lazy_edges=lazy_edges)
+        self.solution[rung_st:rung_end] = [self._new_solution_rung(i) for i in range(rung_st, new_end)]
+
+        # * the cost-to-come before the span and the cost-to-go after the span are not affected
+        self._fwd_valid = min(self._fwd_valid, rung_st)
+        self._bwd_valid = max(self._bwd_valid, rung_end) + new_end - rung_end if self._bwd_valid < n_old else len(self.solution)
+
+        self._splice_rung = min(new_end, len(self.solution) - 1)
+        self._ensure_forward(self._splice_rung)
+        self._ensure_backward(self._splice_rung)
+        return self._splice_cost()
+
+    def remove_vertices(self, removed_verts):
+        """Remove vertices from the search (e.g. vertices found in collision on the current shortest path),
+        and re-solve incrementally: the forward and backward passes are only re-run between the first and
+        the last rung with removed verts, and joined at the first one.
+
+        Parameters
+        ----------
+        removed_verts : dict
+            rung id -> list of removed vert ids
+
+        Returns
+        -------
+        float
+            the minimal path cost without the removed verts (INF if no path is left)
+        """
+        if self._splice_rung is None:
+            raise ValueError('The initial solution is empty!')
+        r_ids = sorted([r_id for r_id, v_ids in removed_verts.items() if len(v_ids) > 0])
+        if len(r_ids) == 0:
+            return self._splice_cost()
+        for r_id in r_ids:
+            sol = self.solution[r_id]
+            sol.removed[list(removed_verts[r_id])] = True
+            sol.mask_removed(sol.distance)
+            sol.mask_removed(sol.cost_to_go)
+        # * the cost-to-come up to the first changed rung and the cost-to-go from the last changed rung are still valid
+        self._fwd_valid = min(self._fwd_valid, r_ids[0] + 1)
+        self._bwd_valid = max(self._bwd_valid, r_ids[-1])
+        self._splice_rung = r_ids[0]
+        self._ensure_forward(self._splice_rung)
+        self._ensure_backward(self._splice_rung)
+        return self._splice_cost()
+
+    def k_shortest_paths(self, k, min_diversity=0.0, candidate_size=None):
+        """Find the k best paths with distinct joint values, in ascending cost order.
+
+        A forward pass keeps the `candidate_size` best partial paths of each vertex, the complete
+        candidates are then accepted greedily in ascending cost order if their mean L1 joint distance
+        (see `path_joint_distance`) to all the accepted paths is larger than `min_diversity`.
+
+        Parameters
+        ----------
+        k : int
+            number of paths
+        min_diversity : float, optional
+            minimal joint-space distance between any two returned paths, 0 only removes exact joint
+            duplicates, by default 0.0
+        candidate_size : int, optional
+            number of partial paths kept per vertex, the partial paths through verts with the same joint values
+            are only kept once, by default k if no diversity is required, 4*k otherwise
+
+        Returns
+        -------
+        list of (float, list of list of float)
+            (path cost, joint path), fewer than k pairs are returned if not enough paths exist
+        """
+        if k < 1:
+            raise ValueError('k must be >= 1!')
+        n_cand = candidate_size or (k if min_diversity <= 0 else 4 * k)
+        k_dist = np.full((self.graph.get_rung_vert_size(0), n_cand), INF)
+        k_dist[:, 0] = 0
+        self.solution[0].mask_removed(k_dist)
+        k_hash = np.repeat(_extend_path_hash(np.uint64(0), _joint_value_classes(self.graph.get_data(0)))[:, None], n_cand, axis=1)
+        k_preds = []
+        for r_id in range(self.graph.size - 1):
+            k_dist, k_pred = k_min_plus_relax(k_dist, self.graph.get_edges(r_id),
+                                              self.graph.get_data(r_id), self.graph.get_data(r_id + 1), k_hash=k_hash)
+            self.solution[r_id + 1].mask_removed(k_dist)
+            k_preds.append(k_pred)
+            k_hash = _extend_path_hash(k_hash.reshape(-1)[k_pred], _joint_value_classes(self.graph.get_data(r_id + 1))[:, None])
+
+        paths = []
+        flat_dist = k_dist.reshape(-1)
+        for flat_id in np.argsort(flat_dist, kind='stable'):
+            cost = flat_dist[flat_id]
+            if cost == INF or len(paths) == k:
+                break
+            path_idx = [0] * self.graph.size
+            path_idx[-1] = flat_id // n_cand
+            for r_id in range(self.graph.size - 1, 0, -1):
+                flat_id = k_preds[r_id - 1][flat_id // n_cand, flat_id % n_cand]
+                path_idx[r_id - 1] = flat_id // n_cand
+            path = [self.graph.get_vert_data(r_id, v_id).tolist() for r_id, v_id in enumerate(path_idx)]
+            if all([path_joint_distance(path, other_path) > min_diversity for _, other_path in paths]):
+                paths.append((float(cost), path))
+        return paths
+
+    def shortest_path_idx(self):
+        """get the vert id of each rung on the shortest path, None if no path exists
+        (e.g. all the edges of a rung pair are pruned by the joint velocity limits)"""
+        if len(self.solution) == 0 or self._splice_rung is None:
             # TODO: more detailed checks
             raise ValueError('The initial solution is empty!')
 
-        _, min_val_id = self.solution[-1].extract_min()
+        splice_sol = self.solution[self._splice_rung]
+        splice_costs = splice_sol.distance + splice_sol.cost_to_go
         path_idx = [0] * len(self.solution)
+        path_idx[self._splice_rung] = int(np.argmin(splice_costs))
+        if splice_costs[path_idx[self._splice_rung]] == INF:
+            return None
 
-        current_v_id = min_val_id
-        count = len(path_idx) - 1
-        while count >= 0:
-            path_idx[count] = current_v_id
-            current_v_id = self.predecessor(count, current_v_id)
-            count -= 1
+        # trace back with the predecessors and forward with the successors
+        for r_id in range(self._splice_rung, 0, -1):
+            path_idx[r_id - 1] = self.predecessor(r_id, path_idx[r_id])
+        for r_id in range(self._splice_rung, len(self.solution) - 1):
+            path_idx[r_id + 1] = self.successor(r_id, path_idx[r_id])
+        return [int(v_id) for v_id in path_idx]
 
+    def shortest_path(self):
+        """get the joint values of each rung on the shortest path, None if no path exists"""
+        path_idx = self.shortest_path_idx()
+        if path_idx is None:
+            return None
         sol = []
         for r_id, v_id in enumerate(path_idx):
             data = self.graph.get_vert_data(r_id, v_id)
-            sol.append(data)
+            sol.append(data.tolist())
 
         return sol
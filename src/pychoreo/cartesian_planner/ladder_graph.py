@@ -1,5 +1,28 @@
+import bisect
+import json
+import struct
+import numpy as np
 from pybullet_planning import INF
-from copy import deepcopy
+
+# max number of array entries held in memory at once when computing edge costs (n_start x n_end x dof)
+# or densifying sparse edge blocks
+EDGE_COST_CHUNK_SIZE = 2**20
+
+def _as_joint_array(jt_data, dof=None):
+    """Convert joint data (a nested list of joint values, a flat list of joint values
+    or an array) into a contiguous (n_verts, dof) float64 array. No copy is made
+    if the given data is already such an array.
+    """
+    jt_array = np.asarray(jt_data, dtype=np.float64)
+    if jt_array.ndim != 2 or (dof is not None and jt_array.shape[1] != dof):
+        if dof is None:
+            if jt_array.size == 0:
+                return np.empty((0, 0))
+            raise ValueError('dof must be specified to reshape flat joint data!')
+        if jt_array.size % dof != 0:
+            raise ValueError('joint data size {} is not a multiple of dof {}!'.format(jt_array.size, dof))
+        jt_array = jt_array.reshape(-1, dof)
+    return np.ascontiguousarray(jt_array)
 
 class LadderGraphEdge(object):
     def __init__(self, idx=None, cost=-INF):
@@ -10,14 +33,494 @@ class LadderGraphEdge(object):
     def __repr__(self):
         return 'E idx{0}, cost{1}'.format(self.idx, self.cost)
 
+######################################
+# rung-pair edge stores
+
+class _EdgeCostStore(object):
+    """Base class for the edges between two consecutive rungs (rung i -> rung i+1).
+    Missing edges are marked by an INF cost.
+
+    Indexing a store with a start vertex id gives the list of outgoing `LadderGraphEdge`s
+    of that vertex, so the old list-of-lists edge API keeps working.
+    """
+    @property
+    def shape(self):
+        raise NotImplementedError()
+
+    @property
+    def n_start(self):
+        return self.shape[0]
+
+    @property
+    def n_end(self):
+        return self.shape[1]
+
+    @property
+    def num_edges(self):
+        raise NotImplementedError()
+
+    @property
+    def nbytes(self):
+        """memory used by the stored edge costs, in bytes"""
+        raise NotImplementedError()
+
+    def out_edges(self, v_id):
+        """get the outgoing edges of a start vertex
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            target vertex ids and the corresponding edge costs
+        """
+        raise NotImplementedError()
+
+    def iter_blocks(self, st_jts=None, end_jts=None, rows=None):
+        """iterate over the edge costs as dense blocks, in ascending start vertex order
+
+        Parameters
+        ----------
+        st_jts : (n_start, dof) array, optional
+            joint data of the start rung, only needed by the edge stores computing costs on the fly
+        end_jts : (n_end, dof) array, optional
+            joint data of the end rung
+        rows : (n_rows,) int array, optional
+            ascending start vertex ids, only the edges out of these verts are iterated, by default all
+
+        Yields
+        ------
+        (ndarray, int, ndarray)
+            start vertex ids of the block rows, target vertex id of the first block column,
+            and the (len(row_ids), n_cols) cost block (INF for missing edges)
+        """
+        raise NotImplementedError()
+
+    def to_dense(self):
+        raise NotImplementedError()
+
+    def to_sparse(self):
+        raise NotImplementedError()
+
+    def __len__(self):
+        return self.n_start
+
+    def __getitem__(self, v_id):
+        if v_id < 0 or v_id >= self.n_start:
+            raise IndexError('start vertex id {} out of range {}'.format(v_id, self.n_start))
+        idx, costs = self.out_edges(v_id)
+        return [LadderGraphEdge(idx=int(j), cost=float(c)) for j, c in zip(idx, costs)]
+
+    def __iter__(self):
+        for v_id in range(self.n_start):
+            yield self[v_id]
+
+    def __repr__(self):
+        return '{}{}|e#{}'.format(self.__class__.__name__, self.shape, self.num_edges)
+
+
+class EdgeCostMatrix(_EdgeCostStore):
+    """Dense edge store: costs are kept in a (n_start, n_end) float64 matrix."""
+    def __init__(self, costs):
+        self.costs = np.ascontiguousarray(costs, dtype=np.float64)
+        if self.costs.ndim != 2:
+            raise ValueError('edge cost matrix must be 2-dimensional, got shape {}'.format(self.costs.shape))
+
+    @classmethod
+    def from_edge_lists(cls, edge_lists, n_end):
+        """build a dense edge store from a list of `LadderGraphEdge` lists (one list per start vertex)"""
+        costs = np.full((len(edge_lists), n_end), INF)
+        for v_id, v_out_edges in enumerate(edge_lists):
+            for e in v_out_edges:
+                costs[v_id, e.idx] = e.cost
+        return cls(costs)
+
+    @property
+    def shape(self):
+        return self.costs.shape
+
+    @property
+    def num_edges(self):
+        return int(np.count_nonzero(np.isfinite(self.costs)))
+
+    @property
+    def nbytes(self):
+        return self.costs.nbytes
+
+    def out_edges(self, v_id):
+        row = self.costs[v_id]
+        idx = np.flatnonzero(np.isfinite(row))
+        return idx, row[idx]
+
+    def iter_blocks(self, st_jts=None, end_jts=None, rows=None):
+        if rows is None:
+            yield np.arange(self.n_start), 0, self.costs
+        elif len(rows) > 0:
+            yield rows, 0, self.costs[rows]
+
+    def to_dense(self):
+        return self
+
+    def to_sparse(self):
+        return SparseEdgeCostMatrix.from_dense(self.costs)
+
+
+class SparseEdgeCostMatrix(_EdgeCostStore):
+    """Sparse edge store in the CSR format, used for pruned or block-structured rung pairs.
+
+    The outgoing edges of start vertex i are `indices[indptr[i]:indptr[i+1]]`,
+    with costs `costs[indptr[i]:indptr[i+1]]`.
+    """
+    def __init__(self, indptr, indices, costs, n_end):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.costs = np.asarray(costs, dtype=np.float64)
+        self._n_end = int(n_end)
+        assert self.indptr[0] == 0 and self.indptr[-1] == len(self.indices) == len(self.costs)
+
+    @classmethod
+    def from_dense(cls, costs):
+        costs = np.asarray(costs, dtype=np.float64)
+        mask = np.isfinite(costs)
+        indptr = np.concatenate(([0], np.cumsum(np.count_nonzero(mask, axis=1))))
+        rows, cols = np.nonzero(mask)
+        return cls(indptr, cols, costs[rows, cols], costs.shape[1])
+
+    @classmethod
+    def empty(cls, n_start, n_end):
+        return cls(np.zeros(n_start+1, dtype=np.int64), [], [], n_end)
+
+    @property
+    def shape(self):
+        return (len(self.indptr) - 1, self._n_end)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.costs.nbytes
+
+    def out_edges(self, v_id):
+        st, end = self.indptr[v_id], self.indptr[v_id+1]
+        return self.indices[st:end], self.costs[st:end]
+
+    def iter_blocks(self, st_jts=None, end_jts=None, rows=None):
+        # densify a chunk of rows at a time, restricted to the columns spanned by the chunk
+        rows = np.arange(self.n_start) if rows is None else np.asarray(rows, dtype=np.int64)
+        chunk_size = max(1, EDGE_COST_CHUNK_SIZE // max(1, self.n_end))
+        for c_id in range(0, len(rows), chunk_size):
+            row_ids = rows[c_id:c_id + chunk_size]
+            e_starts = self.indptr[row_ids]
+            row_sizes = self.indptr[row_ids + 1] - e_starts
+            n_entries = int(row_sizes.sum())
+            if n_entries == 0:
+                continue
+            # CSR entry ids of the chosen rows
+            entry_ids = np.repeat(e_starts - np.cumsum(row_sizes) + row_sizes, row_sizes) + np.arange(n_entries)
+            indices = self.indices[entry_ids]
+            c_st = indices.min()
+            block = np.full((len(row_ids), indices.max() + 1 - c_st), INF)
+            block[np.repeat(np.arange(len(row_ids)), row_sizes), indices - c_st] = self.costs[entry_ids]
+            yield row_ids, int(c_st), block
+
+    def to_dense(self):
+        costs = np.full(self.shape, INF)
+        rows = np.repeat(np.arange(self.n_start), np.diff(self.indptr))
+        costs[rows, self.indices] = self.costs
+        return EdgeCostMatrix(costs)
+
+    def to_sparse(self):
+        return self
+
+
+class LazyEdgeCostMatrix(_EdgeCostStore):
+    """Edge store that never keeps any edge cost in memory: the costs are computed from the
+    joint data of the two rungs, block by block, whenever they are iterated.
+
+    Each block connects a range of start verts to a range of end verts with the same
+    preference cost, e.g. a pose family of a vertically concatenated graph, all the other
+    vertex pairs are not connected.
+    """
+    def __init__(self, n_start, n_end, blocks=None, joint_weights=None, upper_tm=None, joint_vel_limits=None):
+        self._shape = (int(n_start), int(n_end))
+        # (row_st, n_rows, col_st, n_cols, preference_cost)
+        self.blocks = blocks if blocks is not None else []
+        self.joint_weights = joint_weights
+        self.upper_tm = upper_tm
+        self.joint_vel_limits = joint_vel_limits
+
+    @classmethod
+    def full(cls, n_start, n_end, preference_cost=1.0, joint_weights=None, upper_tm=None, joint_vel_limits=None):
+        """all the start verts are connected to all the end verts"""
+        return cls(n_start, n_end, [(0, n_start, 0, n_end, preference_cost)],
+                   joint_weights=joint_weights, upper_tm=upper_tm, joint_vel_limits=joint_vel_limits)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def num_edges(self):
+        """number of candidate edges, edges pruned by the joint velocity limits are included"""
+        return sum([n_rows * n_cols for _, n_rows, _, n_cols, _ in self.blocks])
+
+    @property
+    def nbytes(self):
+        # only the block descriptions are kept
+        return 0
+
+    def out_edges(self, v_id):
+        raise ValueError('LazyEdgeCostMatrix does not store edges, use iter_blocks with the rungs\' joint data instead.')
+
+    def iter_blocks(self, st_jts=None, end_jts=None, rows=None):
+        if st_jts is None or end_jts is None:
+            raise ValueError('LazyEdgeCostMatrix needs the joint data of both rungs to compute the edge costs.')
+        rows = np.asarray(rows, dtype=np.int64) if rows is not None else None
+        for row_st, n_rows, col_st, n_cols, preference_cost in self.blocks:
+            if rows is None:
+                block_rows = np.arange(row_st, row_st + n_rows)
+            else:
+                block_rows = rows[np.searchsorted(rows, row_st):np.searchsorted(rows, row_st + n_rows)]
+            chunk_size = max(1, EDGE_COST_CHUNK_SIZE // max(1, n_cols))
+            for c_id in range(0, len(block_rows), chunk_size):
+                row_ids = block_rows[c_id:c_id + chunk_size]
+                block = compute_edge_costs(st_jts[row_ids], end_jts[col_st:col_st+n_cols], preference_cost=preference_cost,
+                    joint_weights=self.joint_weights, upper_tm=self.upper_tm, joint_vel_limits=self.joint_vel_limits)
+                yield row_ids, col_st, block
+
+    def has_edges(self, st_jts=None, end_jts=None):
+        """whether any candidate edge is within the joint velocity limits, needs the joint data of both rungs"""
+        if self.upper_tm is None or self.joint_vel_limits is None:
+            return self.num_edges > 0
+        return any(np.isfinite(block).any() for _, _, block in self.iter_blocks(st_jts, end_jts))
+
+    def to_dense(self, st_jts=None, end_jts=None):
+        """materialize the edge costs, needs the joint data of both rungs"""
+        costs = np.full(self.shape, INF)
+        for row_ids, col_st, block in self.iter_blocks(st_jts, end_jts):
+            costs[row_ids, col_st:col_st+block.shape[1]] = block
+        return EdgeCostMatrix(costs)
+
+    def to_sparse(self, st_jts=None, end_jts=None):
+        return self.to_dense(st_jts, end_jts).to_sparse()
+
+    def stack_diagonally(self, edges_below, in_place=False):
+        """stack another edge store below, the other store should be lazy or edge-free"""
+        if isinstance(edges_below, LazyEdgeCostMatrix):
+            below_blocks = edges_below.blocks
+        elif edges_below.num_edges == 0:
+            below_blocks = []
+        else:
+            raise ValueError('Cannot stack explicit edges under lazy edges.')
+        n_start, n_end = self.shape
+        blocks = [(r_st + n_start, n_rows, c_st + n_end, n_cols, pc) for r_st, n_rows, c_st, n_cols, pc in below_blocks]
+        if in_place:
+            self.blocks.extend(blocks)
+            self._shape = (n_start + edges_below.n_start, n_end + edges_below.n_end)
+            return self
+        return LazyEdgeCostMatrix(n_start + edges_below.n_start, n_end + edges_below.n_end, self.blocks + blocks,
+                                  joint_weights=self.joint_weights, upper_tm=self.upper_tm, joint_vel_limits=self.joint_vel_limits)
+
+
+class BlockDiagonalEdgeCostMatrix(_EdgeCostStore):
+    """Edge store of vertically concatenated rung pairs: each sub edge store connects
+    a range of start verts to a range of end verts, all the other vertex pairs are not connected.
+
+    The sub stores are kept as they are, so stacking one more store below is O(1).
+    """
+    def __init__(self, blocks=None):
+        # (row_offset, col_offset, edge store)
+        self.blocks = []
+        self._shape = (0, 0)
+        self._row_offsets = []
+        for _, _, edges in blocks or []:
+            self.append(edges)
+
+    def append(self, edges):
+        """stack an edge store below (in place)"""
+        n_start, n_end = self._shape
+        self.blocks.append((n_start, n_end, edges))
+        self._row_offsets.append(n_start)
+        self._shape = (n_start + edges.n_start, n_end + edges.n_end)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def num_edges(self):
+        return sum([edges.num_edges for _, _, edges in self.blocks])
+
+    @property
+    def nbytes(self):
+        return sum([edges.nbytes for _, _, edges in self.blocks])
+
+    def out_edges(self, v_id):
+        row_offset, col_offset, edges = self.blocks[bisect.bisect_right(self._row_offsets, v_id) - 1]
+        idx, costs = edges.out_edges(v_id - row_offset)
+        return idx + col_offset, costs
+
+    def iter_blocks(self, st_jts=None, end_jts=None, rows=None):
+        rows = np.asarray(rows, dtype=np.int64) if rows is not None else None
+        for row_offset, col_offset, edges in self.blocks:
+            if edges.n_start == 0:
+                continue
+            block_rows = None
+            if rows is not None:
+                block_rows = rows[np.searchsorted(rows, row_offset):np.searchsorted(rows, row_offset + edges.n_start)] - row_offset
+                if len(block_rows) == 0:
+                    continue
+            block_st_jts = st_jts[row_offset:row_offset + edges.n_start] if st_jts is not None else None
+            block_end_jts = end_jts[col_offset:col_offset + edges.n_end] if end_jts is not None else None
+            for row_ids, col_st, block in edges.iter_blocks(block_st_jts, block_end_jts, rows=block_rows):
+                yield row_ids + row_offset, col_st + col_offset, block
+
+    def to_dense(self):
+        return self.to_sparse().to_dense()
+
+    def to_sparse(self):
+        sub_stores = [edges.to_sparse() for _, _, edges in self.blocks]
+        edge_offsets = np.cumsum([0] + [edges.num_edges for edges in sub_stores])
+        indptr = np.concatenate([[0]] + [edges.indptr[1:] + e_offset for edges, e_offset in zip(sub_stores, edge_offsets)])
+        indices = np.concatenate([[]] + [edges.indices + col_offset for (_, col_offset, _), edges in zip(self.blocks, sub_stores)])
+        costs = np.concatenate([[]] + [edges.costs for edges in sub_stores])
+        return SparseEdgeCostMatrix(indptr, indices, costs, self.n_end)
+
+
+def as_edge_cost_store(edges, n_start, n_end):
+    """Convert the given edges into an edge store. `edges` can be an edge store,
+    a (n_start, n_end) cost matrix, or a list of `LadderGraphEdge` lists.
+    An empty list is treated as a rung pair without any edge.
+    """
+    if isinstance(edges, _EdgeCostStore):
+        return edges
+    if isinstance(edges, np.ndarray):
+        return EdgeCostMatrix(edges)
+    if len(edges) == 0:
+        return SparseEdgeCostMatrix.empty(n_start, n_end)
+    return EdgeCostMatrix.from_edge_lists(edges, n_end)
+
+
+def stack_edges_diagonally(edges_above, edges_below, in_place=False):
+    """Stack the edge stores of two vertically concatenated rung pairs. Since no edge
+    connects the two graphs, the result is a block-diagonal edge store (or a lazy one
+    if the given edges are lazy). No edge cost is copied.
+
+    With `in_place`, a block-diagonal or lazy `edges_above` is extended and returned
+    instead of a new store, so that stacking N stores one after another is linear in N.
+    """
+    if isinstance(edges_above, LazyEdgeCostMatrix) or isinstance(edges_below, LazyEdgeCostMatrix):
+        if not isinstance(edges_above, LazyEdgeCostMatrix):
+            if edges_above.num_edges > 0:
+                raise ValueError('Cannot stack lazy edges under explicit edges.')
+            edges_above = LazyEdgeCostMatrix(edges_above.n_start, edges_above.n_end)
+        return edges_above.stack_diagonally(edges_below, in_place=in_place)
+    if isinstance(edges_above, BlockDiagonalEdgeCostMatrix):
+        if not in_place:
+            edges_above = BlockDiagonalEdgeCostMatrix(edges_above.blocks)
+    else:
+        edges_above = BlockDiagonalEdgeCostMatrix([(0, 0, edges_above)])
+    below_blocks = edges_below.blocks if isinstance(edges_below, BlockDiagonalEdgeCostMatrix) else [(0, 0, edges_below)]
+    for _, _, edges in below_blocks:
+        edges_above.append(edges)
+    return edges_above
+
+
+######################################
+# edge store (de)serialization, see `LadderGraph.to_file`
+
+LADDER_GRAPH_FILE_MAGIC = b'PCLGRAPH'
+LADDER_GRAPH_FILE_VERSION = 1
+LADDER_GRAPH_FILE_ALIGNMENT = 64
+
+def _align(offset, alignment=LADDER_GRAPH_FILE_ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+def _to_list(values):
+    return np.asarray(values, dtype=np.float64).tolist() if values is not None else None
+
+def _edge_store_to_data(edges):
+    """split an edge store into a JSON-serializable meta data dict and a list of (name, array)"""
+    if isinstance(edges, EdgeCostMatrix):
+        return {'type' : 'dense', 'arrays' : ['costs']}, [('costs', edges.costs)]
+    if isinstance(edges, SparseEdgeCostMatrix):
+        return {'type' : 'sparse', 'n_end' : edges.n_end, 'arrays' : ['indptr', 'indices', 'costs']}, \
+            [('indptr', edges.indptr), ('indices', edges.indices), ('costs', edges.costs)]
+    if isinstance(edges, LazyEdgeCostMatrix):
+        blocks = [[int(r_st), int(n_rows), int(c_st), int(n_cols), float(pc)] for r_st, n_rows, c_st, n_cols, pc in edges.blocks]
+        return {'type' : 'lazy', 'shape' : list(edges.shape), 'blocks' : blocks, 'joint_weights' : _to_list(edges.joint_weights),
+                'upper_tm' : float(edges.upper_tm) if edges.upper_tm is not None else None,
+                'joint_vel_limits' : _to_list(edges.joint_vel_limits)}, []
+    if isinstance(edges, BlockDiagonalEdgeCostMatrix):
+        # saved as one CSR matrix
+        return _edge_store_to_data(edges.to_sparse())
+    if len(edges) == 0:
+        return {'type' : 'none'}, []
+    raise ValueError('Unknown edge store: {}'.format(edges))
+
+def _edge_store_from_data(meta, arrays, n_start, n_end):
+    if meta['type'] == 'dense':
+        return EdgeCostMatrix(arrays['costs'])
+    if meta['type'] == 'sparse':
+        return SparseEdgeCostMatrix(arrays['indptr'], arrays['indices'], arrays['costs'], meta['n_end'])
+    if meta['type'] == 'lazy':
+        return LazyEdgeCostMatrix(meta['shape'][0], meta['shape'][1], [tuple(b) for b in meta['blocks']],
+            joint_weights=meta['joint_weights'], upper_tm=meta['upper_tm'], joint_vel_limits=meta['joint_vel_limits'])
+    if meta['type'] == 'none':
+        return SparseEdgeCostMatrix.empty(n_start, n_end)
+    raise ValueError('Unknown edge store type: {}'.format(meta['type']))
+
 
 class LadderGraphRung(object):
-    def __init__(self, id=None, data=[], edges=[]):
+    def __init__(self, id=None, data=[], edges=[], dof=None):
         self.id = id
-        # joint_data: joint values are stored in one contiguous list
-        self.data = data
+        self.dof = dof
+        # joint_data: joint values are stored in one contiguous (n_verts, dof) array
+        self.joint_data = _as_joint_array(data, dof)
+        if self.dof is None:
+            self.dof = self.joint_data.shape[1]
         self.edges = edges
 
+    @property
+    def joint_data(self):
+        """(n_verts, dof) joint array, the verts appended by `append_joint_data` are merged into one array on first access"""
+        if len(self._joint_chunks) > 1:
+            self._joint_chunks = [np.vstack(self._joint_chunks)]
+        return self._joint_chunks[0]
+
+    @joint_data.setter
+    def joint_data(self, jt_array):
+        self._joint_chunks = [jt_array]
+        self._vert_size = jt_array.shape[0]
+
+    def append_joint_data(self, jt_data):
+        """append verts after the existing ones, without copying the existing joint array"""
+        jt_array = _as_joint_array(jt_data, self.dof)
+        if self._vert_size == 0:
+            self.joint_data = jt_array
+        elif jt_array.shape[0] > 0:
+            self._joint_chunks.append(jt_array)
+            self._vert_size += jt_array.shape[0]
+
+    @property
+    def data(self):
+        """flat (zero-copy) view of the joint data, kept for the old list-based API"""
+        return self.joint_data.reshape(-1)
+
+    @data.setter
+    def data(self, data_):
+        self.joint_data = _as_joint_array(data_, self.dof)
+
+    @property
+    def vert_size(self):
+        return self._vert_size
+
+    @property
+    def nbytes(self):
+        """memory used by the joint data and the edge costs to the next rung, in bytes"""
+        edge_nbytes = self.edges.nbytes if isinstance(self.edges, _EdgeCostStore) else 0
+        return sum([jt_array.nbytes for jt_array in self._joint_chunks]) + edge_nbytes
+
     def __repr__(self):
         return 'id {0}, data {1}, edge num {2}'.format(self.id, len(self.data), len(self.edges))
 
@@ -37,13 +540,15 @@ class LadderGraph(object):
         return self.rungs[rung_id]
 
     def get_edges(self, rung_id):
+        """get the edge store between rung_id and rung_id+1"""
         return self.get_rung(rung_id).edges
 
     def get_edge_sizes(self):
         return [len(r.edges) for r in self.rungs]
 
     def get_data(self, rung_id):
-        return self.get_rung(rung_id).data
+        """get the (n_verts, dof) joint array of a rung"""
+        return self.get_rung(rung_id).joint_data
 
     def get_rungs_size(self):
         return len(self.rungs)
@@ -54,7 +559,7 @@ class LadderGraph(object):
 
     def get_rung_vert_size(self, rung_id):
         """count the number of vertices in a rung"""
-        return int(len(self.get_rung(rung_id).data) / self.dof)
+        return self.get_rung(rung_id).vert_size
 
     def get_vert_size(self):
         """count the number of vertices in the whole graph"""
@@ -63,16 +568,26 @@ class LadderGraph(object):
     def get_vert_sizes(self):
         return [self.get_rung_vert_size(r_id) for r_id in range(self.get_rungs_size())]
 
+    def get_edge_num(self):
+        """count the number of edges in the whole graph (candidate edges for the lazy edge stores)"""
+        return sum([r.edges.num_edges for r in self.rungs if isinstance(r.edges, _EdgeCostStore)])
+
+    @property
+    def nbytes(self):
+        """memory used by the graph's joint data and edge costs, in bytes"""
+        return sum([r.nbytes for r in self.rungs])
+
     def get_vert_data(self, rung_id, vert_id):
-        return self.get_rung(rung_id).data[self.dof * vert_id : self.dof * (vert_id+1)]
+        """get a vertex's joint values, as a (dof,) view of the rung's joint array"""
+        return self.get_rung(rung_id).joint_data[vert_id]
 
     def resize(self, rung_number):
         if self.size == 0:
-            self.rungs = [LadderGraphRung(id=None, data=[], edges=[]) for i in range(rung_number)]
+            self.rungs = [LadderGraphRung(id=None, data=[], edges=[], dof=self.dof) for i in range(rung_number)]
             return
         if self.size > 0 and self.size < rung_number:
             # fill in the missing ones with empty rungs
-            self.rungs.extend([LadderGraphRung(id=None, data=[], edges=[]) for i in range(rung_number - self.size)])
+            self.rungs.extend([LadderGraphRung(id=None, data=[], edges=[], dof=self.dof) for i in range(rung_number - self.size)])
             return
         elif self.size > rung_number:
             self.rungs = [r for i, r in enumerate(self.rungs) if i < rung_number]
@@ -81,57 +596,230 @@ class LadderGraph(object):
     def clear(self):
         self.rungs = []
 
+    def replace_rungs(self, rung_st, rung_end, graph):
+        """Replace rungs [rung_st, rung_end) by all the rungs of the given graph (with their edges).
+        The edges at the two boundaries are not rebuilt, see `connect_rungs`.
+        """
+        assert isinstance(graph, LadderGraph) and graph.dof == self.dof
+        assert 0 <= rung_st <= rung_end <= self.size
+        self.rungs[rung_st:rung_end] = graph.rungs
+
     # assign fns
     def assign_rung(self, r_id, sol_lists):
+        """assign joint solutions to a rung, sol_lists can be a list of joint lists
+        or a (n_verts, dof) array (no copy is made for the latter).
+        """
         rung = self.get_rung(r_id)
         rung.id = r_id
-        rung.data = [jt for jt_l in sol_lists for jt in jt_l]
-        assert(len(rung.data) % self.dof == 0)
+        rung.joint_data = _as_joint_array(sol_lists, self.dof)
 
     def assign_edges(self, r_id, edges):
-        # edges_ref = self.get_edges(r_id)
-        self.get_rung(r_id).edges = edges
-
-    # TODO: from_data / to_data
-    # ! but we might need to think about the data format, the data can be large...
+        """assign the edges between rung r_id and r_id+1, edges can be an edge store,
+        a (n_start, n_end) cost matrix (INF for missing edges) or a list of `LadderGraphEdge` lists.
+        """
+        n_end = self.get_rung_vert_size(r_id+1) if r_id+1 < self.size else 0
+        self.get_rung(r_id).edges = as_edge_cost_store(edges, self.get_rung_vert_size(r_id), n_end)
+
+    # binary file IO
+    def to_file(self, file_path, include_edges=True):
+        """Save the ladder graph into a binary file that can be memory-mapped by `from_file`.
+
+        File layout: an 8-byte magic string, the byte length of a JSON header (uint64, little-endian)
+        and the JSON header itself, followed by the raw (little-endian, C-ordered) arrays, each aligned to
+        `LADDER_GRAPH_FILE_ALIGNMENT` bytes: one (n_total_verts, dof) joint value array, the rung offset
+        and size arrays, and optionally the edge cost arrays of each rung pair.
+
+        Parameters
+        ----------
+        file_path : str
+        include_edges : bool, optional
+            save the edge costs, otherwise only the rungs are saved, by default True
+        """
+        rung_sizes = np.array(self.get_vert_sizes(), dtype=np.int64)
+        rung_offsets = np.cumsum(rung_sizes) - rung_sizes
+        arrays = [('rung_offsets', rung_offsets), ('rung_sizes', rung_sizes)]
+        edges_meta = None
+        if include_edges:
+            edges_meta = []
+            for r_id in range(self.size - 1):
+                meta, edge_arrays = _edge_store_to_data(self.get_edges(r_id))
+                arrays.extend([('edges_{}_{}'.format(r_id, name), array) for name, array in edge_arrays])
+                edges_meta.append(meta)
+
+        # the rungs' joint data are written one after another into one joint array,
+        # to avoid building the full joint array in memory
+        joint_data_shape = [int(rung_sizes.sum()), self.dof]
+        header_arrays = {'joint_data' : {'offset' : 0, 'dtype' : '<f8', 'shape' : joint_data_shape}}
+        offset = _align(joint_data_shape[0] * self.dof * 8)
+        for name, array in arrays:
+            header_arrays[name] = {'offset' : offset, 'dtype' : array.dtype.newbyteorder('<').str, 'shape' : list(array.shape)}
+            offset = _align(offset + array.nbytes)
+        header = {'version' : LADDER_GRAPH_FILE_VERSION, 'dof' : self.dof, 'rung_ids' : [r.id for r in self.rungs],
+                  'edges' : edges_meta, 'arrays' : header_arrays}
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = _align(len(LADDER_GRAPH_FILE_MAGIC) + 8 + len(header_bytes))
+        with open(file_path, 'wb') as f:
+            f.write(LADDER_GRAPH_FILE_MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            f.seek(data_start)
+            for r_id in range(self.size):
+                np.ascontiguousarray(self.get_data(r_id), dtype='<f8').tofile(f)
+            for name, array in arrays:
+                f.seek(data_start + header_arrays[name]['offset'])
+                np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tofile(f)
+
+    @classmethod
+    def from_file(cls, file_path, mmap_mode='r'):
+        """Load a ladder graph saved by `to_file`.
+
+        Parameters
+        ----------
+        file_path : str
+        mmap_mode : str, optional
+            mode of the `numpy.memmap` that backs the joint and edge arrays, the graph can then be searched
+            without loading it fully into memory. If None, the arrays are read into memory. By default 'r'
+
+        Returns
+        -------
+        LadderGraph
+        """
+        with open(file_path, 'rb') as f:
+            magic = f.read(len(LADDER_GRAPH_FILE_MAGIC))
+            if magic != LADDER_GRAPH_FILE_MAGIC:
+                raise ValueError('{} is not a ladder graph file!'.format(file_path))
+            header_len, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header['version'] > LADDER_GRAPH_FILE_VERSION:
+            raise ValueError('Unsupported ladder graph file version {}'.format(header['version']))
+        data_start = _align(len(LADDER_GRAPH_FILE_MAGIC) + 8 + header_len)
+        # the file is mapped once, all the arrays are views of this buffer (one file descriptor for the whole graph)
+        buf = np.memmap(file_path, dtype=np.uint8, mode=mmap_mode) if mmap_mode is not None else None
+
+        def load_array(name):
+            info = header['arrays'][name]
+            shape = tuple(info['shape'])
+            dtype = np.dtype(info['dtype'])
+            count = int(np.prod(shape))
+            if count == 0:
+                return np.empty(shape, dtype=dtype)
+            if buf is None:
+                with open(file_path, 'rb') as f:
+                    f.seek(data_start + info['offset'])
+                    return np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+            start = data_start + info['offset']
+            return buf[start : start + count * dtype.itemsize].view(dtype).reshape(shape)
+
+        graph = cls(header['dof'])
+        graph.resize(len(header['rung_ids']))
+        joint_data = load_array('joint_data')
+        rung_offsets = load_array('rung_offsets')
+        rung_sizes = load_array('rung_sizes')
+        for r_id, rung in enumerate(graph.rungs):
+            rung.id = header['rung_ids'][r_id]
+            rung.joint_data = joint_data[rung_offsets[r_id] : rung_offsets[r_id] + rung_sizes[r_id]]
+        if header['edges'] is not None:
+            for r_id, meta in enumerate(header['edges']):
+                arrays = {name : load_array('edges_{}_{}'.format(r_id, name)) for name in meta.get('arrays', [])}
+                graph.get_rung(r_id).edges = _edge_store_from_data(meta, arrays, int(rung_sizes[r_id]), int(rung_sizes[r_id+1]))
+        return graph
 
     def __repr__(self):
         return 'g tot_r_size:{0}, v_sizes:{1}, e_sizes:{2}'.format(self.size, self.get_vert_sizes(), self.get_edge_sizes())
 
     # TODO: insert_rung, clear_rung_edges (maybe not needed at all)
 
+def compute_edge_costs(st_jts, end_jts, preference_cost=1.0, joint_weights=None, upper_tm=None, joint_vel_limits=None):
+    """Compute the costs of all the edges between two rungs with broadcasted array operations.
+
+    The cost of edge (i, j) is the (weighted) L1 joint distance between start vert i and end vert j,
+    scaled by the preference cost. If both `upper_tm` and `joint_vel_limits` are given, an edge is infeasible
+    if any joint needs to move more than `upper_tm * joint_vel_limit` between the two verts, its cost is set to INF.
+
+    Parameters
+    ----------
+    st_jts : (n_start, dof) array
+    end_jts : (n_end, dof) array
+    preference_cost : float, optional
+        multiplier of the joint distance, smaller the more preferrable, by default 1.0
+    joint_weights : list of float, optional
+        per-joint weights of the joint distance, by default None (all ones)
+    upper_tm : float, optional
+        upper bound of the time between two consecutive path points, by default None
+    joint_vel_limits : list of float, optional
+        per-joint velocity limits, by default None
+
+    Returns
+    -------
+    (n_start, n_end) array
+        edge cost matrix, missing edges are marked by INF
+    """
+    st_jts = np.asarray(st_jts, dtype=np.float64)
+    end_jts = np.asarray(end_jts, dtype=np.float64)
+    n_start, n_end = st_jts.shape[0], end_jts.shape[0]
+    max_delta = None
+    if upper_tm is not None and joint_vel_limits is not None:
+        max_delta = upper_tm * np.asarray(joint_vel_limits, dtype=np.float64)
+    weights = np.asarray(joint_weights, dtype=np.float64) if joint_weights is not None else None
+
+    costs = np.empty((n_start, n_end))
+    # chunk the start verts to bound the memory used by the joint deltas
+    chunk_size = max(1, EDGE_COST_CHUNK_SIZE // max(1, n_end * st_jts.shape[1]))
+    for i in range(0, n_start, chunk_size):
+        delta = np.abs(st_jts[i:i+chunk_size, None, :] - end_jts[None, :, :])
+        chunk_costs = delta.sum(axis=2) if weights is None else delta.dot(weights)
+        if max_delta is not None:
+            chunk_costs[np.any(delta > max_delta, axis=2)] = INF
+        costs[i:i+chunk_size] = chunk_costs
+    costs *= preference_cost
+    return costs
+
 class EdgeBuilder(object):
-    """edge builder for ladder graph, construct edges for fully connected biparte graph"""
-    def __init__(self, n_start, n_end, dof, upper_tm=None, joint_vel_limits=None, preference_cost=1.0):
-        self.result_edges_ = [[] for i in range(n_start)]
-        self.edge_scratch_ = [LadderGraphEdge(idx=None, cost=None) for i in range(n_end)] # preallocated space to work on
+    """edge builder for ladder graph, construct edges for fully connected biparte graph
+
+    Edges can be added either pair by pair with `consider` and `next`, or all at once with `consider_all`.
+    """
+    def __init__(self, n_start, n_end, dof, upper_tm=None, joint_vel_limits=None, preference_cost=1.0, joint_weights=None):
+        self.result_costs_ = np.full((n_start, n_end), INF)
+        self.cost_scratch_ = np.full(n_end, INF) # preallocated space to work on
         self.dof_ = dof
         self.count_ = 0
         self.has_edges_ = False
         self.preference_cost = preference_cost
+        self.upper_tm = upper_tm
+        self.joint_vel_limits = joint_vel_limits
+        self.joint_weights = joint_weights
 
     def consider(self, st_jt, end_jt, index):
         """index: to_id"""
-        # TODO check delta joint val exceeds the joint_vel_limits
-        # TODO: use preference_cost here
-        cost = 0
-        for i in range(self.dof_):
-            cost += abs(st_jt[i] - end_jt[i])
-        cost *= self.preference_cost
-        assert(self.count_ < len(self.edge_scratch_))
-        self.edge_scratch_[self.count_].cost = cost
-        self.edge_scratch_[self.count_].idx = index
-        self.count_ += 1
+        cost = compute_edge_costs([st_jt], [end_jt], preference_cost=self.preference_cost, joint_weights=self.joint_weights,
+                                  upper_tm=self.upper_tm, joint_vel_limits=self.joint_vel_limits)[0, 0]
+        assert(self.count_ < len(self.cost_scratch_))
+        if cost < INF:
+            self.cost_scratch_[index] = cost
+            self.count_ += 1
 
     def next(self, i):
-        #TODO: want to do std::move here to transfer memory...
-        self.result_edges_[i] = deepcopy(self.edge_scratch_)
+        self.result_costs_[i, :] = self.cost_scratch_
+        self.cost_scratch_.fill(INF)
         self.has_edges_ = self.has_edges_ or self.count_ > 0
         self.count_ = 0
 
+    def consider_all(self, st_jts, end_jts):
+        """compute the edges between all the start verts (n_start, dof) and end verts (n_end, dof) at once"""
+        assert (len(st_jts), len(end_jts)) == self.result_costs_.shape
+        self.result_costs_ = compute_edge_costs(st_jts, end_jts, preference_cost=self.preference_cost, joint_weights=self.joint_weights,
+                                                upper_tm=self.upper_tm, joint_vel_limits=self.joint_vel_limits)
+        self.has_edges_ = bool(np.isfinite(self.result_costs_).any())
+
     @property
     def result(self):
-        return self.result_edges_
+        edges = EdgeCostMatrix(self.result_costs_)
+        # pruned rung pairs are cheaper to keep in the CSR form
+        if 2 * edges.num_edges < self.result_costs_.size:
+            return edges.to_sparse()
+        return edges
 
     @property
     def has_edges(self):
@@ -140,7 +828,7 @@ class EdgeBuilder(object):
 ######################################
 # ladder graph operations
 
-def append_ladder_graph(current_graph, next_graph):
+def append_ladder_graph(current_graph, next_graph, joint_weights=None, lazy_edges=False):
     """Horizontally connect two given ladder graphs, edges are added between
     all the nodes in current_graph's last rung and next_graph's first rung.
 
@@ -153,6 +841,10 @@ def append_ladder_graph(current_graph, next_graph):
         The first ladder graph
     next_graph : LadderGraph
         The second ladder graph to be appended at the back of the first one.
+    joint_weights : list of float, optional
+        per-joint weights used in the cost of the boundary edges, by default None
+    lazy_edges : bool, optional
+        do not store the boundary edges, their costs are computed on the fly in the DAG search, by default False
 
     Returns
     -------
@@ -163,40 +855,50 @@ def append_ladder_graph(current_graph, next_graph):
     assert(current_graph.dof == next_graph.dof)
 
     cur_size = current_graph.size
-    new_tot_size = cur_size + next_graph.size
-    dof = current_graph.dof
 
-    # just add two sets of rungs together to have a longer ladder graph
-    current_graph.resize(new_tot_size)
-    for i in range(next_graph.size):
-        current_graph.rungs[cur_size + i] = next_graph.rungs[i]
+    # just add two sets of rungs together to have a longer ladder graph, the rungs are shared, not copied
+    current_graph.rungs.extend(next_graph.rungs)
 
     # connect graphs at the boundary
-    a_rung = current_graph.get_rung(cur_size - 1)
-    b_rung = current_graph.get_rung(cur_size)
-    n_st_vert = int(len(a_rung.data) / dof)
-    n_end_vert = int(len(b_rung.data) / dof)
-
-    edge_builder = EdgeBuilder(n_st_vert, n_end_vert, dof)
-    for k in range(n_st_vert):
-        st_id = k * dof
-        for j in range(n_end_vert):
-            end_id = j * dof
-            edge_builder.consider(a_rung.data[st_id : st_id+dof], b_rung.data[end_id : end_id+dof], j)
-        edge_builder.next(k)
-
-    edges_list = edge_builder.result
-    # assert(edge_builder.has_edges)
-    current_graph.assign_edges(cur_size - 1, edges_list)
+    if cur_size > 0 and next_graph.size > 0:
+        connect_rungs(current_graph, cur_size - 1, joint_weights=joint_weights, lazy_edges=lazy_edges)
     return current_graph
 
 
+def connect_rungs(graph, r_id, joint_weights=None, lazy_edges=False):
+    """Fully connect rung r_id to rung r_id+1 of the given graph, the existing edges are replaced.
+
+    Parameters
+    ----------
+    graph : LadderGraph
+    r_id : int
+        start rung id
+    joint_weights : list of float, optional
+        per-joint weights used in the edge cost, by default None
+    lazy_edges : bool, optional
+        do not store the edges, their costs are computed on the fly in the DAG search, by default False
+    """
+    a_jts = graph.get_data(r_id)
+    b_jts = graph.get_data(r_id + 1)
+    if lazy_edges:
+        edges = LazyEdgeCostMatrix.full(len(a_jts), len(b_jts), joint_weights=joint_weights)
+    else:
+        edge_builder = EdgeBuilder(len(a_jts), len(b_jts), graph.dof, joint_weights=joint_weights)
+        edge_builder.consider_all(a_jts, b_jts)
+        edges = edge_builder.result
+    graph.assign_edges(r_id, edges)
+
+
 def concatenate_graph_vertically(graph_above, graph_below):
     """Vertically connect two given ladder graphs by concatenating the rung data.
     No edges will be added, requiring that the two given graphs have the same
     amount of rungs. The old edges will be preserved but the edge indices of the
     second graph will be shifted accordingly.
 
+    No joint value or edge cost is copied: the joint arrays of graph_below are appended to
+    graph_above's rungs as chunks (merged on first access), and the edge stores are stacked
+    in a block-diagonal store, so stacking N graphs one after another is linear in their total size.
+
     Note: this is typically used in concatenating sampled ladder graphs from the
     SAME Cartesian process.
 
@@ -216,18 +918,81 @@ def concatenate_graph_vertically(graph_above, graph_below):
     assert isinstance(graph_below, LadderGraph)
     assert graph_above.size == graph_below.size, 'must have same amount of rungs!'# same number of rungs
     num_rungs = graph_above.size
+    above_vert_sizes = graph_above.get_vert_sizes()
+    below_vert_sizes = graph_below.get_vert_sizes()
     for i in range(num_rungs):
         rung_above = graph_above.get_rung(i)
-        above_jts = graph_above.get_rung(i).data
-        below_jts = graph_below.get_rung(i).data
-        above_jts.extend(below_jts)
         if i != num_rungs - 1:
-            # shifting target vert id in below_edges
-            next_above_rung_size = graph_above.get_rung_vert_size(i + 1)
-            below_edges = graph_below.get_edges(i)
-            for v_out_edges in below_edges:
-                e_copy = deepcopy(v_out_edges)
-                for v_out_e in e_copy:
-                    v_out_e.idx += next_above_rung_size
-                rung_above.edges.append(e_copy)
+            # the target vert ids of the edges below are shifted by the size of the next rung above
+            above_edges = as_edge_cost_store(graph_above.get_edges(i), above_vert_sizes[i], above_vert_sizes[i+1])
+            below_edges = as_edge_cost_store(graph_below.get_edges(i), below_vert_sizes[i], below_vert_sizes[i+1])
+            rung_above.edges = stack_edges_diagonally(above_edges, below_edges, in_place=True)
+        rung_above.append_joint_data(graph_below.get_rung(i).joint_data)
     return graph_above
+
+
+def _merge_edge_store(edges, st_map, end_map, n_start, n_end, st_jts=None, end_jts=None):
+    # map the edges to the merged verts and keep the cheapest edge between two merged verts
+    if isinstance(edges, LazyEdgeCostMatrix):
+        edges = edges.to_sparse(st_jts, end_jts)
+    edges = edges.to_sparse()
+    rows = np.repeat(np.arange(edges.n_start), np.diff(edges.indptr))
+    keys = st_map[rows] * n_end + end_map[edges.indices]
+    order = np.lexsort((edges.costs, keys))
+    sorted_keys = keys[order]
+    keep = order[np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))] if len(keys) > 0 else order
+    new_rows, new_cols = keys[keep] // n_end, keys[keep] % n_end
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(new_rows, minlength=n_start))))
+    return SparseEdgeCostMatrix(indptr, new_cols, edges.costs[keep], n_end)
+
+
+def compact_ladder_graph(graph, tolerance):
+    """Merge the verts of each rung whose joint values are in the same cell of a `tolerance`-sized
+    joint grid, e.g. the near-duplicate IK solutions of vertically stacked pose families.
+    Merged verts are less than `tolerance` apart on each joint, but two verts closer than
+    `tolerance` can fall into neighboring cells and be kept apart.
+
+    The first vert of a cell is kept, with the union of the edges of the merged verts
+    (the cheapest one if several merged edges connect the same two verts). A path can thus switch
+    between stacked pose families at a merged vert. Lazy edges are materialized as sparse edges.
+
+    Parameters
+    ----------
+    graph : LadderGraph
+    tolerance : float
+        joint grid cell size
+
+    Returns
+    -------
+    (LadderGraph, list of ndarray)
+        the compacted graph, and for each rung, the compacted vert id of each vert of the given graph
+    """
+    assert tolerance > 0
+    vert_maps = []
+    rep_ids = []
+    for r_id in range(graph.size):
+        jts = graph.get_data(r_id)
+        if len(jts) == 0:
+            vert_maps.append(np.zeros(0, dtype=np.int64))
+            rep_ids.append(np.zeros(0, dtype=np.int64))
+            continue
+        cells = np.floor(jts / tolerance).astype(np.int64)
+        _, first_ids, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+        # number the merged verts in the order of their first vert
+        order = np.argsort(first_ids, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        vert_maps.append(rank[inverse.reshape(-1)])
+        rep_ids.append(first_ids[order])
+
+    compact_graph = LadderGraph(graph.dof)
+    compact_graph.resize(graph.size)
+    for r_id in range(graph.size):
+        compact_graph.assign_rung(r_id, graph.get_data(r_id)[rep_ids[r_id]])
+    for r_id in range(graph.size - 1):
+        edges = graph.get_edges(r_id)
+        if len(edges) == 0:
+            continue
+        compact_graph.assign_edges(r_id, _merge_edge_store(edges, vert_maps[r_id], vert_maps[r_id+1],
+            len(rep_ids[r_id]), len(rep_ids[r_id+1]), st_jts=graph.get_data(r_id), end_jts=graph.get_data(r_id+1)))
+    return compact_graph, vert_maps
@@ -1,61 +1,193 @@
 import warnings
 import time
-from pybullet_planning import WorldSaver
+from bisect import bisect_right
+
+import numpy as np
+from pybullet_planning import INF, WorldSaver
 from pybullet_planning import joints_from_names, set_joint_positions, wait_for_user
 
 from pychoreo.utils import is_any_empty
-from pychoreo.cartesian_planner.ladder_graph import LadderGraph, EdgeBuilder
-from pychoreo.cartesian_planner.ladder_graph import append_ladder_graph, concatenate_graph_vertically
+from pychoreo.cartesian_planner.ladder_graph import LadderGraph, EdgeBuilder, LazyEdgeCostMatrix
+from pychoreo.cartesian_planner.ladder_graph import append_ladder_graph, concatenate_graph_vertically, compact_ladder_graph
 from pychoreo.cartesian_planner.dag_search import DAGSearch
 from pychoreo.cartesian_planner.postprocessing import divide_list_chunks
 from pychoreo.process_model.trajectory import Trajectory
+from pychoreo.utils.parallel_utils import create_scene_worker_pool, get_worker_cart_proc_list
+from pychoreo.utils.stats_utils import SolverStats
+
+def solve_ladder_graph_from_cartesian_process_list(cart_proc_list, start_conf=None, check_collision=True, verbose=False, viz_inspect=False, warning_pause=True,
+                                                    joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False,
+                                                    scene_builder=None, n_workers=None, scene_builder_kwargs=None, parallel_pose_families=False,
+                                                    lazy_collision=False, return_stats=False, compact_tolerance=None):
+    """Build a ladder graph for each Cartesian process, connect them horizontally and solve
+    for the joint trajectory with the minimal (weighted) joint distance with a DAG search.
+
+    Parameters
+    ----------
+    cart_proc_list : list of CartesianProcess
+    start_conf : list of float, optional
+        if given, the ladder graph solution is minimized with respect to this start configuration, by default None
+    check_collision : bool, optional
+        by default True
+    joint_weights : list of float, optional
+        per-joint weights of the joint distance edge cost, by default None
+    upper_tm : float, optional
+        upper bound of the time between two consecutive path points within a process, used with `joint_vel_limits`
+        to prune infeasible edges, by default None
+    joint_vel_limits : list of float, optional
+        per-joint velocity limits, by default None
+    lazy_edges : bool, optional
+        do not store any edge, the edge costs are computed from the rungs' joint data during the DAG search.
+        This trades some search time for memory on graphs that are too large to materialize, by default False
+    scene_builder : fn, optional
+        if given, the ladder graphs of the processes are built in parallel in a pool of worker processes,
+        see `generate_ladder_graphs_in_parallel`, by default None
+    n_workers : int, optional
+        number of worker processes, by default the number of cpus
+    scene_builder_kwargs : dict, optional
+        keyword arguments of `scene_builder`, by default None
+    parallel_pose_families : bool, optional
+        with `scene_builder`, the processes are built one after another and the pose families of each process
+        are spread across the workers instead, for a few processes with many pose families, by default False
+    lazy_collision : bool, optional
+        build the graph from the IK solutions without collision checking, and only check the verts of the
+        shortest path, see `remove_colliding_path_verts`, by default False
+    return_stats : bool, optional
+        also return a `pychoreo.utils.stats_utils.SolverStats` with the phase wall times, the IK and collision
+        call counts, the graph's vertex and edge counts and memory. With a `scene_builder`, the IK and collision
+        calls made in the worker processes are not measured, by default False
+    compact_tolerance : float, optional
+        merge the verts of each process' rungs that are closer than this joint tolerance,
+        see `pychoreo.cartesian_planner.ladder_graph.compact_ladder_graph`, by default None
 
-def solve_ladder_graph_from_cartesian_process_list(cart_proc_list, start_conf=None, check_collision=True, verbose=False, viz_inspect=False, warning_pause=True):
+    Returns
+    -------
+    list of CartesianProcess
+        with trajectory filled in (None if no feasible path is found), and the SolverStats if `return_stats`
+    """
     world_saver = WorldSaver()
-    st_time = time.time()
+    stats = SolverStats()
+    solve_st_time = st_time = time.time()
     if verbose: print('Start building ladder graph.')
     # * build ladder graph for each cart_proc in the list
     graph_dict = {}
-    for cp_id, cart_proc in enumerate(cart_proc_list):
-        if verbose: print('#{}: {}'.format(cp_id, cart_proc))
-        vertical_graph, vertical_subgraph_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, check_collision=check_collision, viz_inspect=viz_inspect)
+    graph_kwargs = {'check_collision' : check_collision and not lazy_collision, 'joint_weights' : joint_weights, 'upper_tm' : upper_tm,
+                    'joint_vel_limits' : joint_vel_limits, 'lazy_edges' : lazy_edges, 'compact_tolerance' : compact_tolerance}
+    with stats.instrument(cart_proc_list):
+        pool = None
+        try:
+            if scene_builder is not None and parallel_pose_families:
+                pool = create_scene_worker_pool(scene_builder, n_workers=n_workers, scene_builder_kwargs=scene_builder_kwargs)
+                proc_graphs = (generate_ladder_graph_from_cartesian_process(cart_proc, pool=pool, cp_id=cp_id, stats=stats, **graph_kwargs) \
+                    for cp_id, cart_proc in enumerate(cart_proc_list))
+            elif scene_builder is not None:
+                with stats.timer('parallel_build'):
+                    proc_graphs = generate_ladder_graphs_in_parallel(cart_proc_list, scene_builder, n_workers=n_workers,
+                                                                     scene_builder_kwargs=scene_builder_kwargs, **graph_kwargs)
+            else:
+                proc_graphs = (generate_ladder_graph_from_cartesian_process(cart_proc, viz_inspect=viz_inspect, cp_id=cp_id, stats=stats, **graph_kwargs) \
+                    for cp_id, cart_proc in enumerate(cart_proc_list))
+            for cp_id, (cart_proc, (vertical_graph, vertical_subgraph_cnt)) in enumerate(zip(cart_proc_list, proc_graphs)):
+                if verbose: print('#{}: {}'.format(cp_id, cart_proc))
+                stats.count('pose_families', vertical_subgraph_cnt)
+                if vertical_graph.size > 0:
+                    graph_dict[cp_id] = vertical_graph
+                    if verbose: print('#{}-{} #{} pose families formed.'.format(cp_id, cart_proc, vertical_subgraph_cnt))
+                else:
+                    warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(cp_id, cart_proc))
+                    if warning_pause : wait_for_user()
+                # end loop candidates poses for process
+            # end loop all processes
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        if vertical_graph.size > 0:
-            graph_dict[cp_id] = vertical_graph
-            if verbose: print('#{}-{} #{} pose families formed.'.format(cp_id, cart_proc, vertical_subgraph_cnt))
-        else:
-            warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(cp_id, cart_proc))
-            if warning_pause : wait_for_user()
-        # end loop candidates poses for process
-    # end loop all processes
-    world_saver.restore()
+        # * horizontally concatenate the graphs
+        with stats.timer('edges'):
+            unified_graph = concatenate_process_graphs(graph_dict, cart_proc_list[0].dof, start_conf=start_conf,
+                                                       joint_weights=joint_weights, lazy_edges=lazy_edges)
+        record_graph_stats(stats, unified_graph)
+        if verbose: print('ladder graph formed in {} secs (rung size #{}), proceed to DAG search.'.format(time.time()-st_time, unified_graph.get_rungs_size()))
+
+        # * DAG solve for the concatenated graph
+        st_time = time.time()
+        with stats.timer('dag_search'):
+            dag_search = DAGSearch(unified_graph)
+            min_cost = dag_search.run()
+            if check_collision and lazy_collision:
+                rung_points = [None] if start_conf else []
+                for cp_id in sorted(graph_dict):
+                    rung_points.extend([(cart_proc_list[cp_id], sp_id, pt_id) for sp_id, sp in enumerate(cart_proc_list[cp_id].sub_process_list) \
+                        for pt_id in range(sp.path_point_size)])
+                min_cost, checked_verts = remove_colliding_path_verts(dag_search, rung_points)
+                if verbose: print('Lazy collision checking: {} verts checked, {} in collision.'.format(
+                    len(checked_verts), len([v for v in checked_verts.values() if v])))
+            world_saver.restore()
+            # the verts found in collision are removed, no path is left if min_cost is INF
+            tot_traj = dag_search.shortest_path() if min_cost < INF else None
+    if verbose: print('DAG search done in {} secs, cost {}.'.format(time.time()-st_time, min_cost))
+    if tot_traj is None:
+        warnings.warn('Warning: no {}path is found in the ladder graph, no trajectory is assigned!'.format(
+            'collision-free ' if check_collision and lazy_collision else 'feasible '))
+        stats.total_time = time.time() - solve_st_time
+        return (None, stats) if return_stats else None
+    if start_conf:
+        del tot_traj[0]
+
+    # * Divide the contatenated trajectory back to processes
+    with stats.timer('traj_split'):
+        proc_trajs = assign_process_trajectories(cart_proc_list, graph_dict, tot_traj)
+    print({proc_id : len(val) for proc_id, val in proc_trajs.items()})
+    stats.total_time = time.time() - solve_st_time
+    if return_stats:
+        return cart_proc_list, stats
+    return cart_proc_list
+
+def record_graph_stats(stats, graph):
+    """record the vertex and edge counts and the memory of a (unified) ladder graph in a `SolverStats`"""
+    stats.count('rungs', graph.size)
+    stats.count('vertices', graph.get_vert_size())
+    stats.count('edges', graph.get_edge_num())
+    stats.update_graph_memory(graph.nbytes)
+
+def concatenate_process_graphs(graph_dict, dof, start_conf=None, joint_weights=None, lazy_edges=False):
+    """Horizontally concatenate the ladder graphs of the processes (in the order of their ids),
+    after a one-rung graph of the `start_conf` if given.
 
-    # * horizontally concatenate the graphs
-    unified_graph = LadderGraph(vertical_graph.dof)
+    Parameters
+    ----------
+    graph_dict : dict
+        process id -> (vertical) ladder graph of the process
+
+    Returns
+    -------
+    LadderGraph
+    """
+    unified_graph = LadderGraph(dof)
     if start_conf:
-        assert len(start_conf) == vertical_graph.dof
-        st_graph = LadderGraph(vertical_graph.dof)
+        assert len(start_conf) == dof
+        st_graph = LadderGraph(dof)
         st_graph.resize(1)
         st_graph.assign_rung(0, [start_conf])
-        unified_graph = append_ladder_graph(unified_graph, st_graph)
+        unified_graph = append_ladder_graph(unified_graph, st_graph, joint_weights=joint_weights, lazy_edges=lazy_edges)
     for cp_id in sorted(graph_dict):
         g = graph_dict[cp_id]
-        unified_graph = append_ladder_graph(unified_graph, g)
-    if verbose: print('ladder graph formed in {} secs (rung size #{}), proceed to DAG search.'.format(time.time()-st_time, unified_graph.get_rungs_size()))
+        unified_graph = append_ladder_graph(unified_graph, g, joint_weights=joint_weights, lazy_edges=lazy_edges)
+    return unified_graph
 
-    # * DAG solve for the concatenated graph
-    st_time = time.time()
-    dag_search = DAGSearch(unified_graph)
-    min_cost = dag_search.run()
-    tot_traj = dag_search.shortest_path()
-    if verbose: print('DAG search done in {} secs, cost {}.'.format(time.time()-st_time, min_cost))
-    if start_conf:
-        del tot_traj[0]
+def assign_process_trajectories(cart_proc_list, graph_dict, tot_traj):
+    """Divide the trajectory of the concatenated graph (without the start conf) back to the processes
+    of `graph_dict` and their sub-processes.
 
-    # * Divide the contatenated trajectory back to processes
-    proc_trajs = divide_list_chunks(tot_traj, [g.size for g in graph_dict.values()])
-    proc_trajs = {cp_id : traj for cp_id, traj in zip(graph_dict.keys(), proc_trajs)}
-    print({proc_id : len(val) for proc_id, val in proc_trajs.items()})
+    Returns
+    -------
+    dict
+        process id -> trajectory of the process
+    """
+    cp_ids = sorted(graph_dict)
+    proc_trajs = divide_list_chunks(tot_traj, [graph_dict[cp_id].size for cp_id in cp_ids])
+    proc_trajs = {cp_id : traj for cp_id, traj in zip(cp_ids, proc_trajs)}
     for cp_id, proc_traj in proc_trajs.items():
         # divide into subprocesses
         subp_trajs = divide_list_chunks(proc_traj, [sp.path_point_size for sp in cart_proc_list[cp_id].sub_process_list])
@@ -64,13 +196,349 @@ def solve_ladder_graph_from_cartesian_process_list(cart_proc_list, start_conf=No
                 sp.trajectory = Trajectory(cart_proc_list[cp_id].robot, cart_proc_list[cp_id].ik_joints, subp_traj)
             else:
                 sp.trajectory.traj_path = subp_traj
+    return proc_trajs
+
+def get_coarse_point_ids(n_pts, coarse_stride):
+    """ids of the path points kept at the coarse resolution: every `coarse_stride`-th point and the last one"""
+    pt_ids = list(range(0, n_pts, coarse_stride))
+    if n_pts > 0 and pt_ids[-1] != n_pts - 1:
+        pt_ids.append(n_pts - 1)
+    return pt_ids
+
+def _generate_coarse_ladder_graph_from_poses(cart_proc, proc_ee_poses, coarse_pt_ids, check_collision=True,
+                                             joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False):
+    ik_sols = []
+    for sp_id, sp_pt_ids in enumerate(coarse_pt_ids):
+        for pt_id in sp_pt_ids:
+            jt_list = cart_proc.get_point_ik_sols(sp_id, pt_id, proc_ee_poses[sp_id][pt_id], check_collision=check_collision)
+            if not jt_list:
+                return None
+            ik_sols.append(jt_list)
+    preference_cost = cart_proc.preference_cost_eval_fn(proc_ee_poses)
+    return build_ladder_graph_from_ik_sols(ik_sols, cart_proc.dof, preference_cost=preference_cost, joint_weights=joint_weights,
+                                           upper_tm=upper_tm, joint_vel_limits=joint_vel_limits, lazy_edges=lazy_edges)
+
+def _prune_ik_branches(proc_ik_sols, coarse_pt_ids, coarse_confs, branch_radius):
+    # keep the joint sols of a path point that are within branch_radius (max joint difference) of the coarse
+    # solution at one of the two coarse points around it, or all of them if none is
+    coarse_ids = [(sp_id, pt_id) for sp_id, sp_pt_ids in enumerate(coarse_pt_ids) for pt_id in sp_pt_ids]
+    pruned_ik_sols = []
+    for sp_id, sp_ik_sols in enumerate(proc_ik_sols):
+        for pt_id, jt_list in enumerate(sp_ik_sols):
+            k = bisect_right(coarse_ids, (sp_id, pt_id)) - 1
+            near_confs = np.array([coarse_confs[k], coarse_confs[min(k + 1, len(coarse_confs) - 1)]])
+            near_jt_list = [jts for jts in jt_list if \
+                np.min(np.max(np.abs(near_confs - np.asarray(jts, dtype=np.float64)), axis=1)) <= branch_radius]
+            pruned_ik_sols.append(near_jt_list if near_jt_list else jt_list)
+    return pruned_ik_sols
+
+def solve_ladder_graph_coarse_to_fine(cart_proc_list, start_conf=None, check_collision=True, verbose=False, warning_pause=True,
+                                      joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False,
+                                      coarse_stride=4, branch_radius=1.0, check_full=False, info=None):
+    """Coarse-to-fine variant of `solve_ladder_graph_from_cartesian_process_list`.
+
+    The ladder graph is first built and solved with every `coarse_stride`-th path point of each sub-process
+    (and its last one, see `get_coarse_point_ids`) to pick the pose family of each process and the IK branch along it.
+    The graph is then rebuilt at the full resolution with the chosen pose family only, keeping the joint sols
+    within `branch_radius` of the coarse solution around each path point. A process whose chosen pose family
+    is infeasible at the full resolution falls back to all its pose families.
+
+    The result is not guaranteed to be optimal: a pose family or a branch that is only
+    cheaper at the full resolution is missed. Use `check_full` to measure the cost gap.
+
+    Parameters
+    ----------
+    coarse_stride : int, optional
+        path point stride of the coarse resolution, by default 4
+    branch_radius : float, optional
+        maximal joint difference to the coarse solution of the joint sols kept in the refinement,
+        None to keep all the joint sols of the chosen pose family, by default 1.0
+    check_full : bool, optional
+        also solve the full-resolution graph and report the cost difference in `info`, by default False
+    info : dict, optional
+        filled in place with 'coarse_cost', 'cost', 'full_cost', 'cost_gap' (cost - full_cost),
+        'pose_families' (process id -> index of the chosen pose family) and 'fallback_processes', by default None
+
+    The other parameters are the ones of `solve_ladder_graph_from_cartesian_process_list`.
+
+    Returns
+    -------
+    list of CartesianProcess
+        with trajectory filled in, None if no feasible path is found.
+    """
+    assert coarse_stride >= 1
+    info = info if info is not None else {}
+    world_saver = WorldSaver()
+    graph_kwargs = {'check_collision' : check_collision, 'joint_weights' : joint_weights, 'upper_tm' : upper_tm,
+                    'joint_vel_limits' : joint_vel_limits, 'lazy_edges' : lazy_edges}
+    # the coarse edges span coarse_stride path points
+    coarse_graph_kwargs = dict(graph_kwargs, upper_tm=upper_tm * coarse_stride if upper_tm is not None else None)
+    dof = cart_proc_list[0].dof
+
+    # * coarse graphs, with the first rung's vert offset and the ee poses of each stacked pose family
+    st_time = time.time()
+    coarse_graph_dict = {}
+    proc_families = {}
+    proc_coarse_pt_ids = {}
+    for cp_id, cart_proc in enumerate(cart_proc_list):
+        vertical_graph = LadderGraph(dof)
+        families = []
+        for family_id, proc_ee_poses in enumerate(cart_proc.exhaust_iter()):
+            coarse_pt_ids = [get_coarse_point_ids(len(sp_poses), coarse_stride) for sp_poses in proc_ee_poses]
+            graph = _generate_coarse_ladder_graph_from_poses(cart_proc, proc_ee_poses, coarse_pt_ids, **coarse_graph_kwargs)
+            if graph is None or graph.size == 0:
+                continue
+            families.append((vertical_graph.get_rung_vert_size(0) if vertical_graph.size > 0 else 0, family_id, proc_ee_poses))
+            proc_coarse_pt_ids[cp_id] = coarse_pt_ids
+            if vertical_graph.size == 0:
+                vertical_graph = graph
+            else:
+                concatenate_graph_vertically(vertical_graph, graph)
+        if vertical_graph.size > 0:
+            coarse_graph_dict[cp_id] = vertical_graph
+            proc_families[cp_id] = families
+            if verbose: print('#{}-{} #{} pose families formed at the coarse resolution.'.format(cp_id, cart_proc, len(families)))
+        else:
+            warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(cp_id, cart_proc))
+            if warning_pause : wait_for_user()
+
+    coarse_graph = concatenate_process_graphs(coarse_graph_dict, dof, start_conf=start_conf, joint_weights=joint_weights, lazy_edges=lazy_edges)
+    coarse_search = DAGSearch(coarse_graph)
+    info['coarse_cost'] = coarse_search.run()
+    coarse_path_idx = coarse_search.shortest_path_idx()
+    coarse_traj = coarse_search.shortest_path()
+    if verbose: print('coarse graph (rung size #{}) solved in {} secs, cost {}.'.format(
+        coarse_graph.get_rungs_size(), time.time()-st_time, info['coarse_cost']))
+    if coarse_path_idx is None:
+        world_saver.restore()
+        warnings.warn('Warning: no feasible path is found in the coarse ladder graph, no trajectory is assigned!')
+        return None
+
+    # * refine the chosen pose family of each process
+    st_time = time.time()
+    graph_dict = {}
+    info['pose_families'] = {}
+    info['fallback_processes'] = []
+    r_offset = 1 if start_conf else 0
+    for cp_id in sorted(coarse_graph_dict):
+        cart_proc = cart_proc_list[cp_id]
+        coarse_size = coarse_graph_dict[cp_id].size
+        families = proc_families[cp_id]
+        family_id = bisect_right([vert_offset for vert_offset, _, _ in families], coarse_path_idx[r_offset]) - 1
+        _, family_index, proc_ee_poses = families[family_id]
+        coarse_confs = np.array(coarse_traj[r_offset:r_offset+coarse_size], dtype=np.float64)
+        r_offset += coarse_size
+
+        graph = None
+        proc_ik_sols, _ = cart_proc.get_ik_sols(proc_ee_poses, check_collision=check_collision, fail_fast=True)
+        if proc_ik_sols is not None:
+            if branch_radius is not None:
+                ik_sols = _prune_ik_branches(proc_ik_sols, proc_coarse_pt_ids[cp_id], coarse_confs, branch_radius)
+            else:
+                ik_sols = [jts for sp_ik_sols in proc_ik_sols for jts in sp_ik_sols]
+            graph = build_ladder_graph_from_ik_sols(ik_sols, dof, preference_cost=cart_proc.preference_cost_eval_fn(proc_ee_poses),
+                joint_weights=joint_weights, upper_tm=upper_tm, joint_vel_limits=joint_vel_limits, lazy_edges=lazy_edges)
+        if graph is None:
+            # the chosen pose family is infeasible at the full resolution
+            graph, _ = generate_ladder_graph_from_cartesian_process(cart_proc, **graph_kwargs)
+            info['fallback_processes'].append(cp_id)
+            if graph.size == 0:
+                warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(cp_id, cart_proc))
+                if warning_pause : wait_for_user()
+                continue
+        else:
+            info['pose_families'][cp_id] = family_index
+            # the path point sizes are set by the last sampled pose family
+            for sp, sp_poses in zip(cart_proc.sub_process_list, proc_ee_poses):
+                sp.path_point_size = len(sp_poses)
+        graph_dict[cp_id] = graph
+
+    unified_graph = concatenate_process_graphs(graph_dict, dof, start_conf=start_conf, joint_weights=joint_weights, lazy_edges=lazy_edges)
+    dag_search = DAGSearch(unified_graph)
+    info['cost'] = dag_search.run()
+    tot_traj = dag_search.shortest_path()
+    if verbose: print('refined graph (rung size #{}) solved in {} secs, cost {}.'.format(
+        unified_graph.get_rungs_size(), time.time()-st_time, info['cost']))
+
+    info['full_cost'] = info['cost_gap'] = None
+    if check_full:
+        full_graph_dict = {}
+        for cp_id, cart_proc in enumerate(cart_proc_list):
+            full_graph, _ = generate_ladder_graph_from_cartesian_process(cart_proc, **graph_kwargs)
+            if full_graph.size > 0:
+                full_graph_dict[cp_id] = full_graph
+        full_graph = concatenate_process_graphs(full_graph_dict, dof, start_conf=start_conf, joint_weights=joint_weights, lazy_edges=lazy_edges)
+        info['full_cost'] = DAGSearch(full_graph).run()
+        info['cost_gap'] = info['cost'] - info['full_cost']
+        if verbose: print('full resolution cost {}, coarse-to-fine cost gap {}.'.format(info['full_cost'], info['cost_gap']))
+    world_saver.restore()
+
+    if tot_traj is None:
+        warnings.warn('Warning: no feasible path is found in the ladder graph, no trajectory is assigned!')
+        return None
+    if start_conf:
+        del tot_traj[0]
+    proc_trajs = assign_process_trajectories(cart_proc_list, graph_dict, tot_traj)
+    if verbose: print({proc_id : len(val) for proc_id, val in proc_trajs.items()})
     return cart_proc_list
 
-def generate_ladder_graph_from_cartesian_process(cart_proc, check_collision=True, viz_inspect=False):
+def remove_colliding_path_verts(dag_search, rung_points, checked_verts=None, diagnosis=False):
+    """Lazy collision checking on a solved DAG search: only the verts of the current shortest path are
+    collision-checked, the colliding ones are removed from the search (see `DAGSearch.remove_vertices`)
+    and the search is re-solved, until the shortest path is collision-free.
+
+    Parameters
+    ----------
+    dag_search : DAGSearch
+        a DAG search that has been run
+    rung_points : list
+        the (CartesianProcess, sp_id, pt_id) of each rung, whose collision fns are used, or None
+        for the rungs that are not checked (e.g. the start conf)
+    checked_verts : dict, optional
+        (rung id, vert id) -> True if in collision, the results of the previous checks, updated in place, by default None
+    diagnosis : bool, optional
+        passed to the collision fns, by default False
+
+    Returns
+    -------
+    (float, dict)
+        the minimal cost of a collision-free path (INF if none), and checked_verts
+    """
+    assert len(rung_points) == dag_search.graph.size
+    checked_verts = checked_verts if checked_verts is not None else {}
+    while True:
+        colliding_verts = {}
+        path_idx = dag_search.shortest_path_idx()
+        if path_idx is None:
+            return INF, checked_verts
+        for r_id, v_id in enumerate(path_idx):
+            if rung_points[r_id] is None:
+                continue
+            if (r_id, v_id) not in checked_verts:
+                cart_proc, sp_id, pt_id = rung_points[r_id]
+                checked_verts[(r_id, v_id)] = cart_proc.check_point_collision(sp_id, pt_id, dag_search.graph.get_vert_data(r_id, v_id).tolist(),
+                                                                              diagnosis=diagnosis)
+            if checked_verts[(r_id, v_id)]:
+                colliding_verts[r_id] = [v_id]
+        min_cost = dag_search.remove_vertices(colliding_verts)
+        if len(colliding_verts) == 0 or min_cost == INF:
+            return min_cost, checked_verts
+
+def _generate_process_graph_task(args):
+    cp_id, graph_kwargs = args
+    cart_proc = get_worker_cart_proc_list()[cp_id]
+    vertical_graph, vertical_subgraph_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, **graph_kwargs)
+    # the path point sizes are set while sampling the ee poses, they are sent back to the parent's processes
+    return cart_proc.process_name, vertical_graph, vertical_subgraph_cnt, [sp.path_point_size for sp in cart_proc.sub_process_list]
+
+def generate_ladder_graphs_in_parallel(cart_proc_list, scene_builder, n_workers=None, scene_builder_kwargs=None, pool=None, **graph_kwargs):
+    """Run `generate_ladder_graph_from_cartesian_process` for each Cartesian process in a pool of worker processes,
+    each with its own DIRECT pybullet client in which the scene is rebuilt by `scene_builder`
+    (see `pychoreo.utils.parallel_utils.create_scene_worker_pool`).
+
+    Parameters
+    ----------
+    cart_proc_list : list of CartesianProcess
+        the parent's processes, `scene_builder` must build the same processes in the same order
+    scene_builder : fn
+        picklable function that builds the scene in a worker and returns its list of Cartesian processes
+    n_workers : int, optional
+        by default the number of cpus
+    scene_builder_kwargs : dict, optional
+    pool : multiprocessing.pool.Pool, optional
+        an existing pool created by `create_scene_worker_pool`, to avoid rebuilding the scene, by default None
+    graph_kwargs :
+        keyword arguments of `generate_ladder_graph_from_cartesian_process`
+
+    Returns
+    -------
+    list of (LadderGraph, int)
+        vertical graph and number of pose families of each process, in the order of cart_proc_list
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = create_scene_worker_pool(scene_builder, n_workers=n_workers, scene_builder_kwargs=scene_builder_kwargs)
+    try:
+        results = pool.map(_generate_process_graph_task, [(cp_id, graph_kwargs) for cp_id in range(len(cart_proc_list))])
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+    proc_graphs = []
+    for cart_proc, (process_name, vertical_graph, vertical_subgraph_cnt, path_point_sizes) in zip(cart_proc_list, results):
+        assert process_name == cart_proc.process_name, 'process {} built by the scene builder does not match {}!'.format(process_name, cart_proc)
+        for sp, path_point_size in zip(cart_proc.sub_process_list, path_point_sizes):
+            if path_point_size > 0:
+                sp.path_point_size = path_point_size
+        proc_graphs.append((vertical_graph, vertical_subgraph_cnt))
+    return proc_graphs
+
+def _generate_pose_family_graph_task(args):
+    cp_id, proc_ee_poses, graph_kwargs = args
+    return generate_ladder_graph_from_poses(get_worker_cart_proc_list()[cp_id], proc_ee_poses, **graph_kwargs)
+
+def iter_pose_family_graphs_in_parallel(pool, cp_id, proc_ee_poses_iter, chunksize=1, **graph_kwargs):
+    """Evaluate the IK and collisions of pose families of one Cartesian process in a pool of worker processes
+    (created by `pychoreo.utils.parallel_utils.create_scene_worker_pool`), the pose families are sampled on the parent.
+
+    Parameters
+    ----------
+    pool : multiprocessing.pool.Pool
+    cp_id : int
+        index of the Cartesian process in the workers' process list
+    proc_ee_poses_iter : iterator
+        pose families, e.g. `cart_proc.exhaust_iter()`
+    chunksize : int, optional
+        number of pose families sent to a worker at once, by default 1
+    graph_kwargs :
+        keyword arguments of `generate_ladder_graph_from_poses`
+
+    Yields
+    ------
+    LadderGraph or None
+        the sub-graph of each pose family (None if infeasible), in the order of the pose families,
+        as soon as it and all the ones before it are done
+    """
+    tasks = ((cp_id, proc_ee_poses, graph_kwargs) for proc_ee_poses in proc_ee_poses_iter)
+    for graph in pool.imap(_generate_pose_family_graph_task, tasks, chunksize=chunksize):
+        yield graph
+
+def generate_ladder_graph_from_cartesian_process(cart_proc, check_collision=True, viz_inspect=False,
+                                                 joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False,
+                                                 pool=None, cp_id=None, stats=None, compact_tolerance=None, vert_families=None):
+    """Build the ladder graph of a Cartesian process by vertically stacking the sub-graphs of all its pose families.
+
+    If a `pool` of scene workers is given, the pose families are evaluated in parallel
+    (see `iter_pose_family_graphs_in_parallel`), and stacked in the same order as the serial evaluation.
+    `cp_id` is then the index of the process in the workers' process list.
+    The pose generation and graph building times are recorded under `cp_id` in `stats` (a `SolverStats`) if given.
+
+    With `compact_tolerance`, the near-duplicate verts of each rung of the stacked graph (e.g. IK solutions of
+    close yaw samples) are merged, see `compact_ladder_graph`. If a list `vert_families` is given, it is filled
+    with one int array per rung: the index of the pose family (in the `exhaust_iter` order) of each vert of the
+    returned graph, that of the first merged vert for the compacted verts.
+
+    Returns
+    -------
+    (LadderGraph, int)
+        vertical graph, number of feasible pose families
+    """
+    graph_kwargs = {'check_collision' : check_collision, 'joint_weights' : joint_weights, 'upper_tm' : upper_tm,
+                    'joint_vel_limits' : joint_vel_limits, 'lazy_edges' : lazy_edges}
+    proc_ee_poses_iter = cart_proc.exhaust_iter()
+    if stats is not None:
+        proc_ee_poses_iter = stats.timed_iter(proc_ee_poses_iter, 'pose_gen', cp_id=cp_id)
+    if pool is None:
+        family_graphs = (generate_ladder_graph_from_poses(cart_proc, proc_ee_poses, viz_inspect=viz_inspect, stats=stats, cp_id=cp_id, **graph_kwargs) \
+            for proc_ee_poses in proc_ee_poses_iter)
+    else:
+        assert cp_id is not None, 'the process index in the workers\' process list must be given!'
+        family_graphs = iter_pose_family_graphs_in_parallel(pool, cp_id, proc_ee_poses_iter, **graph_kwargs)
+
     vertical_graph = LadderGraph(cart_proc.dof)
     vertical_subgraph_cnt = 0
-    for proc_ee_poses in cart_proc.exhaust_iter():
-        graph = generate_ladder_graph_from_poses(cart_proc, proc_ee_poses, check_collision=check_collision, viz_inspect=viz_inspect)
+    family_labels = []
+    for family_id, graph in enumerate(family_graphs):
         # vertically concatenate graphs, no extra edges added
         if graph and graph.size > 0:
             if vertical_graph.size == 0:
@@ -79,10 +547,30 @@ def generate_ladder_graph_from_cartesian_process(cart_proc, check_collision=True
             else :
                 concatenate_graph_vertically(vertical_graph, graph)
             vertical_subgraph_cnt += 1
+            if vert_families is not None:
+                family_labels.append((family_id, graph.get_vert_sizes()))
+    if vert_families is not None:
+        # the pose family labels are only built if they are asked for
+        rung_families = [np.repeat([family_id for family_id, _ in family_labels], r_sizes).astype(np.int64) \
+            for r_sizes in zip(*[vert_sizes for _, vert_sizes in family_labels])]
+    if compact_tolerance is not None and vertical_graph.size > 0:
+        st_time = time.time()
+        vertical_graph, vert_maps = compact_ladder_graph(vertical_graph, compact_tolerance)
+        if vert_families is not None:
+            # the first merged vert is kept
+            rung_families = [labels[np.unique(vert_map, return_index=True)[1]] for labels, vert_map in zip(rung_families, vert_maps)]
+        if stats is not None:
+            stats.add_time('edges', time.time() - st_time, cp_id=cp_id)
+    if vert_families is not None:
+        vert_families[:] = rung_families
     return vertical_graph, vertical_subgraph_cnt
 
-def generate_ladder_graph_from_poses(cart_proc, proc_ee_poses, check_collision=True, viz_inspect=False):
-    proc_ik_sols = cart_proc.get_ik_sols(proc_ee_poses, check_collision=check_collision)
+def generate_ladder_graph_from_poses(cart_proc, proc_ee_poses, check_collision=True, viz_inspect=False,
+                                     joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False, stats=None, cp_id=None):
+    # stop at the first path point without any joint solution, the pose family would be dropped anyway
+    proc_ik_sols, _ = cart_proc.get_ik_sols(proc_ee_poses, check_collision=check_collision, fail_fast=True)
+    if proc_ik_sols is None:
+        return None
     # flatten ik sols of subprocesses, subprocess semantics can be recovered later based on numbers
     ik_sols = [jts for sp_ik_sols in proc_ik_sols for jts in sp_ik_sols]
 
@@ -90,52 +578,62 @@ def generate_ladder_graph_from_poses(cart_proc, proc_ee_poses, check_collision=T
         # if verbose:
         #     print('no joint solution found at {}'.format(cart_proc))
         return None
-    else:
-        dof = cart_proc.dof
-        robot = cart_proc.robot
-        ik_joint_names = cart_proc.ik_joint_names
-        ik_joints = joints_from_names(robot, ik_joint_names)
-
-        preference_cost = cart_proc.preference_cost_eval_fn(proc_ee_poses)
-
-        graph = LadderGraph(dof)
-        graph.resize(len(ik_sols))
-        # visualize jt sol
-        if viz_inspect:
-            for ik_sol in ik_sols:
-                for ik_jts in ik_sol:
-                    set_joint_positions(robot, ik_joints, ik_jts)
-                    wait_for_user()
-
-        # assign rung data
-        for pt_id, ik_jts_pt in enumerate(ik_sols):
-            graph.assign_rung(pt_id, ik_jts_pt)
-
-        # build edges within current pose family
-        for i in range(graph.get_rungs_size()-1):
-            st_id = i
-            end_id = i + 1
-            jt1_list = graph.get_data(st_id)
-            jt2_list = graph.get_data(end_id)
-            st_size = graph.get_rung_vert_size(st_id)
-            end_size = graph.get_rung_vert_size(end_id)
-            if st_size == 0 or end_size == 0:
-                print(ik_sols)
-
-            assert st_size > 0, 'Ladder graph not valid: rung {}/{} is a zero size rung'.format(st_id, graph.get_rungs_size())
-            assert end_size > 0, 'Ladder graph not valid: rung {}/{} is a zero size rung'.format(end_id, graph.get_rungs_size())
-
-            edge_builder = EdgeBuilder(st_size, end_size, dof, preference_cost=preference_cost)
-            # edge_builder = EdgeBuilder(st_size, end_size, dof)
-            for k in range(st_size):
-                st_id = k * dof
-                for j in range(end_size):
-                    end_id = j * dof
-                    edge_builder.consider(jt1_list[st_id : st_id+dof], jt2_list[end_id : end_id+dof], j)
-                edge_builder.next(k)
-            edges = edge_builder.result
-            # if not edge_builder.has_edges and verbose:
-            #     # TODO: more report information here
-            #     print('no edges!')
+    # visualize jt sol
+    if viz_inspect:
+        ik_joints = joints_from_names(cart_proc.robot, cart_proc.ik_joint_names)
+        for ik_sol in ik_sols:
+            for ik_jts in ik_sol:
+                set_joint_positions(cart_proc.robot, ik_joints, ik_jts)
+                wait_for_user()
+    preference_cost = cart_proc.preference_cost_eval_fn(proc_ee_poses)
+    st_time = time.time()
+    graph = build_ladder_graph_from_ik_sols(ik_sols, cart_proc.dof, preference_cost=preference_cost, joint_weights=joint_weights,
+                                            upper_tm=upper_tm, joint_vel_limits=joint_vel_limits, lazy_edges=lazy_edges)
+    if stats is not None:
+        stats.add_time('edges', time.time() - st_time, cp_id=cp_id)
+    return graph
+
+def build_ladder_graph_from_ik_sols(ik_sols, dof, preference_cost=1.0, joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False):
+    """Build the ladder graph of one pose family from the joint solutions of its path points,
+    one rung per path point, with the edges between consecutive rungs.
+
+    Returns
+    -------
+    LadderGraph
+        None if two consecutive rungs cannot be connected within the joint velocity limits
+    """
+    graph = LadderGraph(dof)
+    graph.resize(len(ik_sols))
+
+    # assign rung data
+    for pt_id, ik_jts_pt in enumerate(ik_sols):
+        graph.assign_rung(pt_id, ik_jts_pt)
+
+    # build edges within current pose family
+    for i in range(graph.get_rungs_size()-1):
+        st_id = i
+        end_id = i + 1
+        jt1_list = graph.get_data(st_id)
+        jt2_list = graph.get_data(end_id)
+        st_size = graph.get_rung_vert_size(st_id)
+        end_size = graph.get_rung_vert_size(end_id)
+
+        assert st_size > 0, 'Ladder graph not valid: rung {}/{} is a zero size rung'.format(st_id, graph.get_rungs_size())
+        assert end_size > 0, 'Ladder graph not valid: rung {}/{} is a zero size rung'.format(end_id, graph.get_rungs_size())
+
+        if lazy_edges:
+            edges = LazyEdgeCostMatrix.full(st_size, end_size, preference_cost=preference_cost,
+                joint_weights=joint_weights, upper_tm=upper_tm, joint_vel_limits=joint_vel_limits)
+            # the costs are not kept, but the pose family is rejected as in the eager mode
+            if not edges.has_edges(jt1_list, jt2_list):
+                return None
             graph.assign_edges(i, edges)
-        return graph
+            continue
+        edge_builder = EdgeBuilder(st_size, end_size, dof, preference_cost=preference_cost,
+                                   upper_tm=upper_tm, joint_vel_limits=joint_vel_limits, joint_weights=joint_weights)
+        edge_builder.consider_all(jt1_list, jt2_list)
+        if not edge_builder.has_edges:
+            # all the transitions between the two rungs violate the joint velocity limits
+            return None
+        graph.assign_edges(i, edge_builder.result)
+    return graph
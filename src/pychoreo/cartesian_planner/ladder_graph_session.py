@@ -0,0 +1,178 @@
+import hashlib
+import time
+import warnings
+
+from pybullet_planning import WorldSaver, wait_for_user
+
+from pychoreo.cartesian_planner.dag_search import DAGSearch
+from pychoreo.cartesian_planner.ladder_graph_interface import generate_ladder_graph_from_cartesian_process, \
+    concatenate_process_graphs, assign_process_trajectories, record_graph_stats
+from pychoreo.utils.cache_utils import quantize_pose
+from pychoreo.utils.stats_utils import SolverStats
+
+def _fn_key(fn):
+    # the cached collision fns are identified by their collision environment, the other fns by identity
+    fingerprint = getattr(fn, 'fingerprint', None)
+    return fingerprint if isinstance(fingerprint, str) else id(fn)
+
+def get_cartesian_process_hash(cart_proc, include_poses=True, pos_tolerance=1e-6, ori_tolerance=1e-6):
+    """Content hash of a Cartesian process: its names, joints, IK, collision and preference fns and,
+    if `include_poses`, the (quantized) ee poses of all its pose families. Two processes with the same hash
+    have the same ladder graph.
+
+    The fns are compared by identity, except for the collision fns with a `fingerprint`
+    (see `pychoreo.utils.cache_utils.CachedCollisionFn`). The ee pose generator is exhausted and reset.
+
+    Returns
+    -------
+    str
+    """
+    content = [cart_proc.process_name, repr(cart_proc.element_identifier), cart_proc.robot, tuple(cart_proc.ik_joint_names),
+               repr(cart_proc.target_conf), id(cart_proc.sample_ik_fn), id(cart_proc.preference_cost_eval_fn)]
+    for sp in cart_proc.sub_process_list:
+        content.append((sp.sub_process_name, _fn_key(sp.collision_fn),
+                        tuple(sorted([(pt_id, _fn_key(fn)) for pt_id, fn in sp.pointwise_collision_fns.items()]))))
+    if include_poses:
+        for proc_ee_poses in cart_proc.exhaust_iter():
+            content.append(tuple([tuple([quantize_pose(pose, pos_tolerance=pos_tolerance, ori_tolerance=ori_tolerance) \
+                for pose in sp_poses]) for sp_poses in proc_ee_poses]))
+    return hashlib.sha1(repr(content).encode('utf-8')).hexdigest()
+
+class LadderGraphSession(object):
+    """Keep the vertical ladder graph of each Cartesian process across solves.
+
+    The graphs are keyed by process identity and content hash (see `get_cartesian_process_hash`),
+    a re-solve with another `start_conf`, a sub-sequence or a new order of already seen processes only
+    reconnects the boundary edges between the processes and reruns the DAG search. A process whose
+    content has changed is rebuilt.
+
+    Parameters
+    ----------
+    check_collision, joint_weights, upper_tm, joint_vel_limits, lazy_edges, compact_tolerance :
+        the graph building options of `solve_ladder_graph_from_cartesian_process_list`, shared by all the solves
+    hash_poses : bool, optional
+        include the ee poses in the content hash, this regenerates the poses of the processes at each solve.
+        If False, the ee pose generators of the processes must not be modified, by default True
+
+    Example
+    -------
+    >>> session = LadderGraphSession(check_collision=True)
+    >>> session.solve(cart_proc_list, start_conf=start_conf)
+    >>> session.solve(cart_proc_list[3:], start_conf=other_conf)  # no graph is rebuilt
+    """
+    def __init__(self, check_collision=True, joint_weights=None, upper_tm=None, joint_vel_limits=None, lazy_edges=False,
+                 compact_tolerance=None, hash_poses=True):
+        self.graph_kwargs = {'check_collision' : check_collision, 'joint_weights' : joint_weights, 'upper_tm' : upper_tm,
+                             'joint_vel_limits' : joint_vel_limits, 'lazy_edges' : lazy_edges, 'compact_tolerance' : compact_tolerance}
+        self.hash_poses = hash_poses
+        # id(cart_proc) -> (cart_proc, content hash, vertical graph, number of pose families, path point sizes)
+        # the process is kept to make sure that its id is not reused
+        self._graphs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_process_graph(self, cart_proc, content_hash=None, viz_inspect=False, stats=None, cp_id=None):
+        """get the cached vertical graph of a process, or build it. `content_hash` is computed if not given,
+        it must be computed with the process' own fns (not wrapped by `SolverStats.instrument`).
+
+        Returns
+        -------
+        (LadderGraph, int)
+            vertical graph, number of feasible pose families
+        """
+        if content_hash is None:
+            content_hash = get_cartesian_process_hash(cart_proc, include_poses=self.hash_poses)
+        entry = self._graphs.get(id(cart_proc))
+        if entry is not None and entry[0] is cart_proc and entry[1] == content_hash:
+            self.hits += 1
+            if stats is not None: stats.count('graph_cache_hits')
+            _, _, vertical_graph, vertical_subgraph_cnt, path_point_sizes = entry
+            for sp, path_point_size in zip(cart_proc.sub_process_list, path_point_sizes):
+                if path_point_size > 0:
+                    sp.path_point_size = path_point_size
+            return vertical_graph, vertical_subgraph_cnt
+        self.misses += 1
+        if stats is not None: stats.count('graph_cache_misses')
+        vertical_graph, vertical_subgraph_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, viz_inspect=viz_inspect,
+            cp_id=cp_id, stats=stats, **self.graph_kwargs)
+        self._graphs[id(cart_proc)] = (cart_proc, content_hash, vertical_graph, vertical_subgraph_cnt,
+                                       [sp.path_point_size for sp in cart_proc.sub_process_list])
+        return vertical_graph, vertical_subgraph_cnt
+
+    def discard(self, cart_proc):
+        """drop the cached graph of a process"""
+        self._graphs.pop(id(cart_proc), None)
+
+    def clear(self):
+        self._graphs.clear()
+        self.hits = self.misses = 0
+
+    @property
+    def nbytes(self):
+        """memory used by the cached graphs, in bytes"""
+        return sum([entry[2].nbytes for entry in self._graphs.values()])
+
+    def __len__(self):
+        return len(self._graphs)
+
+    def solve(self, cart_proc_list, start_conf=None, verbose=False, viz_inspect=False, warning_pause=True, return_stats=False):
+        """same as `solve_ladder_graph_from_cartesian_process_list`, with the cached process graphs
+
+        Returns
+        -------
+        list of CartesianProcess
+            with trajectory filled in (None if no feasible path is found), and the SolverStats if `return_stats`
+        """
+        assert len(cart_proc_list) > 0
+        assert len(set([id(cart_proc) for cart_proc in cart_proc_list])) == len(cart_proc_list), \
+            'a process cannot appear twice in a solve, its graph would be shared.'
+        world_saver = WorldSaver()
+        stats = SolverStats()
+        solve_st_time = time.time()
+        with stats.timer('hash'):
+            content_hashes = [get_cartesian_process_hash(cart_proc, include_poses=self.hash_poses) for cart_proc in cart_proc_list]
+        graph_dict = {}
+        with stats.instrument(cart_proc_list):
+            for cp_id, cart_proc in enumerate(cart_proc_list):
+                vertical_graph, vertical_subgraph_cnt = self.get_process_graph(cart_proc, content_hash=content_hashes[cp_id],
+                    viz_inspect=viz_inspect, stats=stats, cp_id=cp_id)
+                stats.count('pose_families', vertical_subgraph_cnt)
+                if vertical_graph.size > 0:
+                    # the boundary edges to the process after it in a previous solve are dropped
+                    vertical_graph.get_rung(vertical_graph.size - 1).edges = []
+                    graph_dict[cp_id] = vertical_graph
+                else:
+                    warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(cp_id, cart_proc))
+                    if warning_pause : wait_for_user()
+        world_saver.restore()
+        if verbose: print('{} process graphs reused, {} built in {} secs.'.format(
+            stats.counts['graph_cache_hits'], stats.counts['graph_cache_misses'], time.time()-solve_st_time))
+
+        # * horizontally concatenate the graphs, only the boundary edges are built
+        with stats.timer('edges'):
+            unified_graph = concatenate_process_graphs(graph_dict, cart_proc_list[0].dof, start_conf=start_conf,
+                joint_weights=self.graph_kwargs['joint_weights'], lazy_edges=self.graph_kwargs['lazy_edges'])
+        record_graph_stats(stats, unified_graph)
+
+        # * DAG solve for the concatenated graph
+        with stats.timer('dag_search'):
+            dag_search = DAGSearch(unified_graph)
+            min_cost = dag_search.run()
+            tot_traj = dag_search.shortest_path()
+        if verbose: print('DAG search done, cost {}.'.format(min_cost))
+        if tot_traj is None:
+            warnings.warn('Warning: no feasible path is found in the ladder graph, no trajectory is assigned!')
+            stats.total_time = time.time() - solve_st_time
+            return (None, stats) if return_stats else None
+        if start_conf:
+            del tot_traj[0]
+
+        with stats.timer('traj_split'):
+            assign_process_trajectories(cart_proc_list, graph_dict, tot_traj)
+        stats.total_time = time.time() - solve_st_time
+        if return_stats:
+            return cart_proc_list, stats
+        return cart_proc_list
+
+    def __repr__(self):
+        return '{}(#graphs={}, hits={}, misses={})'.format(self.__class__.__name__, len(self), self.hits, self.misses)
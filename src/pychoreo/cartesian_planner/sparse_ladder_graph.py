@@ -1,27 +1,79 @@
 import warnings
 import time
 import random
+import multiprocessing
+from queue import Queue, Empty
+import numpy as np
 
 from pybullet_planning import INF, Pose
 from pybullet_planning import multiply, wait_for_user
 
 from pychoreo.utils import is_any_empty
-from pychoreo.cartesian_planner.ladder_graph import LadderGraph, append_ladder_graph
+from pychoreo.cartesian_planner.ladder_graph import _as_joint_array, EDGE_COST_CHUNK_SIZE
 from pychoreo.cartesian_planner.dag_search import DAGSearch
-from pychoreo.cartesian_planner.ladder_graph_interface import generate_ladder_graph_from_poses
-from pychoreo.cartesian_planner.postprocessing import divide_list_chunks
-from pychoreo.process_model.trajectory import Trajectory
+from pychoreo.cartesian_planner.ladder_graph_interface import generate_ladder_graph_from_poses, concatenate_process_graphs, \
+    assign_process_trajectories, record_graph_stats, build_ladder_graph_from_ik_sols
+from pychoreo.utils.stats_utils import SolverStats
+from pychoreo.utils.parallel_utils import create_scene_worker_pool, get_worker_cart_proc_list, get_pool_size
+
+def compute_cap_vert_distances(parent_verts, child_verts, joint_weights=None):
+    """Distances between CapVerts of two consecutive CapRungs in one vectorized operation:
+    the minimal (weighted) L1 joint distance between an end joint solution of the parent
+    and a start joint solution of the child, multiplied by the child's preference cost.
+
+    Parameters
+    ----------
+    parent_verts : list of CapVert
+    child_verts : list of CapVert
+    joint_weights : list of float, optional
+        per-joint weights of the joint distance, by default None
+
+    Returns
+    -------
+    (len(parent_verts), len(child_verts)) ndarray
+        INF if a CapVert has no joint solution
+    """
+    dists = np.full((len(parent_verts), len(child_verts)), INF)
+    parent_ids = [i for i, v in enumerate(parent_verts) if len(v.end_jt_data) > 0]
+    child_ids = [j for j, v in enumerate(child_verts) if len(v.st_jt_data) > 0]
+    if not parent_ids or not child_ids:
+        return dists
+    end_jts = np.vstack([parent_verts[i].end_jt_data for i in parent_ids])
+    st_jts = np.vstack([child_verts[j].st_jt_data for j in child_ids])
+    weights = np.asarray(joint_weights, dtype=np.float64) if joint_weights is not None else None
+    parent_starts = np.cumsum([0] + [len(parent_verts[i].end_jt_data) for i in parent_ids[:-1]])
+    child_starts = np.cumsum([0] + [len(child_verts[j].st_jt_data) for j in child_ids[:-1]])
+    # min over the joint sols of each child vert, the parent joint sols are chunked
+    # to bound the memory used by the joint deltas (see `compute_edge_costs`)
+    sol_dists = np.empty((len(end_jts), len(child_ids)))
+    chunk_size = max(1, EDGE_COST_CHUNK_SIZE // max(1, st_jts.shape[0] * st_jts.shape[1]))
+    for i in range(0, len(end_jts), chunk_size):
+        deltas = np.abs(end_jts[i:i+chunk_size, np.newaxis, :] - st_jts[np.newaxis, :, :])
+        pair_dists = deltas.sum(axis=2) if weights is None else deltas.dot(weights)
+        sol_dists[i:i+chunk_size] = np.minimum.reduceat(pair_dists, child_starts, axis=1)
+    # min over the joint sols of each parent vert
+    vert_dists = np.minimum.reduceat(sol_dists, parent_starts, axis=0)
+    dists[np.ix_(parent_ids, child_ids)] = vert_dists * np.array([child_verts[j].preference_cost for j in child_ids])
+    return dists
 
 class CapVert(object):
-    def __init__(self, dof, host_rung_id=None):
+    def __init__(self, dof, host_rung_id=None, joint_weights=None):
         self.dof = dof
         self._host_rung_id = host_rung_id
-        self._st_jt_data = []
-        self._end_jt_data = []
+        self.joint_weights = joint_weights
+        self._st_jt_data = _as_joint_array([], dof)
+        self._end_jt_data = _as_joint_array([], dof)
         self._to_parent_cost = INF
         self._parent_vert = None
+        # the accumulated cost to the root, kept up to date when an ancestor is re-parented
+        self._cost_to_root = INF
+        self._child_verts = []
         self._ee_poses = []
         self._preference_cost = 1.0 # smaller the more preferrable
+        # the joint sols of all the path points of ee_poses (over all the sub-processes), packed in one array
+        self._ik_jt_data = None
+        self._ik_sol_sizes = None
+        self._ik_sols_collision_checked = False
 
     @property
     def host_rung_id(self):
@@ -33,19 +85,22 @@ class CapVert(object):
 
     @property
     def st_jt_data(self):
+        """(k, dof) array of the joint solutions of the first path point"""
         return self._st_jt_data
 
     @st_jt_data.setter
     def st_jt_data(self, st_jt_data_):
-        self._st_jt_data = st_jt_data_
+        # nested or flat joint lists are accepted
+        self._st_jt_data = _as_joint_array(st_jt_data_, self.dof)
 
     @property
     def end_jt_data(self):
+        """(k, dof) array of the joint solutions of the last path point"""
         return self._end_jt_data
 
     @end_jt_data.setter
     def end_jt_data(self, end_jt_data_):
-        self._end_jt_data = end_jt_data_
+        self._end_jt_data = _as_joint_array(end_jt_data_, self.dof)
 
     @property
     def ee_poses(self):
@@ -55,6 +110,43 @@ class CapVert(object):
     def ee_poses(self, ee_poses_):
         self._ee_poses = ee_poses_
 
+    @property
+    def ik_sols(self):
+        """list of (k_i, dof) arrays, the joint sols of each path point of ee_poses (flattened over the sub-processes),
+        None if not kept"""
+        if self._ik_jt_data is None:
+            return None
+        return np.split(self._ik_jt_data, np.cumsum(self._ik_sol_sizes)[:-1])
+
+    def set_ik_sols(self, ik_sols, collision_checked=True):
+        """keep the joint sols of the path points, in a compact form
+
+        Parameters
+        ----------
+        ik_sols : list of list of joint values
+            the joint sols of each path point, flattened over the sub-processes
+        collision_checked : bool, optional
+            the joint sols are collision-free, by default True
+        """
+        ik_jt_arrays = [_as_joint_array(jt_list, self.dof) for jt_list in ik_sols]
+        self._ik_sol_sizes = np.array([len(jt_array) for jt_array in ik_jt_arrays], dtype=np.int32)
+        self._ik_jt_data = np.vstack(ik_jt_arrays) if ik_jt_arrays else _as_joint_array([], self.dof)
+        self._ik_sols_collision_checked = collision_checked
+
+    def clear_ik_sols(self):
+        self._ik_jt_data = self._ik_sol_sizes = None
+
+    def has_ik_sols(self, check_collision=True):
+        """the joint sols are kept, and collision-checked if `check_collision`"""
+        return self._ik_jt_data is not None and (self._ik_sols_collision_checked or not check_collision)
+
+    @property
+    def ik_sols_nbytes(self):
+        """memory used by the kept joint sols, in bytes"""
+        if self._ik_jt_data is None:
+            return 0
+        return self._ik_jt_data.nbytes + self._ik_sol_sizes.nbytes
+
     @property
     def preference_cost(self):
         return self._preference_cost
@@ -65,11 +157,14 @@ class CapVert(object):
 
     def distance_to(self, v, to_parent=True):
         """compute distance to CapVert v.
-        The distance is defined by ...
+        The distance is the minimal (weighted) L1 joint distance between an end joint solution of the
+        first vert and a start joint solution of the second one, multiplied by the current vert's preference cost.
 
         Parameters
         ----------
         v : CapVert
+        to_parent : bool, optional
+            v is the parent (first: v -> second: this), otherwise first: this -> second: v, by default True
 
         Returns
         -------
@@ -80,32 +175,13 @@ class CapVert(object):
             return 0
         assert(isinstance(v, CapVert))
         assert(self.dof == v.dof)
-        cost = INF
-        dof = self.dof
-        # TODO: maybe we can get rid of the dof and concatenation here
-        if to_parent:
-            # first: v -> second: this
-            first_end_data = v.end_jt_data
-            second_st_data = self.st_jt_data
-        else:
-            # first: this -> second: v
-            first_end_data = self.end_jt_data
-            second_st_data = v.st_jt_data
-        n_first_end = int(len(first_end_data) / dof)
-        n_second_st = int(len(second_st_data) / dof)
-
-        for i in range(n_first_end):
-            first_end_id = i * dof
-            for j in range(n_second_st):
-                second_st_id = j * dof
-                delta_buffer = []
-                # TODO: assign weight on joints
-                for k in range(dof):
-                    delta_buffer.append(abs(first_end_data[first_end_id + k] - second_st_data[second_st_id + k]))
-                tmp_cost = sum(delta_buffer)
-                if tmp_cost < cost:
-                    cost = tmp_cost
-        return cost * self.preference_cost
+        first, second = (v, self) if to_parent else (self, v)
+        if len(first.end_jt_data) == 0 or len(second.st_jt_data) == 0:
+            return INF
+        deltas = np.abs(first.end_jt_data[:, np.newaxis, :] - second.st_jt_data[np.newaxis, :, :])
+        if self.joint_weights is not None:
+            deltas *= np.asarray(self.joint_weights, dtype=np.float64)
+        return float(deltas.sum(axis=2).min()) * self.preference_cost
 
     @property
     def parent_cost(self):
@@ -114,11 +190,17 @@ class CapVert(object):
     @parent_cost.setter
     def parent_cost(self, c):
         self._to_parent_cost = c
+        self._update_cost_to_root()
 
     @property
     def parent_vert(self):
         return self._parent_vert
 
+    @property
+    def child_verts(self):
+        """the CapVerts whose parent is the current CapVert"""
+        return self._child_verts
+
     @parent_vert.setter
     def parent_vert(self, v):
         """Set the parent vert of current CapVert (with associated edge cost)
@@ -129,17 +211,38 @@ class CapVert(object):
             Parent capsule vertex.
         """
         assert(isinstance(v, CapVert) or v == None)
+        if self._parent_vert is not None:
+            self._parent_vert._child_verts.remove(self)
         self._parent_vert = v
+        if v is not None:
+            v._child_verts.append(self)
         self.parent_cost = self.distance_to(v, to_parent=True)
 
+    def _reparent(self, v, parent_cost, cost_to_root):
+        # set the parent with a known parent cost and cost to root, the descendants are NOT updated
+        if self._parent_vert is not None:
+            self._parent_vert._child_verts.remove(self)
+        self._parent_vert = v
+        if v is not None:
+            v._child_verts.append(self)
+        self._to_parent_cost = parent_cost
+        self._cost_to_root = cost_to_root
+
+    def _update_cost_to_root(self):
+        # recompute the cost of this vert, and push the change down to its descendants
+        stack = [self]
+        while stack:
+            vert = stack.pop()
+            parent_cost_to_root = vert.parent_vert._cost_to_root if vert.parent_vert else 0.0
+            cost_to_root = parent_cost_to_root + vert.parent_cost
+            if vert is not self and cost_to_root == vert._cost_to_root:
+                continue
+            vert._cost_to_root = cost_to_root
+            stack.extend(vert._child_verts)
+
     def get_cost_to_root(self):
-        prev_v = self.parent_vert
-        cost = self.parent_cost
-        while prev_v:
-            if prev_v.parent_vert:
-                cost += prev_v.parent_cost
-            prev_v = prev_v.parent_vert
-        return cost
+        """the sum of the parent costs from this vert to the root, O(1)"""
+        return self._cost_to_root
 
     def __repr__(self):
         return 'CapVert r_id:{}|stJ#{}|endJ#{}|parent_cost:{}|parent rung:{}'.format(
@@ -153,10 +256,11 @@ class CapRung(object):
     a given CapRung.
 
     """
-    def __init__(self, cart_proc=None, rung_id=None):
+    def __init__(self, cart_proc=None, rung_id=None, joint_weights=None):
         self._rung_id = rung_id
         self._cap_verts = []
         self._cart_proc = cart_proc
+        self.joint_weights = joint_weights
 
     @property
     def dof(self):
@@ -178,31 +282,68 @@ class CapRung(object):
     def cartesian_process(self, cartesian_proc_):
         self._cart_proc = cartesian_proc_
 
-    def sample_cap_vert(self, check_collision=True):
+    def sample_cap_vert(self, check_collision=True, keep_ik_sols=False):
+        """sample ee poses and their joint sols, return a CapVert if all the path points have a joint sol, None otherwise.
+        With `keep_ik_sols`, the CapVert keeps the joint sols of all the path points (see `CapVert.set_ik_sols`)."""
         try:
             ee_poses = self.cartesian_process.sample_ee_poses()
         except StopIteration:
             warnings.warn('ee pose gen fn exhausted, we should not plug a finite generator in the SparseLadderGraph. Iterator reset.')
             self.cartesian_process.reset_ee_pose_gen_fn()
             ee_poses = self.cartesian_process.sample_ee_poses()
-        ik_sols = self.cartesian_process.get_ik_sols(ee_poses, check_collision=check_collision)
-        if is_any_empty(ik_sols):
+        ik_sols, _ = self.cartesian_process.get_ik_sols(ee_poses, check_collision=check_collision, fail_fast=True)
+        if ik_sols is None or is_any_empty(ik_sols):
             return None
         else:
-            cap_vert = CapVert(self.dof, host_rung_id=self.rung_id)
-            cap_vert.st_jt_data = [jv for jts in ik_sols[0][0] for jv in jts]
-            cap_vert.end_jt_data = [jv for jts in ik_sols[-1][-1] for jv in jts]
+            cap_vert = CapVert(self.dof, host_rung_id=self.rung_id, joint_weights=self.joint_weights)
+            cap_vert.st_jt_data = ik_sols[0][0]
+            cap_vert.end_jt_data = ik_sols[-1][-1]
             cap_vert.ee_poses = ee_poses
+            if keep_ik_sols:
+                cap_vert.set_ik_sols([jts for sp_ik_sols in ik_sols for jts in sp_ik_sols], collision_checked=check_collision)
             # when poses are sampled, we can assign a multiplier cost to the ee_pose
             # to indicate preference over some pose over the other, and this information
             # can be modelled completely on the cart proc side
             cap_vert.preference_cost = self.cartesian_process.preference_cost_eval_fn(ee_poses)
             return cap_vert
 
+def _sample_cap_verts_task(args):
+    rung_id, check_collision, joint_weights, keep_ik_sols, timeout, max_verts, seed = args
+    # each task has its own seed, the workers do not draw the same samples
+    random.seed(seed)
+    np.random.seed(seed)
+    cap_rung = CapRung(cart_proc=get_worker_cart_proc_list()[rung_id], rung_id=rung_id, joint_weights=joint_weights)
+    cap_verts = []
+    st_time = time.time()
+    while (time.time() - st_time) < timeout and len(cap_verts) < max_verts:
+        cap_vert = cap_rung.sample_cap_vert(check_collision=check_collision, keep_ik_sols=keep_ik_sols)
+        if cap_vert:
+            cap_vert.host_rung_id = rung_id
+            cap_verts.append(cap_vert)
+    return rung_id, cap_verts
+
 class SparseLadderGraph(object):
-    def __init__(self, cart_proc_list):
+    """Sparse ladder graph over a list of Cartesian processes, see `find_sparse_path` and `extract_solution`.
+
+    Parameters
+    ----------
+    cart_proc_list : list of CartesianProcess
+    joint_weights : list of float, optional
+        per-joint weights of the CapVert distance, by default None
+    keep_ik_sols : bool, optional
+        the sampled CapVerts keep the joint sols of all their path points, `extract_solution` builds the unit ladder
+        graphs from them instead of recomputing the IK and collision checks, by default False
+    ik_sols_max_nbytes : int, optional
+        memory cap of the kept joint sols, the CapVerts sampled once it is reached drop their joint sols
+        and their graphs are recomputed at extraction, None for no cap, by default 256 MB
+    """
+    def __init__(self, cart_proc_list, joint_weights=None, keep_ik_sols=False, ik_sols_max_nbytes=2**28):
         assert len(cart_proc_list) > 0 and isinstance(cart_proc_list, list)
-        self._cap_rungs = [CapRung(cart_proc=cart_proc, rung_id=cp_id) for cp_id, cart_proc in enumerate(cart_proc_list)]
+        self.joint_weights = joint_weights
+        self.keep_ik_sols = keep_ik_sols
+        self.ik_sols_max_nbytes = ik_sols_max_nbytes
+        self._ik_sols_nbytes = 0
+        self._cap_rungs = [CapRung(cart_proc=cart_proc, rung_id=cp_id, joint_weights=joint_weights) for cp_id, cart_proc in enumerate(cart_proc_list)]
         # self._cap_rungs = []
         # for cp_id, cart_proc in enumerate(cart_proc_list):
         #     self._cap_rungs.append(CapRung(cart_proc=cart_proc, rung_id=cp_id))
@@ -220,20 +361,94 @@ class SparseLadderGraph(object):
     def cart_proc_list(self):
         return self._cart_proc_list
 
-    def find_sparse_path(self, check_collision=True, vert_timeout=2.0, sparse_sample_timeout=5.0, verbose=False):
+    @property
+    def ik_sols_nbytes(self):
+        """memory used by the joint sols kept in the CapVerts, in bytes"""
+        return self._ik_sols_nbytes
+
+    def _account_ik_sols(self, cap_vert):
+        # keep the joint sols of a new CapVert in the tree within the memory cap
+        nbytes = cap_vert.ik_sols_nbytes
+        if self.ik_sols_max_nbytes is not None and self._ik_sols_nbytes + nbytes > self.ik_sols_max_nbytes:
+            cap_vert.clear_ik_sols()
+        else:
+            self._ik_sols_nbytes += nbytes
+
+    def find_sparse_path(self, check_collision=True, vert_timeout=2.0, sparse_sample_timeout=5.0, verbose=False,
+                         exact_rewire=False, exact_rewire_period=None,
+                         pool=None, scene_builder=None, n_workers=None, scene_builder_kwargs=None, sample_batch_timeout=0.1, seed=None,
+                         worker_timeout=60.0):
+        """Sample CapVerts in the CapRungs, RRT*-style: an initial path is found rung by rung, then new CapVerts are
+        sampled in random CapRungs, connected to their nearest parent and used to repair the next CapRung.
+
+        If a `pool` or a `scene_builder` is given, the CapVerts are sampled by a pool of worker processes, each with its
+        own pybullet client and copy of the scene (see `pychoreo.utils.parallel_utils.create_scene_worker_pool`),
+        the parent process only inserts them in the tree. The initial CapVerts of all the CapRungs are sampled
+        at once, then `n_workers` sampling tasks of `sample_batch_timeout` secs are kept running on random CapRungs
+        until `sparse_sample_timeout`.
+
+        Parameters
+        ----------
+        exact_rewire : bool, optional
+            rewire the tree with `rewire_exact` at the end of the sampling, by default False
+        exact_rewire_period : int, optional
+            also rewire the tree every `exact_rewire_period` sampled CapVerts, by default None
+        pool : multiprocessing.pool.Pool, optional
+            an existing pool created by `create_scene_worker_pool`, by default None
+        scene_builder : fn, optional
+            picklable function that builds the scene in a worker and returns its list of Cartesian processes,
+            in the same order as `cart_proc_list`, used to create a pool if none is given, by default None
+        n_workers : int, optional
+            number of worker processes of the created pool, also the number of sampling tasks kept running,
+            by default the number of cpus, or the size of the given `pool` (see `parallel_utils.get_pool_size`)
+        scene_builder_kwargs : dict, optional
+        sample_batch_timeout : float, optional
+            sampling time of a worker's task on one CapRung, by default 0.1
+        seed : int, optional
+            seed of the CapRung choices and of the workers' tasks, by default None
+        worker_timeout : float, optional
+            time given to a worker's task beyond its sampling time, a RuntimeError is raised if it does not
+            return by then (e.g. a crashed worker), by default 60.0
+
+        Returns
+        -------
+        float
+            the cost of the sparse path
+        """
         if verbose:
             print('sparse graph vert sample timeout: {}, sparse graph sampling timeout : {}'.format(
                 vert_timeout, sparse_sample_timeout))
-
+        own_pool = pool is None and scene_builder is not None
+        if own_pool:
+            pool = create_scene_worker_pool(scene_builder, n_workers=n_workers, scene_builder_kwargs=scene_builder_kwargs)
+        try:
+            if pool is None:
+                return self._find_sparse_path(check_collision, vert_timeout, sparse_sample_timeout, verbose,
+                                              exact_rewire, exact_rewire_period)
+            return self._find_sparse_path_in_parallel(pool, n_workers or get_pool_size(pool), check_collision,
+                vert_timeout, sparse_sample_timeout, verbose, exact_rewire, exact_rewire_period, sample_batch_timeout, seed,
+                worker_timeout)
+        except BaseException:
+            # the tasks of a lost or stuck worker are never done, the pool could not be joined
+            if own_pool:
+                pool.terminate()
+            raise
+        finally:
+            if own_pool:
+                pool.close()
+                pool.join()
+
+    def _find_sparse_path(self, check_collision, vert_timeout, sparse_sample_timeout, verbose, exact_rewire, exact_rewire_period):
         # find an intial solution
         init_sol_st_time = time.time()
         prev_vert = None
         for r_id, cap_rung in enumerate(self.cap_rungs):
             unit_st_time = time.time()
             while (time.time() - unit_st_time) < vert_timeout:
-                cap_vert = cap_rung.sample_cap_vert(check_collision=check_collision)
+                cap_vert = cap_rung.sample_cap_vert(check_collision=check_collision, keep_ik_sols=self.keep_ik_sols)
                 if cap_vert:
                     # if one feasible instance of cap_vert in this rung has been found, break the loop
+                    self._account_ik_sols(cap_vert)
                     cap_vert.parent_vert = prev_vert
                     cap_vert.host_rung_id = r_id
                     cap_rung.cap_verts.append(cap_vert)
@@ -254,34 +469,119 @@ class SparseLadderGraph(object):
             print('RRT* improv starts, comp time:{}'.format(sparse_sample_timeout))
 
         rrt_st_time = time.time()
+        n_sampled = 0
         while (time.time() - rrt_st_time) < sparse_sample_timeout:
             rung_id_sample = random.choice(range(len(self.cap_rungs)))
             sampled_rung = self.cap_rungs[rung_id_sample]
-            new_vert = sampled_rung.sample_cap_vert(check_collision=check_collision)
+            new_vert = sampled_rung.sample_cap_vert(check_collision=check_collision, keep_ik_sols=self.keep_ik_sols)
             if new_vert:
-                # find nearest node in tree
-                c_min = INF
-                nearest_vert = None
-                if rung_id_sample > 0:
-                    for near_vert in self.cap_rungs[rung_id_sample-1].cap_verts:
-                        new_near_cost = near_vert.get_cost_to_root() + new_vert.distance_to(near_vert)
-                        if c_min > new_near_cost:
-                            nearest_vert = near_vert
-                            c_min = new_near_cost
-
-                # add new vert into the tree
-                new_vert.host_rung_id = rung_id_sample
-                new_vert.parent_vert = nearest_vert
-                sampled_rung.cap_verts.append(new_vert)
-
-                # update vert on next rung (repair tree)
-                if rung_id_sample < len(self.cap_rungs)-1:
-                    new_vert_cost = new_vert.get_cost_to_root()
-                    for next_vert in self.cap_rungs[rung_id_sample+1].cap_verts:
-                        old_next_cost = next_vert.get_cost_to_root()
-                        new_next_cost = new_vert_cost + next_vert.distance_to(new_vert)
-                        if old_next_cost > new_next_cost:
-                            next_vert.parent_vert = new_vert
+                self._add_cap_vert(new_vert, rung_id_sample)
+                n_sampled += 1
+                if exact_rewire_period and n_sampled % exact_rewire_period == 0:
+                    self.rewire_exact()
+        return self._finish_sparse_path(exact_rewire, verbose)
+
+    def _find_sparse_path_in_parallel(self, pool, n_tasks, check_collision, vert_timeout, sparse_sample_timeout, verbose,
+                                      exact_rewire, exact_rewire_period, sample_batch_timeout, seed, worker_timeout):
+        rng = random.Random(seed)
+        def get_task(rung_id, timeout, max_verts):
+            return (rung_id, check_collision, self.joint_weights, self.keep_ik_sols, timeout, max_verts, rng.randrange(2**31))
+
+        # find an intial solution, the first CapVert of all the CapRungs are sampled at once
+        init_sol_st_time = time.time()
+        init_tasks = [get_task(r_id, vert_timeout, 1) for r_id in range(len(self.cap_rungs))]
+        # the tasks are queued if there are more CapRungs than workers
+        init_timeout = (vert_timeout + worker_timeout) * int(np.ceil(len(init_tasks) / float(n_tasks)))
+        try:
+            init_results = pool.map_async(_sample_cap_verts_task, init_tasks).get(timeout=init_timeout)
+        except multiprocessing.TimeoutError:
+            raise RuntimeError('The initial CapVerts are not sampled by the workers within {} secs, ' \
+                'a worker might be lost.'.format(init_timeout))
+        prev_vert = None
+        for r_id, cap_verts in init_results:
+            if not cap_verts:
+                print('cap_rung #{}/{} fails to find a feasible sol within timeout {}'.format(r_id, len(self.cap_rungs)-1, vert_timeout))
+                continue
+            cap_vert = cap_verts[0]
+            self._account_ik_sols(cap_vert)
+            cap_vert.parent_vert = prev_vert
+            self.cap_rungs[r_id].cap_verts.append(cap_vert)
+            prev_vert = cap_vert
+
+        initial_cost = self.cap_rungs[-1].cap_verts[0].get_cost_to_root()
+        if verbose:
+            print('initial sol found in {} sec! cost: {}'.format(time.time()-init_sol_st_time, initial_cost))
+            print('RRT* improv starts with {} sampling tasks, comp time:{}'.format(n_tasks, sparse_sample_timeout))
+
+        # the results are collected in the parent's thread in completion order
+        results = Queue()
+        def submit_task():
+            rung_id = rng.randrange(len(self.cap_rungs))
+            pool.apply_async(_sample_cap_verts_task, (get_task(rung_id, sample_batch_timeout, INF),),
+                             callback=results.put, error_callback=results.put)
+
+        rrt_st_time = time.time()
+        n_sampled = 0
+        for _ in range(n_tasks):
+            submit_task()
+        n_pending = n_tasks
+        while n_pending > 0:
+            try:
+                result = results.get(timeout=sample_batch_timeout + worker_timeout)
+            except Empty:
+                raise RuntimeError('No CapVert sampling task has returned within {} secs, a worker might be lost.'.format(
+                    sample_batch_timeout + worker_timeout))
+            n_pending -= 1
+            if isinstance(result, BaseException):
+                raise result
+            rung_id_sample, new_verts = result
+            for new_vert in new_verts:
+                self._add_cap_vert(new_vert, rung_id_sample)
+                n_sampled += 1
+                if exact_rewire_period and n_sampled % exact_rewire_period == 0:
+                    self.rewire_exact()
+            if (time.time() - rrt_st_time) < sparse_sample_timeout:
+                submit_task()
+                n_pending += 1
+        if verbose: print('{} cap_verts sampled by the workers in {} secs.'.format(n_sampled, time.time()-rrt_st_time))
+        return self._finish_sparse_path(exact_rewire, verbose)
+
+    def _add_cap_vert(self, new_vert, rung_id_sample):
+        # connect a new vert to its nearest parent in the tree, and repair the next rung with it
+        sampled_rung = self.cap_rungs[rung_id_sample]
+        # find nearest node in tree
+        c_min = INF
+        nearest_vert = None
+        if rung_id_sample > 0:
+            near_verts = self.cap_rungs[rung_id_sample-1].cap_verts
+            near_dists = compute_cap_vert_distances(near_verts, [new_vert], joint_weights=self.joint_weights)[:, 0]
+            for near_vert, near_dist in zip(near_verts, near_dists):
+                new_near_cost = near_vert.get_cost_to_root() + near_dist
+                if c_min > new_near_cost:
+                    nearest_vert = near_vert
+                    c_min = new_near_cost
+
+        # add new vert into the tree
+        self._account_ik_sols(new_vert)
+        new_vert.host_rung_id = rung_id_sample
+        new_vert.parent_vert = nearest_vert
+        sampled_rung.cap_verts.append(new_vert)
+
+        # update vert on next rung (repair tree)
+        if rung_id_sample < len(self.cap_rungs)-1:
+            new_vert_cost = new_vert.get_cost_to_root()
+            next_verts = self.cap_rungs[rung_id_sample+1].cap_verts
+            next_dists = compute_cap_vert_distances([new_vert], next_verts, joint_weights=self.joint_weights)[0]
+            for next_vert, next_dist in zip(next_verts, next_dists):
+                old_next_cost = next_vert.get_cost_to_root()
+                new_next_cost = new_vert_cost + next_dist
+                if old_next_cost > new_next_cost:
+                    next_vert.parent_vert = new_vert
+
+    def _finish_sparse_path(self, exact_rewire, verbose):
+        if exact_rewire:
+            exact_cost = self.rewire_exact()
+            if verbose: print('Exact rewiring over {} cap_verts: cost {}'.format(sum([len(r.cap_verts) for r in self.cap_rungs]), exact_cost))
 
         last_cap_vert = min(self.cap_rungs[-1].cap_verts, key = lambda x: x.get_cost_to_root())
         rrt_cost = last_cap_vert.get_cost_to_root()
@@ -289,64 +589,107 @@ class SparseLadderGraph(object):
         if verbose: print('Sparse ladder graph done: rrt* sol cost: {}'.format(rrt_cost))
         return rrt_cost
 
-    def extract_solution(self, start_conf=None, check_collision=True, verbose=False, warning_pause=False):
-        """extract ladder graph solution out of a solved sparse path
+    def rewire_exact(self):
+        """Exact layered shortest path over all the sampled CapVerts: each CapVert is re-parented to its
+        best parent in the previous non-empty CapRung (by a vectorized pass over the CapVert distances,
+        see `compute_cap_vert_distances`), so the tree becomes a shortest path tree over the existing samples.
+
+        Returns
+        -------
+        float
+            the minimal cost to the root of the last CapRung's CapVerts
+        """
+        prev_verts = None
+        prev_costs = None
+        for cap_rung in self.cap_rungs:
+            cap_verts = cap_rung.cap_verts
+            if not cap_verts:
+                continue
+            if prev_verts is None:
+                costs = np.zeros(len(cap_verts))
+                for cap_vert in cap_verts:
+                    cap_vert._reparent(None, 0.0, 0.0)
+            else:
+                dists = compute_cap_vert_distances(prev_verts, cap_verts, joint_weights=self.joint_weights)
+                total_costs = prev_costs[:, np.newaxis] + dists
+                best_parents = np.argmin(total_costs, axis=0)
+                costs = total_costs[best_parents, np.arange(len(cap_verts))]
+                # the rungs are rewired in order, the descendants' costs are set when their rung is visited
+                for v_id, (cap_vert, p_id) in enumerate(zip(cap_verts, best_parents)):
+                    cap_vert._reparent(prev_verts[p_id], float(dists[p_id, v_id]), float(costs[v_id]))
+            prev_verts, prev_costs = cap_verts, costs
+        return float(prev_costs.min()) if prev_costs is not None else INF
+
+    def extract_solution(self, start_conf=None, check_collision=True, verbose=False, warning_pause=False, return_stats=False):
+        """extract ladder graph solution out of a solved sparse path.
+        The unit ladder graphs of the CapVerts that kept their joint sols (see `keep_ik_sols`) are built from them,
+        the others are recomputed from the CapVerts' ee poses.
+
+        Parameters
+        ----------
+        return_stats : bool, optional
+            also return a `pychoreo.utils.stats_utils.SolverStats` with the phase wall times, the IK and collision
+            call counts, the graph's vertex and edge counts and memory, by default False
 
         Returns
         -------
         a list of CartesianProcess
-            with trajectory filled in.
+            with trajectory filled in (None if no feasible path is found), and the SolverStats if `return_stats`
         """
-        if verbose: st_time = time.time()
+        stats = SolverStats()
+        solve_st_time = st_time = time.time()
         graph_dict = {}
-        last_cap_vert = min(self.cap_rungs[-1].cap_verts, key = lambda x: x.get_cost_to_root())
-        while last_cap_vert:
-            cap_rung = self.cap_rungs[last_cap_vert.host_rung_id]
-            # TODO: recover full list of path points from the capsulated vertex
-            # poses = [multiply(Pose(point=pt), last_cap_vert.quat_pose) for pt in cap_rung.path_pts]
-            unit_ladder_graph = generate_ladder_graph_from_poses(
-                cap_rung.cartesian_process, last_cap_vert.ee_poses, check_collision=check_collision)
-            if unit_ladder_graph and unit_ladder_graph.size > 0:
-                graph_dict[cap_rung.rung_id] = unit_ladder_graph
-                if verbose: print('#{}-{} ladder graph formed.'.format(cap_rung.rung_id, cap_rung.cartesian_process))
-            else:
-                warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(
-                    cap_rung.rung_id, cap_rung.cartesian_process))
-                if warning_pause : wait_for_user()
-                assert(unit_ladder_graph)
-            last_cap_vert = last_cap_vert.parent_vert
+        with stats.instrument(self.cart_proc_list):
+            last_cap_vert = min(self.cap_rungs[-1].cap_verts, key = lambda x: x.get_cost_to_root())
+            while last_cap_vert:
+                cap_rung = self.cap_rungs[last_cap_vert.host_rung_id]
+                # TODO: recover full list of path points from the capsulated vertex
+                # poses = [multiply(Pose(point=pt), last_cap_vert.quat_pose) for pt in cap_rung.path_pts]
+                # the ee poses might have been sampled by a worker process, see `find_sparse_path`
+                for sp, sp_poses in zip(cap_rung.cartesian_process.sub_process_list, last_cap_vert.ee_poses):
+                    sp.path_point_size = len(sp_poses)
+                if last_cap_vert.has_ik_sols(check_collision=check_collision):
+                    stats.count('ik_sols_reused')
+                    with stats.timer('edges', cp_id=cap_rung.rung_id):
+                        unit_ladder_graph = build_ladder_graph_from_ik_sols(last_cap_vert.ik_sols, last_cap_vert.dof,
+                            preference_cost=last_cap_vert.preference_cost)
+                else:
+                    unit_ladder_graph = generate_ladder_graph_from_poses(
+                        cap_rung.cartesian_process, last_cap_vert.ee_poses, check_collision=check_collision, stats=stats, cp_id=cap_rung.rung_id)
+                if unit_ladder_graph and unit_ladder_graph.size > 0:
+                    graph_dict[cap_rung.rung_id] = unit_ladder_graph
+                    if verbose: print('#{}-{} ladder graph formed.'.format(cap_rung.rung_id, cap_rung.cartesian_process))
+                else:
+                    warnings.warn('Warning: cart proce #{}-{} does not have any valid joint sols to form rungs!'.format(
+                        cap_rung.rung_id, cap_rung.cartesian_process))
+                    if warning_pause : wait_for_user()
+                    assert(unit_ladder_graph)
+                last_cap_vert = last_cap_vert.parent_vert
 
         # * horizontally concatenate the graphs
-        unified_graph = LadderGraph(unit_ladder_graph.dof)
-        if start_conf:
-            assert len(start_conf) == unit_ladder_graph.dof
-            st_graph = LadderGraph(unit_ladder_graph.dof)
-            st_graph.resize(1)
-            st_graph.assign_rung(0, [start_conf])
-            unified_graph = append_ladder_graph(unified_graph, st_graph)
-        for cp_id in sorted(graph_dict):
-            g = graph_dict[cp_id]
-            unified_graph = append_ladder_graph(unified_graph, g)
+        with stats.timer('edges'):
+            unified_graph = concatenate_process_graphs(graph_dict, unit_ladder_graph.dof, start_conf=start_conf)
+        record_graph_stats(stats, unified_graph)
         if verbose: print('ladder graph formed in {} secs (rung size #{}), proceed to DAG search.'.format(time.time()-st_time, unified_graph.get_rungs_size()))
 
         # * DAG solve for the concatenated graph
         st_time = time.time()
-        dag_search = DAGSearch(unified_graph)
-        min_cost = dag_search.run()
-        tot_traj = dag_search.shortest_path()
+        with stats.timer('dag_search'):
+            dag_search = DAGSearch(unified_graph)
+            min_cost = dag_search.run()
+            tot_traj = dag_search.shortest_path()
         if verbose: print('DAG search done in {} secs, cost {}.'.format(time.time()-st_time, min_cost))
+        if tot_traj is None:
+            warnings.warn('Warning: no feasible path is found in the ladder graph, no trajectory is assigned!')
+            stats.total_time = time.time() - solve_st_time
+            return (None, stats) if return_stats else None
         if start_conf:
             del tot_traj[0]
 
         # * Divide the contatenated trajectory back to processes
-        proc_trajs = divide_list_chunks(tot_traj, [graph_dict[cp_id].size for cp_id in sorted(graph_dict)])
-        proc_trajs = {cp_id : traj for cp_id, traj in zip(sorted(graph_dict), proc_trajs)}
-        for cp_id, proc_traj in proc_trajs.items():
-            # divide into subprocesses
-            subp_trajs = divide_list_chunks(proc_traj, [sp.path_point_size for sp in self.cart_proc_list[cp_id].sub_process_list])
-            for sp, subp_traj in zip(self.cart_proc_list[cp_id].sub_process_list, subp_trajs):
-                if sp.trajectory is None:
-                    sp.trajectory = Trajectory(self.cart_proc_list[cp_id].robot, self.cart_proc_list[cp_id].ik_joints, subp_traj)
-                else:
-                    sp.trajectory.traj_path = subp_traj
+        with stats.timer('traj_split'):
+            assign_process_trajectories(self.cart_proc_list, graph_dict, tot_traj)
+        stats.total_time = time.time() - solve_st_time
+        if return_stats:
+            return self.cart_proc_list, stats
         return self.cart_proc_list
@@ -1,11 +1,13 @@
 import random
 import warnings
+from collections import Counter, deque
 from copy import copy
 from itertools import product, tee
 
 from pybullet_planning import multiply, set_pose, get_movable_joints, joints_from_names, get_joint_limits, snap_sols
 
 from pychoreo.process_model.gen_fn import CartesianPoseGenFn
+from pychoreo.utils.cache_utils import CachedSampleIKFn
 
 # EE domain (can be directions, or directly poses)
 # EE gen fn
@@ -51,6 +53,39 @@ def _NULL_COLLISION_FN(conf):
 def _NULL_PREFERNCE_FN(sampled_poses):
     return 1.0
 
+def get_probe_order(n_pts, probe_order='bisect'):
+    """Order in which the path points are evaluated by a fail-fast IK evaluation.
+
+    Parameters
+    ----------
+    n_pts : int
+        number of path points
+    probe_order : str or list of int, optional
+        'bisect': the two endpoints first, then the midpoints of the remaining intervals, breadth-first,
+        'sequential': in the path order, or a permutation of range(n_pts), by default 'bisect'
+
+    Returns
+    -------
+    list of int
+    """
+    if probe_order == 'sequential':
+        return list(range(n_pts))
+    if probe_order == 'bisect':
+        order = list(range(min(n_pts, 1))) + ([n_pts - 1] if n_pts > 1 else [])
+        intervals = deque([(0, n_pts - 1)])
+        while intervals:
+            lo, hi = intervals.popleft()
+            if hi - lo < 2:
+                continue
+            mid = (lo + hi) // 2
+            order.append(mid)
+            intervals.extend([(lo, mid), (mid, hi)])
+        return order
+    order = list(probe_order)
+    if sorted(order) != list(range(n_pts)):
+        raise ValueError('probe order {} is not a permutation of the {} path points!'.format(probe_order, n_pts))
+    return order
+
 class CartesianSubProcess(object):
     def __init__(self, sub_process_name='',
                  collision_fn=_NULL_COLLISION_FN, pointwise_collision_fns={}):
@@ -123,6 +158,8 @@ class CartesianProcess(object):
         self._trajectory = None
         self._target_conf = target_conf
         self._preference_cost_eval_fn = preference_cost_eval_fn
+        # (sp_id, pt_id) -> number of fail-fast IK evaluations that stopped at this path point
+        self._ik_failure_counts = Counter()
 
     @property
     def robot(self):
@@ -198,6 +235,17 @@ class CartesianProcess(object):
     def sample_ik_fn(self, sample_ik_fn_):
         self._sample_ik_fn = sample_ik_fn_
 
+    def enable_ik_cache(self, **cache_kwargs):
+        """wrap `sample_ik_fn` with an IK cache keyed by quantized pose, see `pychoreo.utils.cache_utils.CachedSampleIKFn`
+
+        Returns
+        -------
+        CachedSampleIKFn
+        """
+        if not isinstance(self.sample_ik_fn, CachedSampleIKFn):
+            self.sample_ik_fn = CachedSampleIKFn(self.sample_ik_fn, **cache_kwargs)
+        return self.sample_ik_fn
+
     def reset_ee_pose_gen_fn(self):
         self.ee_pose_gen_fn.reset()
 
@@ -243,20 +291,70 @@ class CartesianProcess(object):
             except StopIteration:
                 break
 
-    def get_ik_sols(self, ee_poses, check_collision=True, diagnosis=False):
+    @property
+    def ik_failure_counts(self):
+        """number of fail-fast `get_ik_sols` calls that stopped at each path point (sp_id, pt_id)"""
+        return self._ik_failure_counts
+
+    def check_point_collision(self, sp_id, pt_id, conf, diagnosis=False):
+        """check a joint conf of one path point of a sub-process against the sub-process' collision fn
+        and the point's own collision fn if any, return True if in collision"""
+        sub_process = self.sub_process_list[sp_id]
+        if sub_process.collision_fn(conf, diagnosis=diagnosis):
+            return True
+        return pt_id in sub_process.pointwise_collision_fns and sub_process.pointwise_collision_fns[pt_id](conf)
+
+    def get_point_ik_sols(self, sp_id, pt_id, ee_pose, check_collision=True, diagnosis=False):
+        """get the (collision-free) joint solutions of one path point of a sub-process"""
+        jt_list = self.sample_ik_fn(ee_pose)
+        if self.target_conf:
+            jt_list = snap_sols(jt_list, self.target_conf, self.ik_joint_limits)
+        if check_collision:
+            jt_list = [jts for jts in jt_list if jts and not self.check_point_collision(sp_id, pt_id, jts, diagnosis=diagnosis)]
+        return jt_list
+
+    def get_ik_sols(self, ee_poses, check_collision=True, diagnosis=False, fail_fast=False, probe_order='bisect'):
+        """Get the joint solutions of all the path points of all the sub-processes.
+
+        Parameters
+        ----------
+        ee_poses : list of list of Pose
+            ee poses of each sub-process
+        check_collision : bool, optional
+            by default True
+        diagnosis : bool, optional
+            passed to the collision fns, by default False
+        fail_fast : bool, optional
+            stop at the first path point without any valid joint solution, by default False
+        probe_order : str or list of int, optional
+            order in which the path points (indexed across all the sub-processes) are evaluated in the
+            fail-fast mode, see `get_probe_order`. 'failures_first' probes the points where previous fail-fast
+            evaluations stopped most often first, then the others in the 'bisect' order. By default 'bisect'
+
+        Returns
+        -------
+        list of list of list of float
+            the joint solutions of each path point of each sub-process. In the fail-fast mode,
+            a tuple (joint solutions or None, the (sp_id, pt_id) of the point without solution or None)
+        """
         assert len(ee_poses) == len(self.sub_process_list), 'sampled ee poses size ({}) not equal to the number of sub_processes ({})!'.format(len(ee_poses), len(self.sub_process_list))
-        sp_pt_ids = list(zip(range(len(self.sub_process_list)), [list(range(len(sp_poses))) for sp_poses in ee_poses]))
-        full_jt_list = [[] for _ in range(len(sp_pt_ids))]
-        for sp_id, pt_ids in sp_pt_ids:
-            for pt_id in pt_ids:
-                jt_list = self.sample_ik_fn(ee_poses[sp_id][pt_id])
-                if self.target_conf:
-                    jt_list = snap_sols(jt_list, self.target_conf, self.ik_joint_limits)
-                if check_collision:
-                    jt_list = [jts for jts in jt_list if jts and not self.sub_process_list[sp_id].collision_fn(jts, diagnosis=diagnosis)]
-                    if pt_id in self.sub_process_list[sp_id].pointwise_collision_fns:
-                        jt_list = [jts for jts in jt_list if not self.sub_process_list[sp_id].pointwise_collision_fns[pt_id](jts)]
-                full_jt_list[sp_id].append(jt_list)
+        sp_pt_ids = [(sp_id, pt_id) for sp_id, sp_poses in enumerate(ee_poses) for pt_id in range(len(sp_poses))]
+        full_jt_list = [[None] * len(sp_poses) for sp_poses in ee_poses]
+        if not fail_fast:
+            pt_order = range(len(sp_pt_ids))
+        elif probe_order == 'failures_first':
+            pt_order = sorted(get_probe_order(len(sp_pt_ids)), key=lambda i: -self._ik_failure_counts[sp_pt_ids[i]])
+        else:
+            pt_order = get_probe_order(len(sp_pt_ids), probe_order)
+        for i in pt_order:
+            sp_id, pt_id = sp_pt_ids[i]
+            jt_list = self.get_point_ik_sols(sp_id, pt_id, ee_poses[sp_id][pt_id], check_collision=check_collision, diagnosis=diagnosis)
+            if fail_fast and not jt_list:
+                self._ik_failure_counts[(sp_id, pt_id)] += 1
+                return None, (sp_id, pt_id)
+            full_jt_list[sp_id][pt_id] = jt_list
+        if fail_fast:
+            return full_jt_list, None
         return full_jt_list
 
     def __repr__(self):
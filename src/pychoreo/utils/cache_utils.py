@@ -0,0 +1,271 @@
+import hashlib
+import shelve
+from collections import OrderedDict
+
+import numpy as np
+from pybullet_planning import get_pose, get_collision_fn
+
+class LRUCache(object):
+    """A bounded in-memory key-value cache with least-recently-used eviction and hit/miss counters.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        maximal number of entries kept in memory, None for unbounded, by default 100000
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """get a cached value and count the hit or miss"""
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while self.max_size is not None and len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        queries = self.hits + self.misses
+        return self.hits / float(queries) if queries > 0 else 0.0
+
+    @property
+    def stats(self):
+        return {'size' : len(self._data), 'max_size' : self.max_size, 'hits' : self.hits, 'misses' : self.misses,
+                'evictions' : self.evictions, 'hit_rate' : self.hit_rate}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '{}(size={}, hits={}, misses={})'.format(self.__class__.__name__, len(self), self.hits, self.misses)
+
+######################################
+# IK cache
+
+def quantize_pose(pose, pos_tolerance=1e-6, ori_tolerance=1e-6):
+    """Quantize a pybullet pose ((x, y, z), (qx, qy, qz, qw)) into a hashable key, two poses closer than
+    the tolerances (per coordinate) usually share the same key. q and -q describe the same rotation,
+    so the quaternion is flipped to have a positive first non-zero component.
+
+    Returns
+    -------
+    tuple of int
+    """
+    point, quat = pose
+    quat = np.asarray(quat, dtype=np.float64)
+    nonzero = np.flatnonzero(np.abs(quat) > ori_tolerance / 2)
+    if len(nonzero) > 0 and quat[nonzero[0]] < 0:
+        quat = -quat
+    return tuple(np.round(np.asarray(point, dtype=np.float64) / pos_tolerance).astype(np.int64).tolist()) + \
+        tuple(np.round(quat / ori_tolerance).astype(np.int64).tolist())
+
+class CachedSampleIKFn(object):
+    """Drop-in replacement of a `sample_ik_fn`, the joint solutions are cached by quantized TCP pose
+    (see `quantize_pose`) in a `LRUCache`, and optionally in an on-disk `shelve` store that is kept
+    across runs (single writer only).
+
+    Parameters
+    ----------
+    sample_ik_fn : fn
+        pose -> list of joint solutions
+    pos_tolerance : float, optional
+        position quantization step (m), by default 1e-6
+    ori_tolerance : float, optional
+        quaternion quantization step, by default 1e-6
+    max_size : int, optional
+        maximal number of poses kept in memory, by default 100000
+    disk_path : str, optional
+        file path of the on-disk store, by default None
+    namespace : str, optional
+        prefix of the on-disk keys, e.g. robot and tool names, to share one store between several IK fns, by default ''
+    """
+    def __init__(self, sample_ik_fn, pos_tolerance=1e-6, ori_tolerance=1e-6, max_size=100000, disk_path=None, namespace=''):
+        self.sample_ik_fn = sample_ik_fn
+        self.pos_tolerance = pos_tolerance
+        self.ori_tolerance = ori_tolerance
+        self.cache = LRUCache(max_size=max_size)
+        self.namespace = namespace
+        self.disk_hits = 0
+        self._disk = shelve.open(disk_path) if disk_path else None
+
+    def pose_key(self, pose):
+        return quantize_pose(pose, pos_tolerance=self.pos_tolerance, ori_tolerance=self.ori_tolerance)
+
+    def _disk_key(self, key):
+        return '{}|{}|{}|{}'.format(self.namespace, self.pos_tolerance, self.ori_tolerance, key)
+
+    def __call__(self, pose):
+        key = self.pose_key(pose)
+        jt_list = self.cache.get(key)
+        if jt_list is None and self._disk is not None:
+            disk_key = self._disk_key(key)
+            if disk_key in self._disk:
+                jt_list = self._disk[disk_key]
+                self.disk_hits += 1
+                self.cache.put(key, jt_list)
+        if jt_list is None:
+            jt_list = [list(jts) if jts is not None else None for jts in self.sample_ik_fn(pose)]
+            self.cache.put(key, jt_list)
+            if self._disk is not None:
+                self._disk[self._disk_key(key)] = jt_list
+        # the callers may modify the returned lists
+        return [list(jts) if jts is not None else None for jts in jt_list]
+
+    @property
+    def stats(self):
+        stats = self.cache.stats
+        # a disk hit is first counted as a memory miss
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.cache)
+
+def enable_shared_ik_cache(cart_proc_list, **cache_kwargs):
+    """Wrap the `sample_ik_fn` of the given Cartesian processes with `CachedSampleIKFn`, the processes that
+    share the same `sample_ik_fn` also share the same cache.
+
+    Parameters
+    ----------
+    cart_proc_list : list of CartesianProcess
+    cache_kwargs :
+        keyword arguments of `CachedSampleIKFn`
+
+    Returns
+    -------
+    list of CachedSampleIKFn
+        the created caches
+    """
+    caches = {}
+    for cart_proc in cart_proc_list:
+        sample_ik_fn = cart_proc.sample_ik_fn
+        if isinstance(sample_ik_fn, CachedSampleIKFn):
+            continue
+        if id(sample_ik_fn) not in caches:
+            caches[id(sample_ik_fn)] = CachedSampleIKFn(sample_ik_fn, **cache_kwargs)
+        cart_proc.sample_ik_fn = caches[id(sample_ik_fn)]
+    return list(caches.values())
+
+######################################
+# collision cache
+
+def _quantize(values, tolerance):
+    return tuple(np.round(np.asarray(values, dtype=np.float64) / tolerance).astype(np.int64).tolist())
+
+def get_collision_env_fingerprint(body, joints, obstacles=[], attachments=[], self_collisions=True,
+                                  disabled_collisions={}, extra_disabled_collisions={}, custom_limits={}, pose_tolerance=1e-6):
+    """Fingerprint of a collision checking environment: the moving body and joints, the obstacle bodies
+    and their current poses, the attachments, the disabled collision pairs and the joint limits.
+    The arguments are the ones of `pybullet_planning.get_collision_fn`.
+
+    Returns
+    -------
+    str
+        a digest that is the same for two environments with the same collision results
+    """
+    env = (body, tuple(joints),
+           tuple(sorted([(ob, _quantize(get_pose(ob)[0], pose_tolerance), _quantize(get_pose(ob)[1], pose_tolerance)) for ob in set(obstacles)])),
+           tuple([(at.parent, at.parent_link, at.child, _quantize(at.grasp_pose[0], pose_tolerance), _quantize(at.grasp_pose[1], pose_tolerance)) \
+               for at in attachments]),
+           bool(self_collisions),
+           tuple(sorted([repr(pair) for pair in disabled_collisions])),
+           tuple(sorted([repr(pair) for pair in extra_disabled_collisions])),
+           tuple(sorted([repr(item) for item in custom_limits.items()])))
+    return hashlib.sha1(repr(env).encode('utf-8')).hexdigest()
+
+class CachedCollisionFn(object):
+    """Memoizing wrapper of a collision fn, the results are cached by (environment fingerprint, quantized conf)
+    in a `LRUCache` that can be shared between collision fns: two collision fns with the same environment
+    fingerprint (see `get_collision_env_fingerprint`) share their results.
+
+    Calls with `diagnosis=True` bypass the cache, so that the collision fn can report the colliding pairs.
+    The calls with other keyword arguments also bypass it, their results might differ from the cached ones.
+
+    Parameters
+    ----------
+    collision_fn : fn
+        conf -> True if in collision
+    fingerprint_fn : fn
+        () -> the fingerprint of the collision fn's environment
+    conf_tolerance : float, optional
+        joint value quantization step, by default 1e-6
+    cache : LRUCache, optional
+        a (shared) cache, by default a new one
+    max_size : int, optional
+        size of the new cache, by default 100000
+    static_env : bool, optional
+        the environment fingerprint is computed once, otherwise at each call to track moving obstacles, by default True
+    """
+    def __init__(self, collision_fn, fingerprint_fn, conf_tolerance=1e-6, cache=None, max_size=100000, static_env=True):
+        self.collision_fn = collision_fn
+        self.fingerprint_fn = fingerprint_fn
+        self.conf_tolerance = conf_tolerance
+        self.cache = cache if cache is not None else LRUCache(max_size=max_size)
+        self._fingerprint = fingerprint_fn() if static_env else None
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint if self._fingerprint is not None else self.fingerprint_fn()
+
+    def __call__(self, conf, diagnosis=False, **kwargs):
+        if diagnosis or kwargs:
+            return self.collision_fn(conf, diagnosis=diagnosis, **kwargs)
+        key = (self.fingerprint, _quantize(conf, self.conf_tolerance))
+        is_colliding = self.cache.get(key)
+        if is_colliding is None:
+            is_colliding = bool(self.collision_fn(conf))
+            self.cache.put(key, is_colliding)
+        return is_colliding
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.cache)
+
+def get_cached_collision_fn(body, joints, obstacles=[], attachments=[], self_collisions=True,
+                            disabled_collisions={}, extra_disabled_collisions={}, custom_limits={},
+                            conf_tolerance=1e-6, cache=None, static_env=True, **kwargs):
+    """`pybullet_planning.get_collision_fn` with a memoizing layer, see `CachedCollisionFn`.
+    The environment fingerprint is built from the same arguments.
+
+    Returns
+    -------
+    CachedCollisionFn
+    """
+    # the obstacle and attachment lists might be modified later by the caller
+    obstacles = list(obstacles)
+    attachments = list(attachments)
+    collision_fn = get_collision_fn(body, joints, obstacles=obstacles, attachments=attachments, self_collisions=self_collisions,
+                                    disabled_collisions=disabled_collisions, extra_disabled_collisions=extra_disabled_collisions,
+                                    custom_limits=custom_limits, **kwargs)
+    def fingerprint_fn():
+        return get_collision_env_fingerprint(body, joints, obstacles=obstacles, attachments=attachments, self_collisions=self_collisions,
+            disabled_collisions=disabled_collisions, extra_disabled_collisions=extra_disabled_collisions, custom_limits=custom_limits)
+    return CachedCollisionFn(collision_fn, fingerprint_fn, conf_tolerance=conf_tolerance, cache=cache, static_env=static_env)
@@ -0,0 +1,58 @@
+import multiprocessing
+import weakref
+
+from pybullet_planning import connect
+
+# the Cartesian processes rebuilt in the scene of the current worker process
+_WORKER_CART_PROC_LIST = None
+# pool -> number of workers, of the pools created in the current process
+_POOL_SIZES = weakref.WeakKeyDictionary()
+
+def _init_scene_worker(scene_builder, scene_builder_kwargs):
+    global _WORKER_CART_PROC_LIST
+    connect(use_gui=False)
+    _WORKER_CART_PROC_LIST = scene_builder(**scene_builder_kwargs)
+
+def get_worker_cart_proc_list():
+    """get the list of Cartesian processes built by the `scene_builder` of the current worker process"""
+    if _WORKER_CART_PROC_LIST is None:
+        raise RuntimeError('The scene is not built in this process, use a pool created by `create_scene_worker_pool`.')
+    return _WORKER_CART_PROC_LIST
+
+def create_scene_worker_pool(scene_builder, n_workers=None, scene_builder_kwargs=None, mp_context='spawn'):
+    """Create a pool of worker processes, each with its own DIRECT pybullet client in which
+    the planning scene is rebuilt by `scene_builder`.
+
+    Cartesian processes hold closures over pybullet bodies (IK and collision fns) that cannot be sent
+    to another process, so each worker calls `scene_builder` once to load the robot and obstacles into its
+    own client and build the list of Cartesian processes, in the same order as the parent's list.
+
+    Parameters
+    ----------
+    scene_builder : fn
+        a picklable (module-level) function, called as `scene_builder(**scene_builder_kwargs)` after the worker's
+        pybullet client is connected, that returns the list of `CartesianProcess`
+    n_workers : int, optional
+        number of worker processes, by default the number of cpus
+    scene_builder_kwargs : dict, optional
+        picklable keyword arguments of `scene_builder`, by default None
+    mp_context : str, optional
+        multiprocessing start method, 'spawn' makes sure that no pybullet client is inherited from
+        the parent process, by default 'spawn'
+
+    Returns
+    -------
+    multiprocessing.pool.Pool
+        its number of workers is given by `get_pool_size`
+    """
+    ctx = multiprocessing.get_context(mp_context)
+    n_workers = n_workers or multiprocessing.cpu_count()
+    pool = ctx.Pool(processes=n_workers, initializer=_init_scene_worker, initargs=(scene_builder, scene_builder_kwargs or {}))
+    _POOL_SIZES[pool] = n_workers
+    return pool
+
+def get_pool_size(pool):
+    """get the number of workers of a pool created by `create_scene_worker_pool`"""
+    if pool not in _POOL_SIZES:
+        raise ValueError('The size of a pool not created by `create_scene_worker_pool` is unknown, the number of workers must be given.')
+    return _POOL_SIZES[pool]
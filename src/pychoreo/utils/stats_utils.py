@@ -0,0 +1,105 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+class SolverStats(object):
+    """Phase wall times and counters of a ladder graph solve, see the `return_stats` option of
+    `solve_ladder_graph_from_cartesian_process_list` and `SparseLadderGraph.extract_solution`.
+
+    The phases are 'pose_gen', 'ik', 'collision', 'edges' (ladder graph building from the joint sols),
+    'dag_search' and 'traj_split'. The 'ik' and 'collision' times are nested in the graph building,
+    they are measured by wrapping the `sample_ik_fn` and the collision fns of the processes.
+    `to_data` gives a JSON-serializable dict.
+    """
+    PHASES = ('pose_gen', 'ik', 'collision', 'edges', 'dag_search', 'traj_split')
+
+    def __init__(self):
+        self.phase_times = defaultdict(float)
+        # process id -> phase -> wall time
+        self.process_phase_times = defaultdict(lambda: defaultdict(float))
+        self.counts = Counter()
+        self.peak_graph_nbytes = 0
+        self.total_time = 0.0
+
+    def add_time(self, phase, duration, cp_id=None):
+        self.phase_times[phase] += duration
+        if cp_id is not None:
+            self.process_phase_times[cp_id][phase] += duration
+
+    @contextmanager
+    def timer(self, phase, cp_id=None):
+        """time a block of code as a phase, of a process if cp_id is given"""
+        st_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.time() - st_time, cp_id=cp_id)
+
+    def count(self, key, n=1):
+        self.counts[key] += n
+
+    def update_graph_memory(self, nbytes):
+        self.peak_graph_nbytes = max(self.peak_graph_nbytes, int(nbytes))
+
+    def timed_fn(self, fn, phase, cp_id=None, count_key=None):
+        """wrap a function to time its calls as a phase and count them"""
+        def wrapped_fn(*args, **kwargs):
+            if count_key is not None:
+                self.count(count_key)
+            with self.timer(phase, cp_id=cp_id):
+                return fn(*args, **kwargs)
+        return wrapped_fn
+
+    def timed_iter(self, iterator, phase, cp_id=None):
+        """time the `next` calls of an iterator as a phase, e.g. a pose generator"""
+        iterator = iter(iterator)
+        while True:
+            with self.timer(phase, cp_id=cp_id):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @contextmanager
+    def instrument(self, cart_proc_list, cp_ids=None):
+        """time and count the IK and collision calls of the given processes within the block,
+        the processes' fns are restored afterwards"""
+        cp_ids = cp_ids if cp_ids is not None else list(range(len(cart_proc_list)))
+        saved_fns = []
+        for cp_id, cart_proc in zip(cp_ids, cart_proc_list):
+            saved_fns.append((cart_proc, cart_proc.sample_ik_fn, [sp.collision_fn for sp in cart_proc.sub_process_list]))
+            cart_proc.sample_ik_fn = self.timed_fn(cart_proc.sample_ik_fn, 'ik', cp_id=cp_id, count_key='ik_calls')
+            for sp in cart_proc.sub_process_list:
+                sp.collision_fn = self.timed_fn(sp.collision_fn, 'collision', cp_id=cp_id, count_key='collision_calls')
+        try:
+            yield self
+        finally:
+            for cart_proc, sample_ik_fn, collision_fns in saved_fns:
+                cart_proc.sample_ik_fn = sample_ik_fn
+                for sp, collision_fn in zip(cart_proc.sub_process_list, collision_fns):
+                    sp.collision_fn = collision_fn
+
+    def to_data(self):
+        return {
+            'total_time' : self.total_time,
+            'phase_times' : {phase : self.phase_times.get(phase, 0.0) for phase in set(self.PHASES) | set(self.phase_times)},
+            'process_phase_times' : {str(cp_id) : dict(times) for cp_id, times in self.process_phase_times.items()},
+            'counts' : {key : int(n) for key, n in self.counts.items()},
+            'peak_graph_nbytes' : self.peak_graph_nbytes,
+            }
+
+    @classmethod
+    def from_data(cls, data):
+        stats = cls()
+        stats.total_time = data['total_time']
+        stats.phase_times.update(data['phase_times'])
+        for cp_id, times in data['process_phase_times'].items():
+            stats.process_phase_times[int(cp_id)].update(times)
+        stats.counts.update(data['counts'])
+        stats.peak_graph_nbytes = data['peak_graph_nbytes']
+        return stats
+
+    def __repr__(self):
+        return '{}(total {:.3f}s, {})'.format(self.__class__.__name__, self.total_time,
+            ', '.join(['{} {:.3f}s'.format(phase, self.phase_times[phase]) for phase in self.PHASES if phase in self.phase_times]))
@@ -12,6 +12,7 @@ from pybullet_planning import get_collision_fn, get_floating_body_collision_fn
 
 from pychoreo.utils.stream_utils import get_enumeration_pose_generator
 from pychoreo.utils.general_utils import is_any_empty
+from pychoreo.utils.cache_utils import get_cached_collision_fn
 from pychoreo.process_model.cartesian_process import CartesianProcess, CartesianSubProcess
 from pychoreo.process_model.gen_fn import CartesianPoseGenFn
 
@@ -99,7 +100,7 @@ def build_extrusion_cartesian_process_sequence(
         sample_time=5, approach_distance=0.01, linear_step_size=0.003, tool_from_root=None,
         self_collisions=True, disabled_collisions={},
         obstacles=None, extra_disabled_collisions={},
-        reverse_flags=None, verbose=False, max_attempts=2):
+        reverse_flags=None, verbose=False, max_attempts=2, collision_cache=None):
 
     # make sure we don't modify the obstacle list by accident
     built_obstacles = copy(obstacles) if obstacles else []
@@ -160,10 +161,17 @@ def build_extrusion_cartesian_process_sequence(
         full_path_pts = extrusion_compose_fn(unit_pose(), base_path_pts)
 
         # use sequenced elements for collision objects
-        collision_fn = get_collision_fn(robot, ik_joints, built_obstacles,
-                                        attachments=[], self_collisions=self_collisions,
-                                        disabled_collisions=disabled_collisions,
-                                        custom_limits={})
+        if collision_cache is None:
+            collision_fn = get_collision_fn(robot, ik_joints, built_obstacles,
+                                            attachments=[], self_collisions=self_collisions,
+                                            disabled_collisions=disabled_collisions,
+                                            custom_limits={})
+        else:
+            # the collision checks are memoized in the shared LRUCache `collision_cache`
+            collision_fn = get_cached_collision_fn(robot, ik_joints, built_obstacles,
+                                                   attachments=[], self_collisions=self_collisions,
+                                                   disabled_collisions=disabled_collisions,
+                                                   custom_limits={}, cache=collision_cache)
 
         if verbose : print('----\nPruning candidate poses for E#{}'.format(element))
         if not is_ground(element, ground_nodes):
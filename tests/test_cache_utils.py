@@ -0,0 +1,92 @@
+import os
+import pytest
+import numpy as np
+import pybullet_data
+
+from pybullet_planning import connect, disconnect, HideOutput, create_box, set_pose, Pose, Point, get_movable_joints, load_pybullet
+from pychoreo.utils.cache_utils import LRUCache, CachedCollisionFn, get_cached_collision_fn, get_collision_env_fingerprint
+
+@pytest.fixture
+def kuka_scene():
+    connect(use_gui=False)
+    with HideOutput():
+        robot = load_pybullet(os.path.join(pybullet_data.getDataPath(), 'kuka_iiwa', 'model.urdf'), fixed_base=True)
+    box = create_box(0.2, 0.2, 0.2)
+    set_pose(box, Pose(point=Point(0.5, 0, 0.8)))
+    yield robot, get_movable_joints(robot), box
+    disconnect()
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    # 'b' is the least recently used entry
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    assert cache.get('b') is None
+    assert cache.stats['evictions'] == 1
+    assert cache.hit_rate == 0.5
+
+def test_cached_collision_fn(kuka_scene):
+    robot, joints, box = kuka_scene
+    collision_fn = get_cached_collision_fn(robot, joints, obstacles=[box])
+    confs = [np.zeros(len(joints)), np.array([0, np.pi/4, 0, 0, 0, 0, 0]), np.array([0, 1.2, 0, -0.5, 0, 0, 0])]
+    ref = [collision_fn.collision_fn(conf) for conf in confs]
+    assert any(ref) and not all(ref)
+    assert [collision_fn(conf) for conf in confs] == ref
+    assert [collision_fn(conf) for conf in confs] == ref
+    assert collision_fn.stats['hits'] == 3 and collision_fn.stats['misses'] == 3
+
+    # a collision fn with the same environment shares the cached results
+    other_fn = get_cached_collision_fn(robot, joints, obstacles=[box], cache=collision_fn.cache)
+    assert other_fn.fingerprint == collision_fn.fingerprint
+    assert [other_fn(conf) for conf in confs] == ref
+    assert collision_fn.cache.hits == 6
+
+    # different obstacles, different environment
+    no_obstacle_fn = get_cached_collision_fn(robot, joints, obstacles=[], cache=collision_fn.cache)
+    assert no_obstacle_fn.fingerprint != collision_fn.fingerprint
+    assert not any(no_obstacle_fn(conf) for conf in confs)
+
+    # diagnosis calls are not cached, an explicit diagnosis=False is
+    n_queries = collision_fn.cache.hits + collision_fn.cache.misses
+    assert collision_fn(confs[0], diagnosis=True) == ref[0]
+    assert collision_fn.cache.hits + collision_fn.cache.misses == n_queries
+    assert collision_fn(confs[0], diagnosis=False) == ref[0]
+    assert collision_fn.cache.hits + collision_fn.cache.misses == n_queries + 1
+
+def test_collision_env_fingerprint(kuka_scene):
+    robot, joints, box = kuka_scene
+    fingerprint = get_collision_env_fingerprint(robot, joints, obstacles=[box])
+    assert fingerprint == get_collision_env_fingerprint(robot, joints, obstacles=[box])
+    assert fingerprint != get_collision_env_fingerprint(robot, joints, obstacles=[box], self_collisions=False)
+    assert fingerprint != get_collision_env_fingerprint(robot, joints, obstacles=[box], disabled_collisions={(1, 3)})
+
+    static_fn = get_cached_collision_fn(robot, joints, obstacles=[box])
+    dynamic_fn = get_cached_collision_fn(robot, joints, obstacles=[box], static_env=False)
+    assert static_fn.fingerprint == dynamic_fn.fingerprint == fingerprint
+    conf = np.array([0, np.pi/4, 0, 0, 0, 0, 0])
+    assert static_fn(conf) and dynamic_fn(conf)
+    # the obstacle is moved away: only the dynamic fn notices
+    set_pose(box, Pose(point=Point(-2, 0, 0.1)))
+    assert dynamic_fn.fingerprint != fingerprint
+    assert not dynamic_fn(conf)
+    assert static_fn(conf)
+
+def test_cached_collision_fn_wrapper():
+    calls = []
+    def collision_fn(conf, diagnosis=False, threshold=0.0):
+        calls.append(diagnosis)
+        return conf[0] > threshold
+    cached_fn = CachedCollisionFn(collision_fn, lambda : 'env', conf_tolerance=1e-3)
+    assert cached_fn([1.0]) and cached_fn([1.0001])
+    assert not cached_fn([-1.0])
+    assert calls == [False, False]
+    assert cached_fn([1.0], diagnosis=True)
+    assert calls == [False, False, True]
+    assert cached_fn.stats['hits'] == 1
+    # the calls with other keyword arguments are not cached
+    assert not cached_fn([1.0], threshold=2.0)
+    assert calls == [False, False, True, False]
+    assert cached_fn([1.0]) and cached_fn.stats['hits'] == 2
@@ -0,0 +1,83 @@
+import pytest
+
+from pychoreo.process_model.cartesian_process import CartesianProcess, CartesianSubProcess, get_probe_order
+from pychoreo.utils.cache_utils import CachedSampleIKFn, enable_shared_ik_cache
+
+def test_probe_order():
+    assert get_probe_order(0) == []
+    assert get_probe_order(1) == [0]
+    assert get_probe_order(2) == [0, 1]
+    assert get_probe_order(9) == [0, 8, 4, 2, 6, 1, 3, 5, 7]
+    assert get_probe_order(4, 'sequential') == [0, 1, 2, 3]
+    assert get_probe_order(3, [2, 0, 1]) == [2, 0, 1]
+    with pytest.raises(ValueError):
+        get_probe_order(3, [0, 1])
+
+def test_get_ik_sols_fail_fast():
+    # ee poses are plain numbers here, points >= 10 are unreachable
+    evaluated = []
+    def sample_ik_fn(pose):
+        evaluated.append(pose)
+        return [] if pose >= 10 else [[pose, 0.0], [pose, 1.0]]
+    def collision_fn(conf, diagnosis=False):
+        return conf[1] > 0.5
+
+    cart_proc = CartesianProcess(ik_joint_names=['j1', 'j2'], sample_ik_fn=sample_ik_fn,
+        sub_process_list=[CartesianSubProcess(collision_fn=collision_fn), CartesianSubProcess(collision_fn=collision_fn)])
+    ee_poses = [[0, 1, 2], [3, 4, 5, 6]]
+    ik_sols = cart_proc.get_ik_sols(ee_poses)
+    assert ik_sols == [[[[p, 0.0]] for p in sp_poses] for sp_poses in ee_poses]
+    # same solutions in the fail-fast mode if all the points are feasible
+    assert cart_proc.get_ik_sols(ee_poses, fail_fast=True) == (ik_sols, None)
+
+    ee_poses = [[0, 1, 2], [3, 14, 5, 6]]
+    del evaluated[:]
+    ik_sols, failed_pt = cart_proc.get_ik_sols(ee_poses, fail_fast=True)
+    assert ik_sols is None and failed_pt == (1, 1)
+    # endpoints, then the midpoint
+    assert evaluated == [0, 6, 3, 1, 14]
+    del evaluated[:]
+    assert cart_proc.get_ik_sols(ee_poses, fail_fast=True, probe_order='sequential') == (None, (1, 1))
+    assert evaluated == [0, 1, 2, 3, 14]
+
+    # the point where the previous evaluations failed is probed first
+    assert cart_proc.ik_failure_counts[(1, 1)] == 2
+    del evaluated[:]
+    assert cart_proc.get_ik_sols(ee_poses, fail_fast=True, probe_order='failures_first') == (None, (1, 1))
+    assert evaluated == [14]
+
+def test_ik_cache(tmpdir):
+    n_calls = [0]
+    def sample_ik_fn(pose):
+        n_calls[0] += 1
+        (x, y, z), _ = pose
+        return [[x, y, z], [z, y, x]]
+
+    cart_procs = [CartesianProcess(ik_joint_names=['j1', 'j2', 'j3'], sample_ik_fn=sample_ik_fn) for _ in range(2)]
+    caches = enable_shared_ik_cache(cart_procs, pos_tolerance=1e-3, max_size=2)
+    assert len(caches) == 1 and cart_procs[1].enable_ik_cache() is caches[0]
+
+    pose = ((0.1, 0.2, 0.3), (0, 0, 0, 1))
+    sols = cart_procs[0].sample_ik_fn(pose)
+    sols[0][0] = 100.0
+    # q and -q, within tolerance
+    assert cart_procs[1].sample_ik_fn(((0.1, 0.2, 0.3 + 1e-5), (0, 0, 0, -1))) == [[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]]
+    assert n_calls[0] == 1
+    assert caches[0].stats['hits'] == 1 and caches[0].stats['misses'] == 1
+
+    # LRU eviction
+    cart_procs[0].sample_ik_fn(((1, 0, 0), (0, 0, 0, 1)))
+    cart_procs[0].sample_ik_fn(((2, 0, 0), (0, 0, 0, 1)))
+    assert caches[0].cache.evictions == 1
+    cart_procs[0].sample_ik_fn(pose)
+    assert n_calls[0] == 4
+
+    # on-disk store
+    disk_path = str(tmpdir.join('ik_cache'))
+    cache = CachedSampleIKFn(sample_ik_fn, disk_path=disk_path, namespace='toy')
+    cache(pose)
+    cache.close()
+    cache = CachedSampleIKFn(sample_ik_fn, disk_path=disk_path, namespace='toy')
+    assert cache(pose) == [[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]]
+    assert n_calls[0] == 5 and cache.stats['disk_hits'] == 1
+    cache.close()
@@ -1,7 +1,11 @@
 import pytest
+import itertools
+import numpy as np
 
-from pychoreo.cartesian_planner.ladder_graph import LadderGraph, EdgeBuilder
-from pychoreo.cartesian_planner.ladder_graph import append_ladder_graph, concatenate_graph_vertically
+from pychoreo.cartesian_planner.ladder_graph import LadderGraph, EdgeBuilder, EdgeCostMatrix, SparseEdgeCostMatrix, LazyEdgeCostMatrix, \
+    compute_edge_costs
+from pychoreo.cartesian_planner.ladder_graph import append_ladder_graph, concatenate_graph_vertically, compact_ladder_graph
+from pychoreo.cartesian_planner import dag_search as dag_search_module
 from pychoreo.cartesian_planner.dag_search import DAGSearch
 from pychoreo.cartesian_planner.postprocessing import divide_list_chunks
 
@@ -16,3 +20,457 @@ def test_ladder_graph_search():
         dag_search = DAGSearch(graph)
 
     # TODO: test correspondence between ladder graph rungs & solution rungs
+
+def build_random_graph(vert_sizes, dof=3, seed=0):
+    rng = np.random.RandomState(seed)
+    graph = LadderGraph(dof)
+    graph.resize(len(vert_sizes))
+    for r_id, n_verts in enumerate(vert_sizes):
+        graph.assign_rung(r_id, rng.uniform(-np.pi, np.pi, (n_verts, dof)))
+    for r_id in range(graph.size - 1):
+        st_jts, end_jts = graph.get_data(r_id), graph.get_data(r_id+1)
+        edge_builder = EdgeBuilder(len(st_jts), len(end_jts), dof)
+        for k in range(len(st_jts)):
+            for j in range(len(end_jts)):
+                edge_builder.consider(st_jts[k], end_jts[j], j)
+            edge_builder.next(k)
+        graph.assign_edges(r_id, edge_builder.result)
+    return graph
+
+def brute_force_min_cost(graph):
+    min_cost = np.inf
+    for path in itertools.product(*[range(n) for n in graph.get_vert_sizes()]):
+        cost = 0.0
+        for r_id in range(graph.size - 1):
+            cost += graph.get_edges(r_id).to_dense().costs[path[r_id], path[r_id+1]]
+        min_cost = min(min_cost, cost)
+    return min_cost
+
+def test_ladder_graph_rung_data():
+    dof = 2
+    graph = LadderGraph(dof)
+    graph.resize(2)
+    graph.assign_rung(0, [[0.0, 0.0], [1.0, 1.0]])
+    graph.assign_rung(1, np.array([[0.5, 0.5], [2.0, 2.0], [3.0, 3.0]]))
+    assert graph.get_data(0).shape == (2, dof)
+    assert graph.get_vert_sizes() == [2, 3]
+    assert np.shares_memory(graph.get_vert_data(1, 2), graph.get_data(1))
+    # the flat list-like view of the rung data is still available
+    assert list(graph.get_rung(1).data) == [0.5, 0.5, 2.0, 2.0, 3.0, 3.0]
+
+    st_graph = LadderGraph(dof)
+    st_graph.resize(1)
+    st_graph.assign_rung(0, [[1.0, 1.0]])
+    unified_graph = append_ladder_graph(st_graph, graph)
+    assert unified_graph.get_vert_sizes() == [1, 2, 3]
+
+    other_graph = LadderGraph(dof)
+    other_graph.resize(2)
+    other_graph.assign_rung(0, [[-1.0, -1.0]])
+    other_graph.assign_rung(1, [[-2.0, -2.0]])
+    concatenate_graph_vertically(graph, other_graph)
+    assert graph.get_vert_sizes() == [3, 4]
+    assert graph.get_vert_data(1, 3).tolist() == [-2.0, -2.0]
+
+def test_edge_cost_matrix():
+    graph = build_random_graph([3, 4, 2, 5])
+    edges = graph.get_edges(0)
+    assert isinstance(edges, EdgeCostMatrix)
+    assert edges.shape == (3, 4) and edges.num_edges == 12
+    # legacy per-vertex edge list access
+    assert [e.idx for e in edges[1]] == [0, 1, 2, 3]
+    assert edges[1][2].cost == pytest.approx(edges.costs[1, 2])
+
+    sparse_edges = edges.to_sparse()
+    assert isinstance(sparse_edges, SparseEdgeCostMatrix)
+    assert np.array_equal(sparse_edges.to_dense().costs, edges.costs)
+
+    # pruned edges are dropped in the sparse form
+    costs = edges.costs.copy()
+    costs[0, 1] = np.inf
+    assert EdgeCostMatrix(costs).to_sparse().num_edges == 11
+
+    dag_search = DAGSearch(graph)
+    assert dag_search.run() == pytest.approx(brute_force_min_cost(graph))
+    assert len(dag_search.shortest_path()) == graph.size
+
+def test_concatenate_graph_vertically_edges():
+    graph = build_random_graph([2, 3, 2], seed=1)
+    other_graph = build_random_graph([3, 1, 2], seed=2)
+    cost = min(DAGSearch(graph).run(), DAGSearch(other_graph).run())
+
+    concatenate_graph_vertically(graph, other_graph)
+    assert graph.get_vert_sizes() == [5, 4, 4]
+    edges = graph.get_edges(0)
+    assert edges.shape == (5, 4) and edges.num_edges == 2*3 + 3*1
+    # no edge between the two stacked graphs
+    assert [e.idx for e in edges[2]] == [3]
+    assert DAGSearch(graph).run() == pytest.approx(cost)
+
+def test_ladder_graph_nbytes():
+    graph = build_random_graph([2, 3, 2], seed=1)
+    other_graph = build_random_graph([3, 1, 2], seed=2)
+    assert graph.get_edge_num() == 2*3 + 3*2
+    assert graph.nbytes == 7 * 3 * 8 + graph.get_edges(0).nbytes + graph.get_edges(1).nbytes
+    nbytes = graph.nbytes + other_graph.nbytes
+    concatenate_graph_vertically(graph, other_graph)
+    assert graph.nbytes == nbytes
+    assert graph.get_edge_num() == 2*3 + 3*2 + 3*1 + 1*2
+
+def test_concatenate_graph_vertically_no_copy(tmpdir):
+    sub_graphs = [build_random_graph([2, 3, 1 + i % 3], seed=10 + i) for i in range(20)]
+    ref_costs = [DAGSearch(g).run() for g in sub_graphs]
+    ref_jts = [np.vstack([g.get_data(r_id) for g in sub_graphs]) for r_id in range(3)]
+    ref_edges = [SparseEdgeCostMatrix.from_dense(np.block([[g.get_edges(r_id).to_dense().costs if g is h else
+        np.full(g.get_edges(r_id).shape[:1] + h.get_edges(r_id).shape[1:], np.inf) for h in sub_graphs] for g in sub_graphs]))
+        for r_id in range(2)]
+    last_edges = sub_graphs[-1].get_edges(0)
+
+    graph = sub_graphs[0]
+    for other_graph in sub_graphs[1:]:
+        concatenate_graph_vertically(graph, other_graph)
+    # the edge stores below are stacked as they are
+    assert any([edges is last_edges for _, _, edges in graph.get_edges(0).blocks])
+    for r_id in range(3):
+        assert np.array_equal(graph.get_data(r_id), ref_jts[r_id])
+    for r_id in range(2):
+        edges = graph.get_edges(r_id)
+        assert edges.shape == ref_edges[r_id].shape and edges.num_edges == ref_edges[r_id].num_edges
+        assert np.array_equal(edges.to_dense().costs, ref_edges[r_id].to_dense().costs)
+        assert [e.idx for e in edges[7]] == [e.idx for e in ref_edges[r_id][7]]
+    dag_search = DAGSearch(graph)
+    assert dag_search.run() == pytest.approx(min(ref_costs))
+    assert dag_search.run(beam_width=4) >= min(ref_costs) - 1e-9
+
+    file_path = str(tmpdir.join('stacked.graph'))
+    graph.to_file(file_path)
+    assert DAGSearch(LadderGraph.from_file(file_path)).run() == pytest.approx(min(ref_costs))
+
+    # appending to an empty graph does not add boundary edges
+    unified_graph = append_ladder_graph(LadderGraph(graph.dof), graph)
+    assert unified_graph.size == 3 and len(unified_graph.get_edges(2)) == 0
+
+def test_edge_builder_consider_all():
+    rng = np.random.RandomState(3)
+    dof = 4
+    st_jts = rng.uniform(-1, 1, (5, dof))
+    end_jts = rng.uniform(-1, 1, (7, dof))
+
+    loop_builder = EdgeBuilder(5, 7, dof, preference_cost=2.0)
+    for k in range(5):
+        for j in range(7):
+            loop_builder.consider(st_jts[k], end_jts[j], j)
+        loop_builder.next(k)
+    batch_builder = EdgeBuilder(5, 7, dof, preference_cost=2.0)
+    batch_builder.consider_all(st_jts, end_jts)
+    assert batch_builder.has_edges
+    assert np.allclose(batch_builder.result.costs, loop_builder.result.costs)
+
+    # per-joint weights
+    weights = [1.0, 0.5, 0.0, 2.0]
+    costs = compute_edge_costs(st_jts, end_jts, joint_weights=weights)
+    assert costs[1, 2] == pytest.approx(sum(w * abs(a - b) for w, a, b in zip(weights, st_jts[1], end_jts[2])))
+
+    # joint velocity limits, an edge is pruned if any joint moves more than upper_tm * vel_limit
+    vel_limits = [0.5] * dof
+    costs = compute_edge_costs(st_jts, end_jts, upper_tm=2.0, joint_vel_limits=vel_limits)
+    feasible = np.all(np.abs(st_jts[:, None, :] - end_jts[None, :, :]) <= 1.0, axis=2)
+    assert np.array_equal(np.isfinite(costs), feasible)
+    assert not EdgeBuilder(5, 7, dof, upper_tm=0.0, joint_vel_limits=vel_limits).has_edges
+    pruned_builder = EdgeBuilder(5, 7, dof, upper_tm=0.0, joint_vel_limits=vel_limits)
+    pruned_builder.consider_all(st_jts, end_jts)
+    assert not pruned_builder.has_edges
+    assert isinstance(pruned_builder.result, SparseEdgeCostMatrix)
+
+def legacy_dag_search(graph):
+    # edge-by-edge relaxation, as DAGSearch.run used to do it
+    dist = [[0.0] * graph.get_rung_vert_size(0)] + [[np.inf] * n for n in graph.get_vert_sizes()[1:]]
+    pred = [[0] * n for n in graph.get_vert_sizes()]
+    for r_id in range(graph.size - 1):
+        edges = graph.get_edges(r_id)
+        for v_id in range(graph.get_rung_vert_size(r_id)):
+            for edge in edges[v_id]:
+                dv = dist[r_id][v_id] + edge.cost
+                if dv < dist[r_id+1][edge.idx]:
+                    dist[r_id+1][edge.idx] = dv
+                    pred[r_id+1][edge.idx] = v_id
+    v_id = dist[-1].index(min(dist[-1]))
+    path = [v_id]
+    for r_id in range(graph.size - 1, 0, -1):
+        v_id = pred[r_id][v_id]
+        path.append(v_id)
+    return min(dist[-1]), [graph.get_vert_data(r_id, v).tolist() for r_id, v in enumerate(path[::-1])]
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_dag_search_min_plus(sparse):
+    graph = build_random_graph([4, 6, 1, 5, 3], seed=4)
+    concatenate_graph_vertically(graph, build_random_graph([2, 3, 4, 2, 2], seed=5))
+    if sparse:
+        for r_id in range(graph.size - 1):
+            costs = graph.get_edges(r_id).to_dense().costs.copy()
+            costs[costs > 6.0] = np.inf
+            graph.assign_edges(r_id, EdgeCostMatrix(costs).to_sparse())
+    legacy_cost, legacy_path = legacy_dag_search(graph)
+    assert legacy_cost < np.inf
+    dag_search = DAGSearch(graph)
+    assert dag_search.run() == pytest.approx(legacy_cost)
+    assert dag_search.shortest_path() == legacy_path
+
+def test_dag_search_lazy_edges():
+    def build_graphs(vert_sizes, preference_cost, seed):
+        graph = build_random_graph(vert_sizes, seed=seed)
+        lazy_graph = LadderGraph(graph.dof)
+        lazy_graph.resize(graph.size)
+        for r_id in range(graph.size):
+            lazy_graph.assign_rung(r_id, graph.get_data(r_id))
+        for r_id in range(graph.size - 1):
+            graph.assign_edges(r_id, compute_edge_costs(graph.get_data(r_id), graph.get_data(r_id+1), preference_cost=preference_cost))
+            lazy_graph.assign_edges(r_id, LazyEdgeCostMatrix.full(*graph.get_edges(r_id).shape, preference_cost=preference_cost))
+        return graph, lazy_graph
+
+    graph, lazy_graph = build_graphs([3, 4, 2, 5], 2.0, seed=6)
+    other_graph, other_lazy_graph = build_graphs([2, 2, 3, 1], 0.5, seed=7)
+    concatenate_graph_vertically(graph, other_graph)
+    concatenate_graph_vertically(lazy_graph, other_lazy_graph)
+    st_graph = LadderGraph(graph.dof)
+    st_graph.resize(1)
+    st_graph.assign_rung(0, [[0.0] * graph.dof])
+    lazy_st_graph = LadderGraph(graph.dof)
+    lazy_st_graph.resize(1)
+    lazy_st_graph.assign_rung(0, [[0.0] * graph.dof])
+    graph = append_ladder_graph(st_graph, graph)
+    lazy_graph = append_ladder_graph(lazy_st_graph, lazy_graph, lazy_edges=True)
+
+    lazy_edges = lazy_graph.get_edges(1)
+    assert isinstance(lazy_edges, LazyEdgeCostMatrix)
+    assert lazy_edges.shape == (5, 6) and len(lazy_edges.blocks) == 2
+    assert np.allclose(lazy_edges.to_dense(lazy_graph.get_data(1), lazy_graph.get_data(2)).costs, graph.get_edges(1).to_dense().costs)
+
+    dag_search = DAGSearch(graph)
+    lazy_dag_search = DAGSearch(lazy_graph)
+    assert lazy_dag_search.run() == pytest.approx(dag_search.run())
+    assert lazy_dag_search.shortest_path() == dag_search.shortest_path()
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_ladder_graph_file_io(tmpdir, mmap_mode):
+    graph = build_random_graph([3, 4, 2, 5], seed=8)
+    other_graph = build_random_graph([1, 2, 2, 2], seed=9)
+    for r_id in range(other_graph.size - 1):
+        other_graph.assign_edges(r_id, other_graph.get_edges(r_id).to_sparse())
+    concatenate_graph_vertically(graph, other_graph)
+    graph.assign_edges(2, LazyEdgeCostMatrix.full(graph.get_rung_vert_size(2), graph.get_rung_vert_size(3), preference_cost=1.5))
+    file_path = str(tmpdir.join('graph.bin'))
+    graph.to_file(file_path)
+
+    loaded_graph = LadderGraph.from_file(file_path, mmap_mode=mmap_mode)
+    assert loaded_graph.dof == graph.dof
+    assert loaded_graph.get_vert_sizes() == graph.get_vert_sizes()
+    for r_id in range(graph.size):
+        assert np.array_equal(loaded_graph.get_data(r_id), graph.get_data(r_id))
+    if mmap_mode:
+        assert isinstance(loaded_graph.get_data(0).base, np.memmap)
+    assert isinstance(loaded_graph.get_edges(2), LazyEdgeCostMatrix)
+    dag_search = DAGSearch(graph)
+    loaded_dag_search = DAGSearch(loaded_graph)
+    assert loaded_dag_search.run() == pytest.approx(dag_search.run())
+    assert loaded_dag_search.shortest_path() == dag_search.shortest_path()
+
+    # rungs only, the edges can be rebuilt with other cost parameters
+    graph.to_file(file_path, include_edges=False)
+    loaded_graph = LadderGraph.from_file(file_path)
+    assert loaded_graph.get_vert_sizes() == graph.get_vert_sizes()
+    assert loaded_graph.get_edge_sizes() == [0] * graph.size
+
+def test_dag_search_replace_rungs():
+    def build_unified_graph(proc_graphs):
+        unified_graph = LadderGraph(proc_graphs[0].dof)
+        for g in proc_graphs:
+            unified_graph = append_ladder_graph(unified_graph, g)
+        return unified_graph
+
+    proc_graphs = [build_random_graph([3, 4, 2], seed=10), build_random_graph([5, 2], seed=11),
+                   build_random_graph([2, 3, 3, 4], seed=12), build_random_graph([4], seed=13)]
+    dag_search = DAGSearch(build_unified_graph(proc_graphs))
+    dag_search.run()
+    assert dag_search.run_backward() == pytest.approx(dag_search.run())
+
+    # resample single processes (with a different number of rungs), in the middle, at the head and at the tail
+    for proc_id, vert_sizes, seed in [(1, [3, 6, 2], 14), (0, [2, 2], 15), (3, [3, 1], 16), (2, [4, 1, 3, 2], 17), (1, [2], 18)]:
+        rung_st = sum([g.size for g in proc_graphs[:proc_id]])
+        rung_end = rung_st + proc_graphs[proc_id].size
+        proc_graphs[proc_id] = build_random_graph(vert_sizes, seed=seed)
+        cost = dag_search.replace_rungs(rung_st, rung_end, build_random_graph(vert_sizes, seed=seed))
+
+        # compare with a search from scratch on the updated graph
+        fresh_graph = LadderGraph(dag_search.graph.dof)
+        fresh_graph.resize(dag_search.graph.size)
+        for r_id in range(dag_search.graph.size):
+            fresh_graph.assign_rung(r_id, dag_search.graph.get_data(r_id))
+        for r_id in range(dag_search.graph.size - 1):
+            fresh_graph.assign_edges(r_id, dag_search.graph.get_edges(r_id))
+        fresh_search = DAGSearch(fresh_graph)
+        assert cost == pytest.approx(fresh_search.run())
+        assert dag_search.shortest_path() == fresh_search.shortest_path()
+        assert dag_search.graph.get_vert_sizes() == [n for g in proc_graphs for n in g.get_vert_sizes()]
+
+def test_dag_search_k_shortest_paths(monkeypatch):
+    graph = build_random_graph([3, 4, 2, 3], seed=19)
+    # duplicated verts give joint-identical paths that should be reported only once
+    concatenate_graph_vertically(graph, build_random_graph([3, 4, 2, 3], seed=19))
+    dag_search = DAGSearch(graph)
+    min_cost = dag_search.run()
+
+    all_paths = {}
+    for path in itertools.product(*[range(n) for n in graph.get_vert_sizes()]):
+        cost = sum([graph.get_edges(r_id).to_dense().costs[path[r_id], path[r_id+1]] for r_id in range(graph.size - 1)])
+        if cost < np.inf:
+            jt_path = tuple(tuple(graph.get_vert_data(r_id, v_id)) for r_id, v_id in enumerate(path))
+            all_paths[jt_path] = cost
+    ref_costs = sorted(all_paths.values())
+
+    k_paths = dag_search.k_shortest_paths(5)
+    assert len(k_paths) == 5
+    assert k_paths[0][0] == pytest.approx(min_cost)
+    assert k_paths[0][1] == dag_search.shortest_path()
+    assert [c for c, _ in k_paths] == pytest.approx(ref_costs[:5])
+    assert len(set([tuple(map(tuple, p)) for _, p in k_paths])) == 5
+    # one start vert at a time
+    monkeypatch.setattr(dag_search_module, 'EDGE_COST_CHUNK_SIZE', 1)
+    assert dag_search.k_shortest_paths(5) == k_paths
+    monkeypatch.undo()
+
+    diverse_paths = dag_search.k_shortest_paths(3, min_diversity=1.0)
+    for (_, path_a), (_, path_b) in itertools.combinations(diverse_paths, 2):
+        assert np.mean(np.sum(np.abs(np.array(path_a) - np.array(path_b)), axis=1)) > 1.0
+
+    # the duplicated verts do not fill the candidate slots
+    graph = LadderGraph(1)
+    graph.resize(3)
+    for r_id, jts in enumerate([[[0], [0], [0.5]], [[0.1]], [[0.2]]]):
+        graph.assign_rung(r_id, jts)
+    for r_id in range(graph.size - 1):
+        graph.assign_edges(r_id, EdgeCostMatrix(compute_edge_costs(graph.get_data(r_id), graph.get_data(r_id + 1))))
+    dup_paths = DAGSearch(graph).k_shortest_paths(2)
+    assert [path for _, path in dup_paths] == [[[0.0], [0.1], [0.2]], [[0.5], [0.1], [0.2]]]
+    assert [c for c, _ in dup_paths] == pytest.approx([0.2, 0.5])
+
+def test_edge_store_iter_blocks_rows():
+    graph = build_random_graph([6, 5], seed=23)
+    dense_edges = graph.get_edges(0).to_dense()
+    st_jts, end_jts = graph.get_data(0), graph.get_data(1)
+    rows = np.array([1, 4, 5])
+    for edges in [dense_edges, dense_edges.to_sparse(), LazyEdgeCostMatrix.full(6, 5)]:
+        costs = np.full(dense_edges.shape, np.inf)
+        for row_ids, col_st, block in edges.iter_blocks(st_jts, end_jts, rows=rows):
+            costs[row_ids, col_st:col_st+block.shape[1]] = block
+        assert np.allclose(costs[rows], dense_edges.costs[rows])
+        assert np.all(np.isinf(np.delete(costs, rows, axis=0)))
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_dag_search_beam(lazy):
+    graph = build_random_graph([4, 30, 30, 30, 3], seed=29)
+    if lazy:
+        for r_id in range(graph.size - 1):
+            graph.assign_edges(r_id, LazyEdgeCostMatrix.full(*graph.get_edges(r_id).shape))
+    dag_search = DAGSearch(graph)
+    exact_cost = dag_search.run()
+    assert dag_search.beam_info is None
+
+    # a beam wide enough to keep every vert is exact
+    assert dag_search.run(beam_width=30) == pytest.approx(exact_cost)
+    assert dag_search.run(beam_margin=np.inf) == pytest.approx(exact_cost)
+
+    beam_cost = dag_search.run(beam_width=2, check_exact=True)
+    assert beam_cost >= exact_cost - 1e-9
+    info = dag_search.beam_info
+    assert info['exact_cost'] == pytest.approx(exact_cost)
+    assert info['gap'] == pytest.approx(beam_cost - exact_cost)
+    assert info['expanded_verts'] == 4 + 3 * 2
+    path = dag_search.shortest_path()
+    assert sum([np.sum(np.abs(np.array(path[i+1]) - np.array(path[i]))) for i in range(len(path) - 1)]) == pytest.approx(beam_cost)
+
+    dag_search.run(beam_margin=0.0)
+    assert dag_search.beam_info['expanded_verts'] == 4 + 3
+
+def test_dag_search_remove_vertices():
+    graph = build_random_graph([3, 4, 4, 3, 2], seed=31)
+    dag_search = DAGSearch(graph)
+    dag_search.run()
+    # remove the verts of the shortest path one after another, compare with a fresh search on the masked graph
+    checked = {}
+    for _ in range(2):
+        path_idx = dag_search.shortest_path_idx()
+        removed = {2 : [path_idx[2]], 3 : [path_idx[3]]}
+        for r_id, v_ids in removed.items():
+            checked.setdefault(r_id, []).extend(v_ids)
+        cost = dag_search.remove_vertices(removed)
+
+        ref_search = DAGSearch(graph)
+        for r_id, v_ids in checked.items():
+            ref_search.solution[r_id].removed[v_ids] = True
+        assert cost == pytest.approx(ref_search.run())
+        assert dag_search.shortest_path() == ref_search.shortest_path()
+        assert all([path_idx_v not in checked.get(r_id, []) for r_id, path_idx_v in enumerate(dag_search.shortest_path_idx())])
+    assert dag_search.remove_vertices({1 : list(range(4))}) == np.inf
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_compact_ladder_graph(lazy):
+    rng = np.random.RandomState(7)
+    graph = build_random_graph([3, 4, 2, 3], seed=3)
+    if lazy:
+        for r_id in range(graph.size - 1):
+            graph.assign_edges(r_id, LazyEdgeCostMatrix.full(graph.get_rung_vert_size(r_id), graph.get_rung_vert_size(r_id+1)))
+    ref_cost = DAGSearch(graph).run()
+    # stack near-duplicate copies of the graph
+    for _ in range(3):
+        copy_graph = build_random_graph([3, 4, 2, 3], seed=3)
+        for r_id in range(copy_graph.size):
+            copy_graph.assign_rung(r_id, copy_graph.get_data(r_id) + rng.uniform(0, 1e-6, copy_graph.get_data(r_id).shape))
+        if lazy:
+            for r_id in range(copy_graph.size - 1):
+                copy_graph.assign_edges(r_id, LazyEdgeCostMatrix.full(copy_graph.get_rung_vert_size(r_id), copy_graph.get_rung_vert_size(r_id+1)))
+        concatenate_graph_vertically(graph, copy_graph)
+    assert graph.get_vert_sizes() == [12, 16, 8, 12]
+
+    compact_graph, vert_maps = compact_ladder_graph(graph, 1e-3)
+    assert compact_graph.get_vert_sizes() == [3, 4, 2, 3]
+    for r_id in range(graph.size):
+        assert np.array_equal(vert_maps[r_id], np.tile(np.arange(compact_graph.get_rung_vert_size(r_id)), 4))
+        assert np.array_equal(compact_graph.get_data(r_id), graph.get_data(r_id)[:compact_graph.get_rung_vert_size(r_id)])
+    assert compact_graph.get_edge_num() == 3*4 + 4*2 + 2*3
+    assert DAGSearch(compact_graph).run() == pytest.approx(ref_cost, abs=1e-5)
+
+    # a tolerance below the noise keeps all the verts
+    assert compact_ladder_graph(graph, 1e-12)[0].get_vert_sizes() == graph.get_vert_sizes()
+
+def test_ladder_graph_file_io_many_rungs(tmpdir):
+    resource = pytest.importorskip('resource')
+    graph = build_random_graph([2] * 300, seed=3)
+    file_path = str(tmpdir.join('long.graph'))
+    graph.to_file(file_path)
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # fewer file descriptors than rung pairs
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(128, hard_limit), hard_limit))
+    try:
+        loaded_graph = LadderGraph.from_file(file_path)
+        assert DAGSearch(loaded_graph).run() == pytest.approx(DAGSearch(graph).run())
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_dag_search_no_path(sparse):
+    graph = build_random_graph([2, 3, 2, 2], seed=6)
+    # all the edges of a rung pair are pruned, e.g. by the joint velocity limits
+    pruned_edges = EdgeCostMatrix(np.full((3, 2), np.inf))
+    graph.assign_edges(1, pruned_edges.to_sparse() if sparse else pruned_edges)
+    dag_search = DAGSearch(graph)
+    assert dag_search.run() == np.inf
+    assert dag_search.shortest_path_idx() is None and dag_search.shortest_path() is None
+
+    # every rung pair has edges, but they are not connected
+    graph = build_random_graph([2, 2, 2], seed=7)
+    graph.assign_edges(0, EdgeCostMatrix(np.array([[1.0, np.inf], [2.0, np.inf]])))
+    graph.assign_edges(1, EdgeCostMatrix(np.array([[np.inf, np.inf], [1.0, 3.0]])))
+    dag_search = DAGSearch(graph)
+    assert dag_search.run() == np.inf
+    assert dag_search.shortest_path() is None
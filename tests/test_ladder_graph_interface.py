@@ -0,0 +1,373 @@
+import os
+import json
+import pytest
+import numpy as np
+
+from pybullet_planning import connect, disconnect, load_pybullet, HideOutput, get_movable_joints, get_joint_names
+from pybullet_planning import Pose, Euler
+
+from pychoreo.process_model.cartesian_process import CartesianProcess, CartesianSubProcess
+from pychoreo.process_model.gen_fn import CartesianPoseGenFn
+from pychoreo.cartesian_planner.ladder_graph_interface import solve_ladder_graph_from_cartesian_process_list, \
+    generate_ladder_graph_from_cartesian_process, iter_pose_family_graphs_in_parallel, solve_ladder_graph_coarse_to_fine, \
+    get_coarse_point_ids
+from pychoreo.cartesian_planner.dag_search import DAGSearch
+from pychoreo.cartesian_planner.sparse_ladder_graph import SparseLadderGraph
+from pychoreo.cartesian_planner.ladder_graph_session import LadderGraphSession
+from pychoreo.utils.stats_utils import SolverStats
+from pychoreo.utils.parallel_utils import create_scene_worker_pool
+
+def compose_toy_ee_poses(yaw, base_path_pts=None, n_interp=1):
+    def interpolate(pts):
+        return [pt for i in range(len(pts)-1) for pt in np.linspace(pts[i], pts[i+1], n_interp, endpoint=False).tolist()] + [pts[-1]]
+    return [[Pose(point=pt, euler=Euler(yaw=yaw)) for pt in interpolate(base_path_pts[:2])],
+            [Pose(point=pt, euler=Euler(yaw=yaw)) for pt in interpolate(base_path_pts[1:])]]
+
+def build_toy_scene(n_procs=3, seed=0, n_interp=1):
+    """a scene with a robot and Cartesian processes with fake (but deterministic) IK and collision fns"""
+    import pybullet_data
+    with HideOutput():
+        robot = load_pybullet(os.path.join(pybullet_data.getDataPath(), 'kuka_iiwa', 'model.urdf'), fixed_base=True)
+    ik_joint_names = get_joint_names(robot, get_movable_joints(robot))
+    dof = len(ik_joint_names)
+
+    def sample_ik_fn(pose):
+        (x, y, z), quat = pose
+        if quat[2] < -0.6:
+            # unreachable orientations
+            return []
+        base_conf = np.array([x, y, z] + list(quat))[:dof]
+        return [list(base_conf + 0.3 * k) for k in range(3)]
+
+    def collision_fn(conf, diagnosis=False):
+        return conf[0] > 1.0
+
+    rng = np.random.RandomState(seed)
+    cart_proc_list = []
+    for cp_id in range(n_procs):
+        path_pts = rng.uniform(-0.5, 0.5, (3, 3)).tolist()
+        ee_pose_gen_fn = CartesianPoseGenFn(np.linspace(-np.pi, np.pi, 6), compose_toy_ee_poses, base_path_pts=path_pts,
+            n_interp=n_interp)
+        sub_procs = [CartesianSubProcess(sub_process_name='approach', collision_fn=collision_fn),
+                     CartesianSubProcess(sub_process_name='retreat', collision_fn=collision_fn)]
+        cart_proc_list.append(CartesianProcess(process_name='toy-{}'.format(cp_id), robot=robot, ik_joint_names=ik_joint_names,
+            sub_process_list=sub_procs, ee_pose_gen_fn=ee_pose_gen_fn, sample_ik_fn=sample_ik_fn))
+    return cart_proc_list
+
+@pytest.mark.parallel
+def test_parallel_ladder_graph_construction():
+    connect(use_gui=False)
+    try:
+        cart_proc_list = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(), warning_pause=False)
+        ref_trajs = [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list]
+
+        cart_proc_list = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(), warning_pause=False,
+            scene_builder=build_toy_scene, n_workers=2)
+        trajs = [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list]
+        assert trajs == ref_trajs
+    finally:
+        disconnect()
+
+@pytest.mark.parallel
+def test_parallel_pose_family_evaluation():
+    connect(use_gui=False)
+    try:
+        cart_proc = build_toy_scene(n_procs=2, seed=1)[1]
+        ref_graph, ref_cnt = generate_ladder_graph_from_cartesian_process(cart_proc)
+
+        pool = create_scene_worker_pool(build_toy_scene, n_workers=3, scene_builder_kwargs={'n_procs' : 2, 'seed' : 1})
+        try:
+            family_graphs = list(iter_pose_family_graphs_in_parallel(pool, 1, cart_proc.exhaust_iter()))
+            assert len(family_graphs) == 6 and len([g for g in family_graphs if g is not None]) == ref_cnt
+            graph, cnt = generate_ladder_graph_from_cartesian_process(cart_proc, pool=pool, cp_id=1)
+        finally:
+            pool.close()
+            pool.join()
+        assert cnt == ref_cnt
+        assert graph.get_vert_sizes() == ref_graph.get_vert_sizes()
+        for r_id in range(graph.size):
+            assert np.array_equal(graph.get_data(r_id), ref_graph.get_data(r_id))
+        assert DAGSearch(graph).run() == pytest.approx(DAGSearch(ref_graph).run())
+
+        cart_proc_list = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(), warning_pause=False,
+            scene_builder=build_toy_scene, n_workers=2, parallel_pose_families=True)
+        ref_proc_list = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(), warning_pause=False)
+        assert [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list] == \
+            [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in ref_proc_list]
+    finally:
+        disconnect()
+
+def build_crashing_toy_scene(**kwargs):
+    """the toy scene whose IK fn kills the (worker) process calling it"""
+    cart_proc_list = build_toy_scene(**kwargs)
+    for cart_proc in cart_proc_list:
+        cart_proc.sample_ik_fn = lambda pose: os._exit(1)
+    return cart_proc_list
+
+@pytest.mark.parallel
+def test_parallel_sparse_path_sampling():
+    connect(use_gui=False)
+    try:
+        # the toy pose generators cycle over a few yaws, all of them are sampled within the timeouts
+        sparse_graph = SparseLadderGraph(build_toy_scene())
+        ref_cost = sparse_graph.find_sparse_path(vert_timeout=1.0, sparse_sample_timeout=0.5, exact_rewire=True)
+
+        sparse_graph = SparseLadderGraph(build_toy_scene(), keep_ik_sols=True)
+        pool = create_scene_worker_pool(build_toy_scene, n_workers=2)
+        try:
+            # the number of sampling tasks is the pool's size
+            sparse_cost = sparse_graph.find_sparse_path(vert_timeout=1.0, sparse_sample_timeout=1.0, exact_rewire=True,
+                pool=pool, sample_batch_timeout=0.005, seed=0)
+        finally:
+            pool.close()
+            pool.join()
+        assert sparse_cost == pytest.approx(ref_cost)
+        for r_id, cap_rung in enumerate(sparse_graph.cap_rungs):
+            assert len(cap_rung.cap_verts) > 1
+            assert all([v.host_rung_id == r_id and v.has_ik_sols() for v in cap_rung.cap_verts])
+            if r_id > 0:
+                assert all([v.parent_vert in sparse_graph.cap_rungs[r_id-1].cap_verts for v in cap_rung.cap_verts])
+        # the solution is extracted with the parent's processes
+        cart_proc_list = sparse_graph.extract_solution()
+        assert all([sp.trajectory is not None for cp in cart_proc_list for sp in cp.sub_process_list])
+    finally:
+        disconnect()
+
+@pytest.mark.parallel
+def test_parallel_sparse_path_lost_worker():
+    connect(use_gui=False)
+    try:
+        sparse_graph = SparseLadderGraph(build_toy_scene())
+        pool = create_scene_worker_pool(build_crashing_toy_scene, n_workers=2)
+        try:
+            # the crashed workers are replaced, but their tasks never return
+            with pytest.raises(RuntimeError):
+                sparse_graph.find_sparse_path(vert_timeout=0.1, sparse_sample_timeout=0.5, pool=pool, worker_timeout=1.0)
+        finally:
+            pool.terminate()
+            pool.join()
+        # the pool's size is unknown
+        with pytest.raises(ValueError):
+            sparse_graph.find_sparse_path(vert_timeout=0.1, sparse_sample_timeout=0.5, pool=object())
+    finally:
+        disconnect()
+
+def test_lazy_collision_checking():
+    connect(use_gui=False)
+    try:
+        def count_collision_checks(cart_proc_list):
+            counter = [0]
+            for cart_proc in cart_proc_list:
+                for sp in cart_proc.sub_process_list:
+                    def counted_collision_fn(conf, diagnosis=False, collision_fn=sp.collision_fn):
+                        counter[0] += 1
+                        return collision_fn(conf, diagnosis=diagnosis)
+                    sp.collision_fn = counted_collision_fn
+            return cart_proc_list, counter
+
+        ref_proc_list, ref_counter = count_collision_checks(build_toy_scene(n_procs=4, seed=3))
+        solve_ladder_graph_from_cartesian_process_list(ref_proc_list, warning_pause=False)
+        cart_proc_list, counter = count_collision_checks(build_toy_scene(n_procs=4, seed=3))
+        solve_ladder_graph_from_cartesian_process_list(cart_proc_list, warning_pause=False, lazy_collision=True)
+
+        assert [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list] == \
+            [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in ref_proc_list]
+        for cp in cart_proc_list:
+            for sp in cp.sub_process_list:
+                assert not any([sp.collision_fn(conf) for conf in sp.trajectory.traj_path])
+        assert 0 < counter[0] < ref_counter[0]
+
+        # every vert of one rung collides, no collision-free path is left
+        cart_proc_list = build_toy_scene(n_procs=4, seed=3)
+        cart_proc_list[1].sub_process_list[1].pointwise_collision_fns = {0 : lambda conf: True}
+        with pytest.warns(UserWarning, match='no collision-free path'):
+            result, stats = solve_ladder_graph_from_cartesian_process_list(cart_proc_list, warning_pause=False, lazy_collision=True,
+                return_stats=True)
+        assert result is None and stats.total_time > 0
+        assert all([sp.trajectory is None for cp in cart_proc_list for sp in cp.sub_process_list])
+    finally:
+        disconnect()
+
+def test_coarse_to_fine_solve():
+    assert get_coarse_point_ids(9, 4) == [0, 4, 8]
+    assert get_coarse_point_ids(7, 4) == [0, 4, 6]
+    assert get_coarse_point_ids(1, 4) == [0]
+    connect(use_gui=False)
+    try:
+        get_trajs = lambda proc_list : [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in proc_list]
+        ref_proc_list = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(n_procs=3, seed=2, n_interp=6), warning_pause=False)
+        start_conf = ref_proc_list[0].sub_process_list[0].trajectory.traj_path[0]
+
+        # at the full resolution, without branch pruning, the refinement is the full solve restricted to the chosen pose families
+        info = {}
+        cart_proc_list = solve_ladder_graph_coarse_to_fine(build_toy_scene(n_procs=3, seed=2, n_interp=6), warning_pause=False,
+            coarse_stride=1, branch_radius=None, check_full=True, info=info)
+        assert get_trajs(cart_proc_list) == get_trajs(ref_proc_list)
+        assert info['cost'] == pytest.approx(info['full_cost']) and info['cost_gap'] == pytest.approx(0.0)
+        assert len(info['pose_families']) == 3 and info['fallback_processes'] == []
+
+        info = {}
+        cart_proc_list = solve_ladder_graph_coarse_to_fine(build_toy_scene(n_procs=3, seed=2, n_interp=6), warning_pause=False,
+            start_conf=start_conf, coarse_stride=4, branch_radius=0.5, check_full=True, info=info)
+        assert info['cost_gap'] >= -1e-9
+        assert info['cost'] == pytest.approx(info['full_cost'] + info['cost_gap'])
+        for cp, ref_cp in zip(cart_proc_list, ref_proc_list):
+            for sp, ref_sp in zip(cp.sub_process_list, ref_cp.sub_process_list):
+                assert len(sp.trajectory.traj_path) == len(ref_sp.trajectory.traj_path) == sp.path_point_size
+                assert not any([sp.collision_fn(conf) for conf in sp.trajectory.traj_path])
+    finally:
+        disconnect()
+
+def test_solver_stats():
+    connect(use_gui=False)
+    try:
+        cart_proc_list, stats = solve_ladder_graph_from_cartesian_process_list(build_toy_scene(), warning_pause=False, return_stats=True)
+        data = json.loads(json.dumps(stats.to_data()))
+        assert set(SolverStats.PHASES) <= set(data['phase_times'])
+        assert all([data['phase_times'][phase] > 0 for phase in SolverStats.PHASES])
+        assert set(data['process_phase_times']) == {'0', '1', '2'}
+        assert data['counts']['ik_calls'] > 0 and data['counts']['collision_calls'] > 0
+        assert data['counts']['rungs'] == sum([sp.path_point_size for cp in cart_proc_list for sp in cp.sub_process_list])
+        assert data['counts']['edges'] > 0 and data['peak_graph_nbytes'] > 0
+        assert SolverStats.from_data(data).to_data() == data
+        # the processes' fns are restored
+        assert cart_proc_list[0].sample_ik_fn.__name__ == 'sample_ik_fn'
+
+        sparse_graph = SparseLadderGraph(build_toy_scene())
+        sparse_cost = sparse_graph.find_sparse_path(vert_timeout=1.0, sparse_sample_timeout=0.1, exact_rewire=True, exact_rewire_period=5)
+        assert sparse_graph.rewire_exact() == pytest.approx(sparse_cost)
+        cart_proc_list, stats = sparse_graph.extract_solution(return_stats=True)
+        data = json.loads(json.dumps(stats.to_data()))
+        assert data['counts']['ik_calls'] == data['counts']['rungs'] == \
+            sum([sp.path_point_size for cp in cart_proc_list for sp in cp.sub_process_list])
+        assert data['phase_times']['dag_search'] > 0 and data['phase_times']['pose_gen'] == 0.0
+    finally:
+        disconnect()
+
+def test_sparse_path_ik_sols_reuse():
+    connect(use_gui=False)
+    try:
+        sparse_graph = SparseLadderGraph(build_toy_scene(), keep_ik_sols=True)
+        sparse_graph.find_sparse_path(vert_timeout=1.0, sparse_sample_timeout=0.1)
+        cap_verts = [v for cap_rung in sparse_graph.cap_rungs for v in cap_rung.cap_verts]
+        assert all([v.has_ik_sols() for v in cap_verts])
+        assert sparse_graph.ik_sols_nbytes == sum([v.ik_sols_nbytes for v in cap_verts]) > 0
+        cart_proc_list, stats = sparse_graph.extract_solution(return_stats=True)
+        assert stats.counts['ik_calls'] == stats.counts['collision_calls'] == 0
+        assert stats.counts['ik_sols_reused'] == len(cart_proc_list)
+        trajs = [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list]
+
+        # same solution with the joint sols recomputed
+        for v in cap_verts:
+            v.clear_ik_sols()
+        cart_proc_list, stats = sparse_graph.extract_solution(return_stats=True)
+        assert stats.counts['ik_calls'] > 0 and stats.counts['ik_sols_reused'] == 0
+        assert [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list] == trajs
+
+        # the CapVerts sampled over the memory cap drop their joint sols
+        sparse_graph = SparseLadderGraph(build_toy_scene(), keep_ik_sols=True, ik_sols_max_nbytes=1000)
+        sparse_graph.find_sparse_path(vert_timeout=1.0, sparse_sample_timeout=0.1)
+        cap_verts = [v for cap_rung in sparse_graph.cap_rungs for v in cap_rung.cap_verts]
+        assert 0 < sparse_graph.ik_sols_nbytes <= 1000
+        assert any([v.has_ik_sols() for v in cap_verts]) and not all([v.has_ik_sols() for v in cap_verts])
+        cart_proc_list = sparse_graph.extract_solution()
+        assert all([sp.trajectory is not None for cp in cart_proc_list for sp in cp.sub_process_list])
+    finally:
+        disconnect()
+
+def test_ladder_graph_session():
+    connect(use_gui=False)
+    try:
+        get_trajs = lambda proc_list : [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in proc_list]
+        cart_proc_list = build_toy_scene(n_procs=4, seed=4)
+        session = LadderGraphSession()
+        _, stats = session.solve(cart_proc_list, warning_pause=False, return_stats=True)
+        assert get_trajs(cart_proc_list) == get_trajs(solve_ladder_graph_from_cartesian_process_list(
+            build_toy_scene(n_procs=4, seed=4), warning_pause=False))
+        assert stats.counts['graph_cache_misses'] == 4 and stats.counts['ik_calls'] > 0
+        start_conf = cart_proc_list[2].sub_process_list[1].trajectory.traj_path[-1]
+
+        # new start conf and partial, reordered sequences: no graph is rebuilt
+        for proc_order in [[0, 1, 2, 3], [3, 1], [2, 0, 3, 1]]:
+            sub_proc_list = [cart_proc_list[cp_id] for cp_id in proc_order]
+            _, stats = session.solve(sub_proc_list, start_conf=start_conf, warning_pause=False, return_stats=True)
+            assert stats.counts['graph_cache_hits'] == len(proc_order)
+            assert stats.counts['ik_calls'] == 0 and stats.counts['collision_calls'] == 0
+            ref_list = build_toy_scene(n_procs=4, seed=4)
+            ref_list = solve_ladder_graph_from_cartesian_process_list([ref_list[cp_id] for cp_id in proc_order], start_conf=start_conf,
+                warning_pause=False)
+            assert get_trajs(sub_proc_list) == get_trajs(ref_list)
+        assert len(session) == 4 and session.hits == 10 and session.misses == 4
+
+        # a changed process is rebuilt
+        for sp in cart_proc_list[1].sub_process_list:
+            sp.collision_fn = lambda conf, diagnosis=False : conf[0] > 0.8
+        _, stats = session.solve(cart_proc_list, warning_pause=False, return_stats=True)
+        assert stats.counts['graph_cache_hits'] == 3 and stats.counts['graph_cache_misses'] == 1
+        for sp in cart_proc_list[1].sub_process_list:
+            assert not any([conf[0] > 0.8 for conf in sp.trajectory.traj_path])
+    finally:
+        disconnect()
+
+def test_rung_compaction():
+    connect(use_gui=False)
+    try:
+        def build_yaw_invariant_scene():
+            cart_proc_list = build_toy_scene(n_procs=2, seed=5)
+            for cart_proc in cart_proc_list:
+                # the IK solutions do not depend on the yaw, all the pose families are the same
+                cart_proc.sample_ik_fn = lambda pose, sample_ik_fn=cart_proc.sample_ik_fn : sample_ik_fn((pose[0], (0, 0, 0, 1)))
+            return cart_proc_list
+
+        cart_proc = build_yaw_invariant_scene()[0]
+        vert_families = []
+        graph, cnt = generate_ladder_graph_from_cartesian_process(cart_proc, vert_families=vert_families)
+        # without compaction, the verts of each pose family follow each other
+        assert [families.tolist() for families in vert_families] == [sorted(list(range(6)) * (n // 6)) for n in graph.get_vert_sizes()]
+        vert_families = []
+        compact_graph, compact_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, compact_tolerance=1e-6, vert_families=vert_families)
+        assert cnt == compact_cnt == 6
+        assert [6 * n for n in compact_graph.get_vert_sizes()] == graph.get_vert_sizes()
+        assert all([np.array_equal(families, np.zeros(n, dtype=int)) for families, n in zip(vert_families, compact_graph.get_vert_sizes())])
+        assert DAGSearch(compact_graph).run() == pytest.approx(DAGSearch(graph).run())
+
+        cart_proc_list, stats = solve_ladder_graph_from_cartesian_process_list(build_yaw_invariant_scene(), warning_pause=False,
+            compact_tolerance=1e-6, return_stats=True)
+        ref_proc_list, ref_stats = solve_ladder_graph_from_cartesian_process_list(build_yaw_invariant_scene(), warning_pause=False,
+            return_stats=True)
+        assert [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list] == \
+            [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in ref_proc_list]
+        assert 6 * stats.counts['vertices'] == ref_stats.counts['vertices']
+    finally:
+        disconnect()
+
+def test_lazy_edges_joint_vel_limits():
+    connect(use_gui=False)
+    try:
+        def build_fast_family_scene():
+            cart_proc_list = build_toy_scene(n_procs=2, seed=1)
+            for cart_proc in cart_proc_list:
+                # the joints of two of the four reachable pose families move ten times faster
+                cart_proc.sample_ik_fn = lambda pose, sample_ik_fn=cart_proc.sample_ik_fn : \
+                    [list(10 * np.array(conf)) if pose[1][2] > 0.5 else conf for conf in sample_ik_fn(pose)]
+            return cart_proc_list
+
+        cart_proc = build_fast_family_scene()[0]
+        vel_kwargs = {'upper_tm' : 1.0, 'joint_vel_limits' : [1.0] * 7}
+        _, cnt = generate_ladder_graph_from_cartesian_process(cart_proc)
+        graph, vel_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, **vel_kwargs)
+        lazy_graph, lazy_vel_cnt = generate_ladder_graph_from_cartesian_process(cart_proc, lazy_edges=True, **vel_kwargs)
+        # the fast pose families are rejected in both modes
+        assert cnt == 4 and vel_cnt == lazy_vel_cnt == 2
+        assert lazy_graph.get_vert_sizes() == graph.get_vert_sizes()
+        assert DAGSearch(lazy_graph).run() == pytest.approx(DAGSearch(graph).run())
+
+        cart_proc_list, stats = solve_ladder_graph_from_cartesian_process_list(build_fast_family_scene(), warning_pause=False,
+            return_stats=True, **vel_kwargs)
+        lazy_proc_list, lazy_stats = solve_ladder_graph_from_cartesian_process_list(build_fast_family_scene(), warning_pause=False,
+            return_stats=True, lazy_edges=True, **vel_kwargs)
+        assert [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in lazy_proc_list] == \
+            [[sp.trajectory.traj_path for sp in cp.sub_process_list] for cp in cart_proc_list]
+        assert lazy_stats.counts['vertices'] == stats.counts['vertices']
+    finally:
+        disconnect()
@@ -0,0 +1,131 @@
+import pytest
+import itertools
+import numpy as np
+
+from pybullet_planning import INF
+from pychoreo.cartesian_planner import sparse_ladder_graph
+from pychoreo.cartesian_planner.sparse_ladder_graph import CapVert, SparseLadderGraph, compute_cap_vert_distances
+
+def build_random_cap_verts(n_verts, dof=6, seed=0, joint_weights=None):
+    rng = np.random.RandomState(seed)
+    cap_verts = []
+    for _ in range(n_verts):
+        cap_vert = CapVert(dof, joint_weights=joint_weights)
+        cap_vert.st_jt_data = rng.uniform(-np.pi, np.pi, (rng.randint(1, 5), dof)).tolist()
+        # flat joint lists are accepted too
+        cap_vert.end_jt_data = rng.uniform(-np.pi, np.pi, rng.randint(1, 5) * dof).tolist()
+        cap_vert.preference_cost = rng.uniform(1, 2)
+        cap_verts.append(cap_vert)
+    return cap_verts
+
+def loop_distance(first, second, joint_weights=None):
+    weights = joint_weights or [1.0] * first.dof
+    return min([sum([w * abs(a - b) for w, a, b in zip(weights, end_jts, st_jts)]) \
+        for end_jts in first.end_jt_data for st_jts in second.st_jt_data]) * second.preference_cost
+
+@pytest.mark.parametrize('joint_weights', [None, [2.0, 1.0, 1.0, 0.5, 0.5, 0.1]])
+def test_cap_vert_distances(joint_weights):
+    parent_verts = build_random_cap_verts(5, seed=1, joint_weights=joint_weights)
+    child_verts = build_random_cap_verts(4, seed=2, joint_weights=joint_weights)
+    assert parent_verts[0].st_jt_data.shape[1] == parent_verts[0].end_jt_data.shape[1] == 6
+
+    dists = compute_cap_vert_distances(parent_verts, child_verts, joint_weights=joint_weights)
+    assert dists.shape == (5, 4)
+    for i, parent in enumerate(parent_verts):
+        for j, child in enumerate(child_verts):
+            ref_dist = loop_distance(parent, child, joint_weights=joint_weights)
+            assert child.distance_to(parent) == pytest.approx(ref_dist)
+            assert dists[i, j] == pytest.approx(ref_dist)
+            child.parent_vert = parent
+            assert child.parent_cost == pytest.approx(ref_dist)
+
+    # CapVerts without joint solution are not connected
+    empty_vert = CapVert(6)
+    dists = compute_cap_vert_distances(parent_verts + [empty_vert], [empty_vert] + child_verts)
+    assert np.all(dists[-1] == INF) and np.all(dists[:, 0] == INF)
+    assert np.all(np.isfinite(dists[:-1, 1:]))
+    assert empty_vert.distance_to(parent_verts[0]) == INF
+    assert compute_cap_vert_distances([], child_verts).shape == (0, 4)
+
+def walk_cost_to_root(cap_vert):
+    cost = 0.0
+    while cap_vert:
+        cost += cap_vert.parent_cost
+        cap_vert = cap_vert.parent_vert
+    return cost
+
+def test_cap_vert_cost_to_root():
+    rng = np.random.RandomState(3)
+    rungs = [build_random_cap_verts(4, seed=10 + r_id) for r_id in range(6)]
+    for cap_vert in rungs[0]:
+        cap_vert.parent_vert = None
+    for r_id in range(1, len(rungs)):
+        for cap_vert in rungs[r_id]:
+            cap_vert.parent_vert = rungs[r_id-1][rng.randint(4)]
+    all_verts = [v for rung in rungs for v in rung]
+    for v in all_verts:
+        assert v.get_cost_to_root() == pytest.approx(walk_cost_to_root(v))
+
+    # re-parenting pushes the cost change down to the descendants
+    for _ in range(50):
+        r_id = rng.randint(1, len(rungs))
+        cap_vert = rungs[r_id][rng.randint(4)]
+        cap_vert.parent_vert = rungs[r_id-1][rng.randint(4)]
+        for v in all_verts:
+            assert v.get_cost_to_root() == pytest.approx(walk_cost_to_root(v))
+    for v in all_verts:
+        assert all([child.parent_vert is v for child in v.child_verts])
+    assert sum([len(v.child_verts) for v in all_verts]) == len(all_verts) - len(rungs[0])
+
+def test_rewire_exact():
+    n_rungs = 5
+    sparse_graph = SparseLadderGraph([None] * n_rungs)
+    rng = np.random.RandomState(5)
+    for r_id, cap_rung in enumerate(sparse_graph.cap_rungs):
+        if r_id == 2:
+            # a rung without any sample is skipped
+            continue
+        prev_verts = [v for prev_rung in sparse_graph.cap_rungs[:r_id] for v in prev_rung.cap_verts][-3:]
+        for cap_vert in build_random_cap_verts(3, seed=20 + r_id):
+            cap_vert.host_rung_id = r_id
+            cap_vert.parent_vert = prev_verts[rng.randint(len(prev_verts))] if prev_verts else None
+            cap_rung.cap_verts.append(cap_vert)
+    rrt_cost = min([v.get_cost_to_root() for v in sparse_graph.cap_rungs[-1].cap_verts])
+
+    layers = [cap_rung.cap_verts for cap_rung in sparse_graph.cap_rungs if cap_rung.cap_verts]
+    brute_force_cost = min([sum([path[i+1].distance_to(path[i]) for i in range(len(path)-1)]) \
+        for path in itertools.product(*layers)])
+    exact_cost = sparse_graph.rewire_exact()
+    assert exact_cost == pytest.approx(brute_force_cost) and exact_cost <= rrt_cost + 1e-9
+    all_verts = [v for layer in layers for v in layer]
+    for v in all_verts:
+        assert v.get_cost_to_root() == pytest.approx(walk_cost_to_root(v))
+        assert all([child.parent_vert is v for child in v.child_verts])
+    assert sum([len(v.child_verts) for v in all_verts]) == len(all_verts) - len(layers[0])
+    assert sparse_graph.rewire_exact() == pytest.approx(exact_cost)
+
+def test_cap_vert_ik_sols():
+    rng = np.random.RandomState(7)
+    ik_sols = [rng.uniform(-np.pi, np.pi, (rng.randint(1, 5), 6)).tolist() for _ in range(8)]
+    cap_vert = CapVert(6)
+    assert cap_vert.ik_sols is None and not cap_vert.has_ik_sols() and cap_vert.ik_sols_nbytes == 0
+    cap_vert.set_ik_sols(ik_sols)
+    assert cap_vert.has_ik_sols()
+    assert len(cap_vert.ik_sols) == len(ik_sols)
+    for jt_array, jt_list in zip(cap_vert.ik_sols, ik_sols):
+        assert np.array_equal(jt_array, jt_list)
+    assert cap_vert.ik_sols_nbytes >= sum([len(jt_list) for jt_list in ik_sols]) * 6 * 8
+
+    # joint sols without collision checking are not reused for a collision-checked extraction
+    cap_vert.set_ik_sols(ik_sols, collision_checked=False)
+    assert cap_vert.has_ik_sols(check_collision=False) and not cap_vert.has_ik_sols(check_collision=True)
+    cap_vert.clear_ik_sols()
+    assert cap_vert.ik_sols is None and cap_vert.ik_sols_nbytes == 0
+
+def test_cap_vert_distances_chunked(monkeypatch):
+    parent_verts = build_random_cap_verts(6, seed=4)
+    child_verts = build_random_cap_verts(5, seed=5)
+    ref_dists = compute_cap_vert_distances(parent_verts, child_verts)
+    # a few parent joint sols at a time, the chunks split the verts' joint sols
+    monkeypatch.setattr(sparse_ladder_graph, 'EDGE_COST_CHUNK_SIZE', 7 * 6)
+    assert np.array_equal(compute_cap_vert_distances(parent_verts, child_verts), ref_dists)